@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.conf.metrics import registry
+
+router = APIRouter()
+
+
+@router.get("/metrics",
+            response_class=PlainTextResponse,
+            description='Process metrics in Prometheus text format',
+            tags=['Monitoring'],
+            )
+async def get_metrics():
+    """Endpoint to scrape request, stage, cache and upstream metrics of this worker process.
+    :return: metrics in Prometheus text exposition format
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,6 +1,8 @@
 from typing import List
 from pydantic import BaseModel, Field, ConfigDict
 
+from app.conf.settings import settings
+
 
 class TrackingRequest(BaseModel):
     """Model representing tracking request"""
@@ -35,7 +37,17 @@ class TrackingItem(BaseModel):
     sender_address: str
     receiver_address: str
     status: str
-    articles: List[ArticleItem]
+    articles: List[ArticleItem] | None = Field(None, description="Shipment articles, omitted when not requested")
+    # hash of the stored item written by the loader, versions ETag of tracking response, never serialized
+    content_hash: str | None = Field(None, exclude=True)
+
+
+class StatusEvent(BaseModel):
+    """Model representing shipment status change sent to subscribers."""
+
+    tracking_number: str
+    carrier: str
+    status: str
 
 
 class WeatherItem(BaseModel):
@@ -53,3 +65,31 @@ class TrackingResponse(BaseModel):
 
     tracking: TrackingItem = Field(..., description="Tracking information")
     weather: WeatherItem = Field(..., description="Weather information in customers location")
+
+
+class BatchTrackingRequest(BaseModel):
+    """Model representing batch tracking request"""
+
+    items: List[TrackingRequest] = Field(..., min_length=1, max_length=int(settings.TRACKING_BATCH_MAX_SIZE))
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "items": [
+                    {"tracking_number": "TN12345678", "carrier": "DHL"},
+                    {"tracking_number": "TN12345679", "carrier": "UPS"}
+                ]
+            }
+        }
+    )
+
+
+class BatchTrackingResult(BaseModel):
+    """Model representing single shipment result of batch tracking request."""
+
+    tracking_number: str
+    carrier: str
+    status_code: int = Field(..., description="HTTP status code of this shipment lookup")
+    tracking: TrackingItem | None = Field(None, description="Tracking information")
+    weather: WeatherItem | None = Field(None, description="Weather information in customers location")
+    detail: str | None = Field(None, description="Error details")
@@ -0,0 +1,23 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class ModelResponse(JSONResponse):
+    """JSON response rendered straight from pydantic model.
+
+    Endpoints build response models from already validated data, returning them in this class skips
+    response_model validation and dict conversion of FastAPI: the model is serialized to bytes once by
+    pydantic-core. Fields set to None are omitted.
+    """
+
+    def __init__(self, content: Any, *args, **kwargs):
+        # kept for request logging
+        self.model = content
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json(exclude_none=True).encode()
+        return super().render(content)
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Request, Query, Depends
+from fastapi.responses import StreamingResponse
+
+from app.api.models import StatusEvent
+from app.api.tracking import get_database
+from app.db.dynamodb import DatabaseException
+from app.integrations.notifications import status_broadcaster
+from app.conf.concurrency import run_blocking
+from app.conf.logging import log_request
+from app.conf.metrics import status_events_total
+from app.conf.settings import settings
+
+router = APIRouter()
+
+
+def get_broadcaster():
+    """Return status change broadcaster of this worker."""
+    return status_broadcaster
+
+
+def parse_shipments(shipments: list[str]) -> list[tuple[str, str]]:
+    """Parse "carrier/tracking_number" values into list of (tracking number, carrier) without duplicates"""
+    keys = {}
+    for shipment in shipments:
+        carrier, _, tracking_number = shipment.partition("/")
+        if not carrier or not tracking_number:
+            raise HTTPException(status_code=422,
+                                detail=f"Invalid shipment {shipment!r}, expected carrier/tracking_number")
+        keys[(tracking_number, carrier)] = None
+    if len(keys) > int(settings.TRACKING_BATCH_MAX_SIZE):
+        raise HTTPException(status_code=422,
+                            detail=f"At most {settings.TRACKING_BATCH_MAX_SIZE} shipments in one subscription")
+    return list(keys)
+
+
+async def current_statuses(database, keys: list[tuple[str, str]]) -> list[StatusEvent]:
+    """Read current status of shipments, missing ones are omitted"""
+    items = await run_blocking(database.get_tracking_items, keys)
+    return [StatusEvent(tracking_number=item.tracking_number, carrier=item.carrier, status=item.status)
+            for item in items.values()]
+
+
+def sse_event(event: StatusEvent) -> str:
+    return f"event: status\ndata: {event.model_dump_json()}\n\n"
+
+
+@router.get("/track/subscribe",
+            response_class=StreamingResponse,
+            description='Subscribe to status changes of shipments. Current statuses are sent first, then only '
+                        'changes, as server-sent events',
+            response_description='Stream of "status" events with StatusEvent data.',
+            tags=['Public API'],
+            )
+@log_request()
+async def subscribe_tracking_status(
+        request: Request,
+        shipment: Annotated[
+            list[str],
+            Query(description="Subscribed shipment as carrier/tracking_number, repeat for many shipments",
+                  min_length=1)
+        ],
+        database=Depends(get_database),
+        broadcaster=Depends(get_broadcaster),
+):
+    """Endpoint to receive status changes of shipments instead of polling the tracking endpoint.
+    Changes are pushed from the status channel of this worker, keep-alive comments are sent while nothing changes
+    and the stream is closed after SUBSCRIPTION_MAX_DURATION, clients reconnect with the same shipments.
+    :param request: original request object, used by logging
+    :param shipment: list of carrier/tracking_number
+    :param database: dependency injection of database
+    :param broadcaster: dependency injection of status change broadcaster
+    :return: text/event-stream of status events
+    """
+
+    keys = parse_shipments(shipment)
+    # subscribed before reading current statuses, so changes written in between are not missed
+    subscription = broadcaster.subscribe(keys)
+    try:
+        events = await current_statuses(database, keys)
+    except DatabaseException as e:
+        broadcaster.unsubscribe(subscription)
+        raise HTTPException(status_code=500, detail=f"Database exception: {e}")
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + float(settings.SUBSCRIPTION_MAX_DURATION)
+        sent = {}
+        try:
+            yield f"retry: {int(float(settings.SUBSCRIPTION_RECONNECT_DELAY) * 1000)}\n\n"
+            changes = events
+            while True:
+                for event in changes:
+                    key = (event.tracking_number, event.carrier)
+                    # new shipments are published with their current status, only status changes are sent
+                    if sent.get(key) != event.status:
+                        sent[key] = event.status
+                        status_events_total.inc(outcome="sent")
+                        yield sse_event(event)
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                changes, resync = await subscription.wait(min(float(settings.SUBSCRIPTION_KEEPALIVE), remaining))
+                if resync:
+                    try:
+                        changes += await current_statuses(database, keys)
+                    except DatabaseException:
+                        pass
+                elif not changes:
+                    yield ": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
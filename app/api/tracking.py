@@ -1,30 +1,110 @@
+import asyncio
+import contextlib
+import hashlib
+import logging
 from typing import Annotated
 
-from fastapi import APIRouter, HTTPException, Request, Path, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Request, Path, Query, Header, Depends
+from fastapi.responses import Response, StreamingResponse
 
-from app.api.models import TrackingRequest, TrackingResponse
+from app.api.models import (
+    BatchTrackingRequest,
+    BatchTrackingResult,
+    TrackingItem,
+    TrackingRequest,
+    TrackingResponse,
+    WeatherItem,
+)
+from app.api.responses import ModelResponse
 from app.db.dynamodb import DatabaseException
 from app.db.factory import DatabaseFactory
-from app.integrations.weather import WeatherServiceFactory, WeatherException
+from app.integrations.cache import encode_weather
+from app.integrations.locations import LocationIndex, location_index
+from app.integrations.weather import WeatherProvider, WeatherServiceFactory, WeatherException
+from app.conf.concurrency import run_blocking
 from app.conf.logging import log_request
+from app.conf.metrics import stage_seconds
+from app.conf.settings import settings
 
 router = APIRouter()
 
 
 def get_database():
     """Return the default database provider."""
-    return DatabaseFactory.get_provider("dynamodb")
+    return DatabaseFactory.get_provider(settings.DATABASE_PROVIDER, cached=settings.TRACKING_CACHE)
 
 
 def get_weather():
     """Return the default weather provider."""
-    return WeatherServiceFactory.get_provider("weatherbit")
+    return WeatherServiceFactory.get_provider(settings.WEATHER_PROVIDER)
+
+
+def get_locations():
+    """Return receiver locations index, None if weather prefetch is disabled."""
+    return location_index if settings.WEATHER_PREFETCH else None
+
+
+async def prefetch_weather(
+        locations: LocationIndex,
+        weather: WeatherProvider,
+        tracking_number: str,
+        carrier: str,
+) -> tuple[tuple[str, str], WeatherItem | None] | None:
+    """Fetch weather for indexed receiver location.
+
+    :return: (location, weather), weather is None if the lookup failed, None if the shipment is not indexed
+    """
+    location = await run_blocking(locations.get_location, tracking_number, carrier)
+    if location is None:
+        return None
+    try:
+        return location, await run_blocking(weather.get_weather_by_location, *location)
+    except WeatherException:
+        # indexed location may be outdated, the request looks weather up again by receiver address
+        return location, None
+
+
+async def cancel_task(task: asyncio.Task | None) -> None:
+    """Cancel background task and wait for it, ignoring its outcome."""
+    if task is None or task.done():
+        return
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError, Exception):
+        await task
+
+
+def tracking_etag(tracking: TrackingItem, weather: WeatherItem, include_articles: bool) -> str:
+    """ETag of tracking response from stored item version and encoded weather, the body is not built.
+
+    Items without content hash (written before the loader stored hashes) are versioned by their JSON.
+    """
+    version = tracking.content_hash or tracking.model_dump_json()
+    digest = hashlib.blake2b(version.encode(), digest_size=12)
+    digest.update(encode_weather(weather))
+    digest.update(b"articles" if include_articles else b"summary")
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of If-None-Match header with ETag, as required for GET requests"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={int(settings.TRACKING_MAX_AGE)}, "
+                         f"stale-while-revalidate={int(settings.TRACKING_STALE_WHILE_REVALIDATE)}",
+    }
 
 
 @router.get("/track/{carrier}/{tracking_number}",
-            response_class=JSONResponse,
+            response_class=ModelResponse,
             response_model=TrackingResponse,
+            response_model_exclude_none=True,
             description='Retrieve shipment information by tracking number and carrier',
             response_description='Return the list of tracking records.',
             tags=['Public API'],
@@ -60,31 +140,198 @@ async def get_tracking_info(
                 }
             )
         ],
+        include_articles: Annotated[
+            bool,
+            Query(description="Return shipment articles, disable to poll status only")
+        ] = True,
+        if_none_match: Annotated[
+            str | None,
+            Header(description="ETag of previously received response, 304 is returned when it is still current")
+        ] = None,
         database=Depends(get_database),
         weather=Depends(get_weather),
+        locations=Depends(get_locations),
 ):
     """Endpoint to retrieve the shipment and articles information by tracking number and carrier,
     including weather conditions in customer's location.
+    Responses carry ETag and Cache-Control, revalidation with matching If-None-Match returns 304 without body.
     :param request: original request object, used by logging
     :param carrier: carrier name
     :param tracking_number: tracking number
+    :param include_articles: read and return shipment articles
+    :param if_none_match: If-None-Match header
     :param database: dependency injection of database
     :param weather: dependency injection of weather
+    :param locations: dependency injection of receiver locations index, enables weather prefetch
     :return: TrackingResponse structure
     """
 
     request = TrackingRequest(carrier=carrier, tracking_number=tracking_number)
+
+    # Weather lookup runs alongside database query when receiver location is already known
+    prefetch = None
+    if locations is not None:
+        prefetch = asyncio.create_task(
+            prefetch_weather(locations, weather, request.tracking_number, request.carrier)
+        )
+
     try:
-        tracking_data = database.get_tracking_item(request.tracking_number, request.carrier)
-    except DatabaseException as e:
-        raise HTTPException(status_code=500, detail=f"Database exception: {e}")
+        try:
+            with stage_seconds.time(stage="database"):
+                tracking_data = await run_blocking(database.get_tracking_item, request.tracking_number,
+                                                   request.carrier, include_articles=include_articles)
+        except DatabaseException as e:
+            raise HTTPException(status_code=500, detail=f"Database exception: {e}")
+
+        if not tracking_data:
+            raise HTTPException(status_code=404, detail="Shipment not found")
+
+        try:
+            with stage_seconds.time(stage="weather"):
+                weather_data = None
+                prefetched = await prefetch if prefetch is not None else None
+                # index entries outlive address changes of reloaded shipments, weather of another place is dropped
+                if prefetched is not None and prefetched[0] == weather.parse_address(tracking_data.receiver_address):
+                    weather_data = prefetched[1]
+                if weather_data is None:
+                    weather_data = await run_blocking(weather.get_weather, tracking_data.receiver_address)
+        except WeatherException as e:
+            raise HTTPException(status_code=500, detail=f"Weather exception: {e}")
+    finally:
+        await cancel_task(prefetch)
+
+    headers = cache_headers(tracking_etag(tracking_data, weather_data, include_articles))
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    # both parts are validated by providers, response is serialized without validating them again
+    with stage_seconds.time(stage="serialize"):
+        return ModelResponse(TrackingResponse.model_construct(tracking=tracking_data, weather=weather_data),
+                             headers=headers)
+
 
-    if not tracking_data:
-        raise HTTPException(status_code=404, detail="Shipment not found")
+def group_by_location(
+        weather: WeatherProvider,
+        tracking_items: list[TrackingItem],
+) -> tuple[dict[tuple[str, str], list[TrackingItem]], list[tuple[TrackingItem, str]]]:
+    """Group tracking items by receiver location, so weather is looked up once per location.
 
+    :return: items by (zip code, country code) and list of (item, error) for unparsable addresses
+    """
+    groups = {}
+    failed = []
+    for item in tracking_items:
+        try:
+            location = weather.parse_address(item.receiver_address)
+        except WeatherException as e:
+            failed.append((item, str(e)))
+            continue
+        groups.setdefault(location, []).append(item)
+    return groups, failed
+
+
+async def fetch_location_weather(
+        weather: WeatherProvider,
+        location: tuple[str, str],
+) -> tuple[tuple[str, str], WeatherItem | None, str | None]:
+    """Fetch weather for a single location, errors are returned instead of raised."""
     try:
-        weather_data = weather.get_weather(tracking_data.receiver_address)
+        return location, await run_blocking(weather.get_weather_by_location, *location), None
     except WeatherException as e:
-        raise HTTPException(status_code=500, detail=f"Weather exception: {e}")
+        return location, None, str(e)
+
+
+def batch_line(result: BatchTrackingResult) -> str:
+    return result.model_dump_json() + "\n"
+
+
+@router.post("/track/batch",
+             response_class=StreamingResponse,
+             description='Retrieve information of many shipments in one request. '
+                         'Results are streamed as newline-delimited JSON in order of completion',
+             response_description='Stream of BatchTrackingResult records, one per line.',
+             tags=['Public API'],
+             )
+@log_request()
+async def get_tracking_info_batch(
+        request: Request,
+        batch: BatchTrackingRequest,
+        database=Depends(get_database),
+        weather=Depends(get_weather),
+):
+    """Endpoint to retrieve many shipments with weather conditions in customers' locations.
+    Weather is looked up once per receiver location and cached locations are read in one round trip.
+    :param request: original request object, used by logging
+    :param batch: list of requested shipments
+    :param database: dependency injection of database
+    :param weather: dependency injection of weather
+    :return: stream of BatchTrackingResult, one JSON document per line
+    """
+
+    keys = list(dict.fromkeys((item.tracking_number, item.carrier) for item in batch.items))
+    try:
+        tracking_items = await run_blocking(database.get_tracking_items, keys)
+    except DatabaseException as e:
+        raise HTTPException(status_code=500, detail=f"Database exception: {e}")
+
+    groups, failed = await run_blocking(group_by_location, weather, list(tracking_items.values()))
+
+    async def results():
+        for tracking_number, carrier in keys:
+            if (tracking_number, carrier) not in tracking_items:
+                yield BatchTrackingResult(
+                    tracking_number=tracking_number, carrier=carrier, status_code=404, detail="Shipment not found"
+                )
+        for item, error in failed:
+            yield BatchTrackingResult(
+                tracking_number=item.tracking_number, carrier=item.carrier, status_code=500,
+                tracking=item, detail=f"Weather exception: {error}"
+            )
+
+        try:
+            cached = await run_blocking(weather.get_cached_weather, list(groups))
+        except WeatherException:
+            cached = {}
+        for location, weather_data in cached.items():
+            for item in groups.pop(location, []):
+                yield BatchTrackingResult(
+                    tracking_number=item.tracking_number, carrier=item.carrier, status_code=200,
+                    tracking=item, weather=weather_data
+                )
+
+        tasks = [asyncio.create_task(fetch_location_weather(weather, location)) for location in groups]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                location, weather_data, error = await next_done
+                for item in groups[location]:
+                    if weather_data is None:
+                        yield BatchTrackingResult(
+                            tracking_number=item.tracking_number, carrier=item.carrier, status_code=500,
+                            tracking=item, detail=f"Weather exception: {error}"
+                        )
+                    else:
+                        yield BatchTrackingResult(
+                            tracking_number=item.tracking_number, carrier=item.carrier, status_code=200,
+                            tracking=item, weather=weather_data
+                        )
+        finally:
+            # client disconnected before all results were sent
+            for task in tasks:
+                await cancel_task(task)
+
+    async def stream():
+        pending = dict.fromkeys(keys)
+        try:
+            async with contextlib.aclosing(results()) as shipment_results:
+                async for result in shipment_results:
+                    pending.pop((result.tracking_number, result.carrier), None)
+                    yield batch_line(result)
+        except Exception as e:
+            # headers are already sent, shipments without result are reported as failed
+            logging.getLogger("trackapi").exception(f"Batch tracking failed: {e}")
+            for tracking_number, carrier in pending:
+                yield batch_line(BatchTrackingResult(
+                    tracking_number=tracking_number, carrier=carrier, status_code=500, detail="Internal error"
+                ))
 
-    return TrackingResponse(tracking=tracking_data, weather=weather_data)
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,26 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.conf.settings import settings
+
+
+# Bounded pool shared by all requests of the worker. Blocking SDK calls (boto3, redis, requests) are sent here,
+# so the event loop keeps serving other requests while they wait for the network.
+io_executor = ThreadPoolExecutor(
+    max_workers=int(settings.IO_THREADPOOL_SIZE),
+    thread_name_prefix="trackapi-io",
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run blocking function in the I/O thread pool and await its result
+
+    :param func: blocking callable
+    :return: func result
+    """
+    loop = asyncio.get_running_loop()
+    # keep context variables (e.g. tracing data) visible inside the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(io_executor, functools.partial(context.run, func, *args, **kwargs))
@@ -1,93 +1,151 @@
+import atexit
 import functools
 import logging
+import queue
+import random
+import threading
 import uuid
+from logging.handlers import QueueHandler, QueueListener
 
-import boto3
-from watchtower import CloudWatchLogHandler
+import orjson
 from fastapi import Request, HTTPException
-from fastapi.responses import JSONResponse
-import json
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
 
+from app.api.responses import ModelResponse
 from app.conf.settings import settings
 
+LOGGED_HEADERS = [name.strip().lower() for name in settings.LOG_HEADERS.split(",") if name.strip()]
+
 
 def is_lambda():
     return settings.AWS_LAMBDA_FUNCTION_NAME is not None and len(settings.AWS_LAMBDA_FUNCTION_NAME) > 0
 
 
-def get_logger():
-    # Setup logging for dev and lambda modes
-    logger = logging.getLogger("trackapi")
-    logger.setLevel(logging.INFO)
+_listener: QueueListener | None = None
+_setup_lock = threading.Lock()
 
-    # Use CloudWatch for structured logs
+
+def create_handler() -> logging.Handler:
+    """Create handler writing log records to their destination, CloudWatch in lambda and console otherwise"""
     if is_lambda():
-        cloudwatch_handler = CloudWatchLogHandler(
+        # imported only in lambda, console logging does not need boto3 and watchtower
+        import boto3
+        from watchtower import CloudWatchLogHandler
+
+        # Use CloudWatch for structured logs
+        handler = CloudWatchLogHandler(
             log_group_name=settings.AWS_CW_LOGGING_GROUP,
             log_stream_name=settings.AWS_LAMBDA_FUNCTION_NAME,
             boto3_client=boto3.client("logs"),
         )
-        # Remove all default handlers (including LambdaLoggerHandler)
-        for handler in logger.handlers[:]:
-            logger.removeHandler(handler)
-        # Attach CloudWatch handler
-        cloudwatch_handler.setLevel(logging.DEBUG)
-        logger.addHandler(cloudwatch_handler)
     else:
         # use console logging for non-lambda environments
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.DEBUG)
+        handler = logging.StreamHandler()
         formatter = logging.Formatter('[%(asctime)s] [%(process)d] [%(levelname)s] [%(module)s] %(message)s')
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        handler.setFormatter(formatter)
+    handler.setLevel(logging.DEBUG)
+    return handler
+
+
+def setup_logging() -> None:
+    """Configure "trackapi" logger once per process.
+
+    Request path only puts records into in-memory queue, background listener thread
+    writes them to console or CloudWatch.
+    """
+    global _listener
+
+    logger = logging.getLogger("trackapi")
+    logger.setLevel(settings.LOG_LEVEL.upper())
+
+    # Remove all default handlers (including LambdaLoggerHandler)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
 
-    return logger
+    _listener = QueueListener(log_queue, create_handler(), respect_handler_level=True)
+    _listener.start()
+    # flush queued records on interpreter shutdown
+    atexit.register(_listener.stop)
+
+
+def get_logger():
+    # Setup logging for dev and lambda modes, only on the first call
+    if _listener is None:
+        with _setup_lock:
+            if _listener is None:
+                setup_logging()
+    return logging.getLogger("trackapi")
+
+
+def log_json(logger: logging.Logger, level: int, payload) -> None:
+    """Log pre-serialized JSON record, payload may be a callable building the dict only if level is enabled"""
+    if not logger.isEnabledFor(level):
+        return
+    if callable(payload):
+        payload = payload()
+    logger.log(level, orjson.dumps(payload, default=str).decode())
+
+
+def loggable_response(response):
+    if isinstance(response, ModelResponse):
+        response = response.model
+    if isinstance(response, BaseModel):
+        return response.model_dump(mode="json")
+    if isinstance(response, Response):
+        return {"response_class": type(response).__name__, "status_code": response.status_code}
+    return response
 
 
 def log_request():
-    """Decorator to log request and response details"""
+    """Decorator to log request and response details.
+    Details are serialized only when DEBUG is enabled, for sampled share of requests (LOG_SAMPLE_RATE)."""
     def decorator(func):
         @functools.wraps(func)
         async def wrapper(request: Request, *args, **kwargs):
             # tracing id to link request with response
             trace_id = str(uuid.uuid4())
             logger = get_logger()
+            sampled = logger.isEnabledFor(logging.DEBUG) and random.random() < float(settings.LOG_SAMPLE_RATE)
 
             try:
-                # Capture Request details
-                method = request.method
-                url = str(request.url)
-                headers = dict(request.headers)
-                query_params = dict(request.query_params)
-
-                # Log request body as request arguments if applicable
-                if method in ["POST", "PUT", "PATCH"]:
-                    body = await request.body()
-                    try:
-                        arguments = json.loads(body.decode("utf-8"))
-                    except json.JSONDecodeError:
-                        arguments = body.decode("utf-8")  # Fallback for raw text bodies
-                else:
-                    arguments = kwargs
-
-                logger.debug({
-                    "trace_id": trace_id,
-                    "action": "request",
-                    "arguments": arguments,
-                    "method": method,
-                    "url": url,
-                    "headers": headers,
-                    "query": query_params,
-                })
+                if sampled:
+                    # Capture Request details
+                    method = request.method
+
+                    # Log request body as request arguments if applicable
+                    if method in ["POST", "PUT", "PATCH"]:
+                        body = await request.body()
+                        try:
+                            arguments = orjson.loads(body)
+                        except orjson.JSONDecodeError:
+                            arguments = body.decode("utf-8", errors="replace")  # Fallback for raw text bodies
+                    else:
+                        # path parameters only, injected dependencies (database, weather providers) are skipped
+                        arguments = dict(request.path_params)
+
+                    log_json(logger, logging.DEBUG, {
+                        "trace_id": trace_id,
+                        "action": "request",
+                        "arguments": arguments,
+                        "method": method,
+                        "url": str(request.url),
+                        "headers": {name: request.headers[name] for name in LOGGED_HEADERS if name in request.headers},
+                        "query": dict(request.query_params),
+                    })
 
                 # Call the actual endpoint function
                 response = await func(request, *args, **kwargs)
 
             except HTTPException as http_exc:
                 # Log HTTPException but re-raise it so FastAPI handles it correctly
-                logger.warning({
+                log_json(logger, logging.WARNING, {
                     "trace_id": trace_id,
                     "action": "error_response",
+                    "url": str(request.url),
                     "status_code": http_exc.status_code,
                     "detail": http_exc.detail
                 })
@@ -95,9 +153,10 @@ def log_request():
 
             except Exception as e:
                 # Catch unexpected errors and return a 500 response
-                logger.error({
+                log_json(logger, logging.ERROR, {
                     "trace_id": trace_id,
                     "action": "error",
+                    "url": str(request.url),
                     "details": f"Unexpected error in decorated function: {e}"
                 })
                 return JSONResponse(
@@ -106,11 +165,12 @@ def log_request():
                 )
 
             # Capture Response details
-            logger.debug({
-                "trace_id": trace_id,
-                "action": "response",
-                "body": response,
-            })
+            if sampled:
+                log_json(logger, logging.DEBUG, lambda: {
+                    "trace_id": trace_id,
+                    "action": "response",
+                    "body": loggable_response(response),
+                })
 
             return response
 
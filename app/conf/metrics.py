@@ -0,0 +1,231 @@
+import bisect
+import contextlib
+import contextvars
+import sys
+import threading
+import time
+
+import orjson
+
+from app.conf.settings import settings
+
+# Upper bounds of histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Values recorded while serving the current request, emitted as Embedded Metric Format in lambda
+_request_values: contextvars.ContextVar[dict | None] = contextvars.ContextVar("request_metrics", default=None)
+_request_values_lock = threading.Lock()
+
+
+def record_request_value(name: str, labels: tuple, value: float, unit: str) -> None:
+    values = _request_values.get()
+    if values is None:
+        return
+    metric_name = ".".join((name,) + tuple(label_value for _, label_value in labels))
+    with _request_values_lock:
+        values.setdefault(metric_name, (unit, []))[1].append(value)
+
+
+def label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels: tuple, extra: tuple = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        record_request_value(self.name, key, amount, "Count")
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(label_key(labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{format_labels(key)} {value}" for key, value in sorted(self._values.items())]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Histogram of durations in seconds with cumulative buckets, sum and count per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # counts per bucket, +Inf bucket, sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+        record_request_value(self.name, key, value, "Seconds")
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe duration of the block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts = self._values.get(label_key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def total(self, **labels) -> float:
+        """Sum of observed values"""
+        with self._lock:
+            counts = self._values.get(label_key(labels))
+            return counts[-1] if counts else 0.0
+
+    def samples(self) -> list[str]:
+        samples = []
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                samples.append(f"{self.name}_bucket{format_labels(key, (('le', bound),))} {cumulative}")
+            samples.append(f"{self.name}_sum{format_labels(key)} {counts[-1]}")
+            samples.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return samples
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, description: str) -> Counter:
+        metric = Counter(name, description)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, description: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, description, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        for metric in self.metrics:
+            metric.reset()
+
+
+registry = MetricsRegistry()
+
+request_seconds = registry.histogram("trackapi_request_seconds", "Request duration by route and status code")
+stage_seconds = registry.histogram("trackapi_stage_seconds", "Duration of tracking request stages")
+dynamodb_seconds = registry.histogram("trackapi_dynamodb_seconds", "DynamoDB call duration by operation")
+redis_seconds = registry.histogram("trackapi_redis_seconds", "Redis round trip duration by operation")
+weatherbit_seconds = registry.histogram("trackapi_weatherbit_seconds", "Weatherbit API call duration")
+openweathermap_seconds = registry.histogram("trackapi_openweathermap_seconds", "OpenWeatherMap API call duration")
+weather_cache_total = registry.counter("trackapi_weather_cache_total", "Weather cache lookups by result")
+upstream_errors_total = registry.counter("trackapi_upstream_errors_total", "Upstream errors by upstream and reason")
+weather_hedge_total = registry.counter("trackapi_weather_hedge_total", "Hedged weather lookups by outcome")
+status_events_total = registry.counter("trackapi_status_events_total", "Shipment status change events by outcome")
+
+
+def emf_document(route: str, values: dict[str, tuple[str, list[float]]]) -> dict:
+    """CloudWatch Embedded Metric Format document of one request
+
+    :param route: route template, the only dimension
+    :param values: unit and recorded values by metric name
+    """
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": settings.METRICS_NAMESPACE,
+                "Dimensions": [["route"]],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (unit, _) in values.items()],
+            }],
+        },
+        "route": route,
+        **{name: recorded if len(recorded) > 1 else recorded[0] for name, (_, recorded) in values.items()},
+    }
+
+
+class MetricsMiddleware:
+    """ASGI middleware measuring request duration.
+
+    With `emit_emf` values recorded during the request are written to stdout as one Embedded Metric
+    Format document, lambda forwards it to CloudWatch Logs, which extracts the metrics without API calls.
+    """
+
+    def __init__(self, app, emit_emf: bool = False):
+        self.app = app
+        self.emit_emf = emit_emf
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = _request_values.set({} if self.emit_emf else None)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            values = _request_values.get()
+            _request_values.reset(token)
+            # route template, not the raw path: tracking numbers would explode the number of label values
+            route_path = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(duration, route=route_path, status=str(status["code"]))
+            if values is not None:
+                values[request_seconds.name] = ("Seconds", [duration])
+                sys.stdout.write(orjson.dumps(emf_document(route_path, values)).decode() + "\n")
@@ -10,26 +10,154 @@ if os.getenv("ENV") == "dev":
 class Settings(BaseSettings):
     """Project global settings"""
 
+    # Database provider used by API: "dynamodb" or "snapshot" (in-memory copy of the table)
+    DATABASE_PROVIDER: str = os.getenv("DATABASE_PROVIDER", "dynamodb")
+    # Snapshot provider: seconds between refreshes (0 - disabled), parallel scan segments, read missing shipments
+    # from DynamoDB and keep them in snapshot. Every refresh of every worker and lambda container is a full table
+    # Scan billed by full item size (about table size / 8KB RCU), projection does not reduce the cost, so statuses
+    # in snapshot may be up to this old
+    SNAPSHOT_REFRESH_INTERVAL: float = os.getenv("SNAPSHOT_REFRESH_INTERVAL", 3600)
+    SNAPSHOT_SCAN_SEGMENTS: int = os.getenv("SNAPSHOT_SCAN_SEGMENTS", 4)
+    SNAPSHOT_READ_THROUGH: bool = os.getenv("SNAPSHOT_READ_THROUGH", True)
+
+    # Read-through cache of tracking items in front of database provider, in process memory and Redis
+    TRACKING_CACHE: bool = os.getenv("TRACKING_CACHE", False)
+    TRACKING_CACHE_REDIS: bool = os.getenv("TRACKING_CACHE_REDIS", True)
+    TRACKING_CACHE_TTL: int = os.getenv("TRACKING_CACHE_TTL", 10)
+    TRACKING_CACHE_NEGATIVE_TTL: int = os.getenv("TRACKING_CACHE_NEGATIVE_TTL", 5)
+    TRACKING_CACHE_LOCAL_SIZE: int = os.getenv("TRACKING_CACHE_LOCAL_SIZE", 10000)
+
     # AWS Dynamodb
     AWS_REGION: str = os.getenv("AWS_REGION", "eu-central-1")
     DYNAMODB_ENDPOINT: str = os.getenv("DYNAMODB_ENDPOINT", "")
     AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID")
     AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY")
     TRACKING_TABLE: str = os.getenv("TRACKING_TABLE", "Tracking")
+    DYNAMODB_MAX_POOL_CONNECTIONS: int = os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", 50)
+    DYNAMODB_BATCH_MAX_RETRIES: int = os.getenv("DYNAMODB_BATCH_MAX_RETRIES", 5)
+    DYNAMODB_BATCH_BACKOFF: float = os.getenv("DYNAMODB_BATCH_BACKOFF", 0.05)
+    # Strongly consistent reads cost twice as many read capacity units as eventually consistent ones
+    DYNAMODB_CONSISTENT_READ: bool = os.getenv("DYNAMODB_CONSISTENT_READ", False)
+
+    # Shipments loader: parallel BatchWriteItem workers, rows sorted in memory before spilling to disk
+    LOADER_WORKERS: int = os.getenv("LOADER_WORKERS", 8)
+    LOADER_CHUNK_ROWS: int = os.getenv("LOADER_CHUNK_ROWS", 100000)
+    LOADER_MAX_RETRIES: int = os.getenv("LOADER_MAX_RETRIES", 10)
+
+    # Maximum number of shipments in one batch tracking request
+    TRACKING_BATCH_MAX_SIZE: int = os.getenv("TRACKING_BATCH_MAX_SIZE", 100)
+    # HTTP caching of tracking responses, seconds of Cache-Control max-age and stale-while-revalidate. Status may change
+    # any time, so responses are fresh only briefly and then revalidated with ETag, weather changes every
+    # EXT_API_EXPIRATION
+    TRACKING_MAX_AGE: int = os.getenv("TRACKING_MAX_AGE", 60)
+    TRACKING_STALE_WHILE_REVALIDATE: int = os.getenv("TRACKING_STALE_WHILE_REVALIDATE",
+                                                     os.getenv("EXT_API_EXPIRATION", 7200))
+
+    # Status change notifications: incremental import publishes new shipments and changed statuses to Redis pub/sub
+    # channel (full reload publishes every shipment only with STATUS_NOTIFICATIONS_FULL_RELOAD) and
+    # GET /track/subscribe streams changes as server-sent events (uvicorn only, API Gateway does not keep streams
+    # open): keep-alive comment interval, seconds before the stream is closed for the client to reconnect,
+    # delay before resubscribing after Redis errors
+    STATUS_NOTIFICATIONS: bool = os.getenv("STATUS_NOTIFICATIONS", False)
+    STATUS_NOTIFICATIONS_FULL_RELOAD: bool = os.getenv("STATUS_NOTIFICATIONS_FULL_RELOAD", False)
+    STATUS_CHANNEL: str = os.getenv("STATUS_CHANNEL", "trackapi:status")
+    SUBSCRIPTION_KEEPALIVE: float = os.getenv("SUBSCRIPTION_KEEPALIVE", 15)
+    SUBSCRIPTION_MAX_DURATION: float = os.getenv("SUBSCRIPTION_MAX_DURATION", 3600)
+    SUBSCRIPTION_RECONNECT_DELAY: float = os.getenv("SUBSCRIPTION_RECONNECT_DELAY", 1.0)
 
     # AWS Cloudwatch
     AWS_LAMBDA_FUNCTION_NAME: str = os.getenv("AWS_LAMBDA_FUNCTION_NAME")
     AWS_CW_LOGGING_GROUP: str = os.getenv("AWS_CW_LOGGING_GROUP", "/aws/lambda/trackapi-lambda")
 
+    # Request logging
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # Share of successful requests with logged request/response details (0..1), errors are always logged
+    LOG_SAMPLE_RATE: float = os.getenv("LOG_SAMPLE_RATE", 1.0)
+    # Comma-separated allow-list of logged request headers
+    LOG_HEADERS: str = os.getenv("LOG_HEADERS", "user-agent,content-type,content-length,x-request-id")
+
+    # Metrics: Prometheus text format on /metrics, per-request CloudWatch Embedded Metric Format
+    # on stdout (always on in lambda). The endpoint is off in lambda by default: API Gateway proxy route would make it
+    # public and values cover a single container only
+    METRICS_ENDPOINT: bool = os.getenv("METRICS_ENDPOINT", not os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+    METRICS_EMF: bool = os.getenv("METRICS_EMF", False)
+    METRICS_NAMESPACE: str = os.getenv("METRICS_NAMESPACE", "TrackAPI")
+
+    # Thread pool for blocking I/O (boto3, redis, requests) called from async endpoints
+    IO_THREADPOOL_SIZE: int = os.getenv("IO_THREADPOOL_SIZE", 50)
+    # Create providers, clients and lookup indexes on application startup instead of the first request
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", True)
+
     # External Weather API
     WEATHERBIT_API_KEY: str = os.getenv("WEATHER_API_KEY", "701ad37e6f004f43899350e11eb23b17")
     WEATHERBIT_API_URL: str = os.getenv("WEATHER_API_URL", "https://api.weatherbit.io/v2.0/current")
     EXT_API_EXPIRATION: int = os.getenv("EXT_API_EXPIRATION", 7200)
+    WEATHERBIT_POOL_SIZE: int = os.getenv("WEATHERBIT_POOL_SIZE", 20)
+    WEATHERBIT_CONNECT_TIMEOUT: float = os.getenv("WEATHERBIT_CONNECT_TIMEOUT", 1.0)
+    WEATHERBIT_READ_TIMEOUT: float = os.getenv("WEATHERBIT_READ_TIMEOUT", 3.0)
+    # Retries of 429, 5xx and connection errors, exponential backoff with jitter
+    WEATHERBIT_RETRIES: int = os.getenv("WEATHERBIT_RETRIES", 2)
+    WEATHERBIT_RETRY_BACKOFF: float = os.getenv("WEATHERBIT_RETRY_BACKOFF", 0.2)
+    # Circuit breaker: consecutive failed calls to open it and seconds before trial call
+    WEATHERBIT_BREAKER_THRESHOLD: int = os.getenv("WEATHERBIT_BREAKER_THRESHOLD", 5)
+    WEATHERBIT_BREAKER_RESET: float = os.getenv("WEATHERBIT_BREAKER_RESET", 30)
+    # Number of parsed receiver addresses kept in memory
+    ADDRESS_CACHE_SIZE: int = os.getenv("ADDRESS_CACHE_SIZE", 16384)
+    # Weather cache: value is fresh for SOFT TTL, between SOFT and HARD TTL it is served stale while refreshed in
+    # background. In Lambda the process is frozen after the response, so the stale value is refreshed before it
+    # is returned instead
+    WEATHER_CACHE_SOFT_TTL: int = os.getenv("WEATHER_CACHE_SOFT_TTL", os.getenv("EXT_API_EXPIRATION", 7200))
+    WEATHER_CACHE_HARD_TTL: int = os.getenv("WEATHER_CACHE_HARD_TTL", os.getenv("EXT_API_EXPIRATION", 7200))
+    # Redis lock to allow only one Weatherbit call per location across all workers and Lambda instances
+    WEATHER_CACHE_LOCK: bool = os.getenv("WEATHER_CACHE_LOCK", False)
+    WEATHER_CACHE_LOCK_TIMEOUT: float = os.getenv("WEATHER_CACHE_LOCK_TIMEOUT", 10)
+    # Start weather lookup together with database query, using receiver locations indexed by the loader. Prefetched
+    # weather is used only when indexed location matches the shipment address, full reload clears the index
+    WEATHER_PREFETCH: bool = os.getenv("WEATHER_PREFETCH", False)
+    # Weather cache warmer: every run scans the whole table (full table of read capacity, see docs/serverless.md),
+    # refresh weather of active shipments this many seconds before it stops being fresh,
+    # parallel API calls, API calls per second and per run (0 - unlimited) within Weatherbit quota,
+    # comma-separated statuses of finished shipments
+    WEATHER_WARMER_MARGIN: int = os.getenv("WEATHER_WARMER_MARGIN", 900)
+    WEATHER_WARMER_WORKERS: int = os.getenv("WEATHER_WARMER_WORKERS", 4)
+    WEATHER_WARMER_RATE: float = os.getenv("WEATHER_WARMER_RATE", 2)
+    WEATHER_WARMER_MAX_CALLS: int = os.getenv("WEATHER_WARMER_MAX_CALLS", 1000)
+    WEATHER_WARMER_SKIP_STATUSES: str = os.getenv("WEATHER_WARMER_SKIP_STATUSES", "delivered")
+    # Weather provider of the API: "weatherbit", "openweathermap" or "hedged"
+    WEATHER_PROVIDER: str = os.getenv("WEATHER_PROVIDER", "weatherbit")
+    # Hedged provider: comma-separated providers in order of preference. Next provider is asked when the previous
+    # one failed or has not answered within WEATHER_HEDGE_PERCENTILE of its recent latencies (bounded by min and
+    # max delay), WEATHER_HEDGE_DELAY is used until enough calls are measured
+    WEATHER_HEDGE_PROVIDERS: str = os.getenv("WEATHER_HEDGE_PROVIDERS", "weatherbit,openweathermap")
+    WEATHER_HEDGE_PERCENTILE: float = os.getenv("WEATHER_HEDGE_PERCENTILE", 0.95)
+    WEATHER_HEDGE_DELAY: float = os.getenv("WEATHER_HEDGE_DELAY", 0.5)
+    WEATHER_HEDGE_MIN_DELAY: float = os.getenv("WEATHER_HEDGE_MIN_DELAY", 0.05)
+    WEATHER_HEDGE_MAX_DELAY: float = os.getenv("WEATHER_HEDGE_MAX_DELAY", 2.0)
+    WEATHER_HEDGE_WINDOW: int = os.getenv("WEATHER_HEDGE_WINDOW", 200)
+    WEATHER_HEDGE_WORKERS: int = os.getenv("WEATHER_HEDGE_WORKERS", 20)
+    # Hedged provider only: last fetched weather of every location is kept this long and served when all providers
+    # fail, 0 - disabled. Not written with other providers
+    WEATHER_LAST_KNOWN_TTL: int = os.getenv("WEATHER_LAST_KNOWN_TTL", 86400)
+    # Weather is cached per region instead of exact zip code: comma-separated COUNTRY:length rules keep this many
+    # leading characters of the zip code, "*" applies to other countries, e.g. "DE:2,FR:2,US:3,*:0". 0 or no rule -
+    # exact zip code
+    WEATHER_REGION_RULES: str = os.getenv("WEATHER_REGION_RULES", "")
+
+    # Secondary weather API, circuit breaker uses Weatherbit thresholds
+    OPENWEATHERMAP_API_KEY: str = os.getenv("OPENWEATHERMAP_API_KEY", "")
+    OPENWEATHERMAP_API_URL: str = os.getenv("OPENWEATHERMAP_API_URL", "https://api.openweathermap.org/data/2.5/weather")
+    OPENWEATHERMAP_POOL_SIZE: int = os.getenv("OPENWEATHERMAP_POOL_SIZE", 20)
+    OPENWEATHERMAP_TIMEOUT: float = os.getenv("OPENWEATHERMAP_TIMEOUT", 3.0)
 
     # Redis
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = os.getenv("REDIS_PORT", 6379)
     REDIS_CACHE_DB: int = os.getenv("REDIS_CACHE_DB", 0)
 
+    # In-process weather cache in front of Redis
+    LOCAL_CACHE_SIZE: int = os.getenv("LOCAL_CACHE_SIZE", 1024)
+    LOCAL_CACHE_TTL: int = os.getenv("LOCAL_CACHE_TTL", 300)
+    LOCAL_CACHE_MAX_ENTRY_BYTES: int = os.getenv("LOCAL_CACHE_MAX_ENTRY_BYTES", 16384)
+
 
 settings = Settings()
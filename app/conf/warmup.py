@@ -0,0 +1,33 @@
+import threading
+
+_warmed_up = False
+_warmup_lock = threading.Lock()
+
+
+def warm_up() -> None:
+    """Create long-lived objects used by requests: logging queue, shared database and weather provider
+    instances with their connection pools, country index.
+
+    Objects are kept at module level, so they survive between warm lambda invocations. Mangum runs
+    application lifespan around every invocation, so only the first call does the work.
+    """
+    global _warmed_up
+
+    if _warmed_up:
+        return
+    with _warmup_lock:
+        if _warmed_up:
+            return
+
+        from app.api.tracking import get_database, get_weather
+        from app.conf.logging import get_logger
+        from app.integrations.countries import country_index
+
+        logger = get_logger()
+        for name, create in (("database", get_database), ("weather", get_weather), ("countries", country_index)):
+            try:
+                create()
+            except Exception as e:
+                # not fatal, the first request creates it again and reports the error
+                logger.warning(f"Warm-up of {name} failed: {e}")
+        _warmed_up = True
@@ -3,9 +3,19 @@ from abc import ABC, abstractmethod
 from app.api.models import TrackingItem
 
 
+def stored_item(item: TrackingItem) -> dict:
+    """Tracking item as dict including content hash, which is excluded from serialization of API responses"""
+    return {**item.model_dump(), "content_hash": item.content_hash}
+
+
 class DatabaseProvider(ABC):
     """Abstract base class for database providers."""
 
     @abstractmethod
-    def get_tracking_item(self, tracking_number: str, carrier: str) -> TrackingItem | None:
+    def get_tracking_item(self, tracking_number: str, carrier: str,
+                          include_articles: bool = True) -> TrackingItem | None:
+        pass
+
+    @abstractmethod
+    def get_tracking_items(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], TrackingItem]:
         pass
@@ -0,0 +1,137 @@
+import orjson
+import redis
+
+from app.api.models import TrackingItem
+from app.conf.settings import settings
+from app.db.base import DatabaseProvider, stored_item
+from app.integrations import cache
+
+# Redis value of cached "shipment not found" result
+NOT_FOUND = b"-"
+
+
+def tracking_cache_key(tracking_number: str, carrier: str) -> str:
+    return f"tracking:{tracking_number}:{carrier}"
+
+
+def invalidate_tracking_items(keys: list[tuple[str, str]]) -> None:
+    """Remove tracking items from Redis cache, used after items are written or updated
+
+    :param keys: list of (tracking number, carrier)
+    """
+    if keys and settings.TRACKING_CACHE_REDIS:
+        cache.redis_client.delete(*[tracking_cache_key(*key) for key in keys])
+
+
+class CachedDatabase(DatabaseProvider):
+    """Read-through cache wrapping any database provider.
+
+    Found items are cached for TRACKING_CACHE_TTL seconds and "not found" results for TRACKING_CACHE_NEGATIVE_TTL,
+    in process memory (LRU) and optionally in Redis shared by all workers. Cache failures never fail the lookup.
+    """
+
+    def __init__(self, provider: DatabaseProvider):
+        self.provider = provider
+        self.ttl = int(settings.TRACKING_CACHE_TTL)
+        self.negative_ttl = int(settings.TRACKING_CACHE_NEGATIVE_TTL)
+        self.use_redis = bool(settings.TRACKING_CACHE_REDIS)
+        self.local_cache = cache.LocalCache(max_size=int(settings.TRACKING_CACHE_LOCAL_SIZE),
+                                            ttl=max(self.ttl, self.negative_ttl),
+                                            max_entry_bytes=int(settings.LOCAL_CACHE_MAX_ENTRY_BYTES))
+
+    def get_tracking_item(self, tracking_number: str, carrier: str,
+                          include_articles: bool = True) -> TrackingItem | None:
+        """Search for tracking item in cache, then in wrapped provider
+
+        Whole items are cached, so articles are dropped from the cached item when not requested.
+
+        :param tracking_number: requested tracking number
+        :param carrier: requested carrier
+        :param include_articles: return articles too
+        :return: TrackingItem or None
+        """
+        item = self.get_tracking_items([(tracking_number, carrier)]).get((tracking_number, carrier))
+        if item is not None and not include_articles:
+            return item.model_copy(update={"articles": None})
+        return item
+
+    def get_tracking_items(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], TrackingItem]:
+        """Bulk search for tracking items in cache, then in wrapped provider
+
+        :param keys: list of (tracking number, carrier)
+        :return: found TrackingItems by (tracking number, carrier), missing keys are omitted
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        missing = []
+        for key in keys:
+            cached = self.local_cache.get(tracking_cache_key(*key))
+            if cached is None:
+                missing.append(key)
+            elif cached is not NOT_FOUND:
+                found[key] = cached
+
+        if missing and self.use_redis:
+            missing = self._read_redis(missing, found)
+
+        if missing:
+            if len(missing) == 1:
+                item = self.provider.get_tracking_item(*missing[0])
+                loaded = {missing[0]: item} if item is not None else {}
+            else:
+                loaded = self.provider.get_tracking_items(missing)
+            found.update(loaded)
+            self._store(missing, loaded)
+
+        return found
+
+    def _read_redis(self, keys: list[tuple[str, str]], found: dict) -> list[tuple[str, str]]:
+        """Read keys from Redis into found items and local cache, return keys still missing"""
+        try:
+            values = cache.redis_client.mget([tracking_cache_key(*key) for key in keys])
+        except redis.RedisError:
+            return keys
+
+        missing = []
+        for key, value in zip(keys, values):
+            if value is None:
+                missing.append(key)
+            elif value == NOT_FOUND:
+                self.local_cache.set(tracking_cache_key(*key), NOT_FOUND, len(value), self.negative_ttl)
+            else:
+                item = TrackingItem.model_validate_json(value)
+                self.local_cache.set(tracking_cache_key(*key), item, len(value), self.ttl)
+                found[key] = item
+        return missing
+
+    def _store(self, keys: list[tuple[str, str]], loaded: dict[tuple[str, str], TrackingItem]) -> None:
+        """Cache loaded items and "not found" results of requested keys"""
+        values = {}
+        for key in keys:
+            cache_key = tracking_cache_key(*key)
+            item = loaded.get(key)
+            if item is not None:
+                local_value, value, ttl = item, orjson.dumps(stored_item(item)), self.ttl
+            else:
+                local_value, value, ttl = NOT_FOUND, NOT_FOUND, self.negative_ttl
+            self.local_cache.set(cache_key, local_value, len(value), ttl)
+            values[cache_key] = (value, ttl)
+
+        if not self.use_redis:
+            return
+        try:
+            pipeline = cache.redis_client.pipeline(transaction=False)
+            for cache_key, (value, ttl) in values.items():
+                pipeline.setex(cache_key, ttl, value)
+            pipeline.execute()
+        except redis.RedisError:
+            pass
+
+    def invalidate(self, keys: list[tuple[str, str]]) -> None:
+        """Remove tracking items from local and Redis cache
+
+        :param keys: list of (tracking number, carrier)
+        """
+        for key in keys:
+            self.local_cache.delete(tracking_cache_key(*key))
+        invalidate_tracking_items(keys)
@@ -1,9 +1,18 @@
+import functools
 import os
+import random
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 
 import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 from app.api.models import TrackingItem
+from app.conf.metrics import dynamodb_seconds, upstream_errors_total
 from app.conf.settings import settings
 from app.db.base import DatabaseProvider
 
@@ -14,7 +23,24 @@ class DatabaseException(Exception):
 
 
 class DatabaseDynamoDb(DatabaseProvider):
-    """ DynamoDB database provider """
+    """ DynamoDB database provider
+
+    Instances are long-lived and shared between requests (see DatabaseFactory), so the request path only
+    uses the low-level client, which is thread-safe. The resource is created lazily for bulk loading and
+    table management.
+    """
+
+    deserializer = TypeDeserializer()
+    serializer = TypeSerializer()
+
+    # DynamoDB limits of keys in one BatchGetItem and items in one BatchWriteItem call
+    batch_get_size = 100
+    batch_write_size = 25
+
+    # attributes read when articles are not requested, "status" is a reserved word
+    summary_projection = "tracking_number, carrier, sender_address, receiver_address, #status, content_hash"
+
+    throttling_errors = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
 
     def __init__(self):
 
@@ -33,39 +59,209 @@ class DatabaseDynamoDb(DatabaseProvider):
             # only needed for dynamodb local
             dynamo_params['endpoint_url'] = settings.DYNAMODB_ENDPOINT
 
-        self.dynamodb_resource = boto3.resource(
-            "dynamodb",
-            **dynamo_params,
-        )
+        # one connection pool per provider instance, shared by all requests
+        dynamo_params["config"] = Config(max_pool_connections=int(settings.DYNAMODB_MAX_POOL_CONNECTIONS))
+
+        self.dynamo_params = dynamo_params
         self.dynamodb_client = boto3.client(
             "dynamodb",
             **dynamo_params,
         )
-        self.shipments_table = self.dynamodb_resource.Table(settings.TRACKING_TABLE)
+        self.table_name = settings.TRACKING_TABLE
+
+    @functools.cached_property
+    def dynamodb_resource(self):
+        # created on first use, API requests never need it and it adds to the cold start
+        return boto3.resource("dynamodb", **self.dynamo_params)
 
-    def get_tracking_item(self, tracking_number: str, carrier: str) -> TrackingItem | None:
+    @functools.cached_property
+    def shipments_table(self):
+        return self.dynamodb_resource.Table(self.table_name)
+
+    def get_tracking_item(self, tracking_number: str, carrier: str,
+                          include_articles: bool = True) -> TrackingItem | None:
         """Search for tracking item by tracking number and carrier
 
         :param tracking_number: requested tracking number
         :param carrier: requested carrier
+        :param include_articles: read articles too, status polling skips them
         :return: TrackingItem or None
         """
 
         try:
-            response = self.shipments_table.query(
-                KeyConditionExpression="tracking_number = :tn AND carrier = :c",
-                ExpressionAttributeValues={
-                    ":tn": tracking_number,
-                    ":c": carrier
-                }
-            )
-            if response["Count"] > 0:
-                return TrackingItem(**response["Items"][0])
-            else:
-                return None
+            with dynamodb_seconds.time(operation="get_item"):
+                item = self.get_item(tracking_number, carrier,
+                                     projection=None if include_articles else self.summary_projection)
+            return TrackingItem(**item) if item is not None else None
         except Exception as e:
+            upstream_errors_total.inc(upstream="dynamodb", reason=self.error_reason(e))
             raise DatabaseException(f"DynamoDB database not initialized: {e}, trace: {traceback.format_exc()}")
 
+    def get_item(self, tracking_number: str, carrier: str, projection: str | None = None) -> dict | None:
+        """GetItem by full primary key, consistency is set by DYNAMODB_CONSISTENT_READ
+
+        :param tracking_number: requested tracking number
+        :param carrier: requested carrier
+        :param projection: optional ProjectionExpression, "#status" stands for the status attribute
+        :return: deserialized item or None
+        """
+
+        request = self.with_projection({
+            "TableName": self.table_name,
+            "Key": {"tracking_number": {"S": tracking_number}, "carrier": {"S": carrier}},
+            "ConsistentRead": bool(settings.DYNAMODB_CONSISTENT_READ),
+        }, projection)
+        item = self.dynamodb_client.get_item(**request).get("Item")
+        return self.deserialize(item) if item else None
+
+    def get_tracking_items(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], TrackingItem]:
+        """Bulk search for tracking items using BatchGetItem
+
+        :param keys: list of (tracking number, carrier)
+        :return: found TrackingItems by (tracking number, carrier), missing keys are omitted
+        """
+
+        try:
+            with dynamodb_seconds.time(operation="batch_get_item"):
+                items = self.batch_get(keys)
+            return {key: TrackingItem(**item) for key, item in items.items()}
+        except DatabaseException as e:
+            upstream_errors_total.inc(upstream="dynamodb", reason=self.error_reason(e))
+            raise
+        except Exception as e:
+            upstream_errors_total.inc(upstream="dynamodb", reason=self.error_reason(e))
+            raise DatabaseException(f"DynamoDB database not initialized: {e}, trace: {traceback.format_exc()}")
+
+    def get_content_hashes(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], dict]:
+        """Read only content hashes and status of stored tracking items, used by incremental import
+
+        :param keys: list of (tracking number, carrier)
+        :return: {"content_hash": ..., "details_hash": ..., "status": ...} by (tracking number, carrier),
+            missing keys are omitted
+        """
+        return self.batch_get(keys, projection="tracking_number, carrier, content_hash, details_hash, #status")
+
+    def batch_get(self, keys: list[tuple[str, str]], projection: str | None = None) -> dict[tuple[str, str], dict]:
+        """BatchGetItem in chunks of 100 keys, unprocessed keys are requested again with backoff
+
+        :param keys: list of (tracking number, carrier)
+        :param projection: optional ProjectionExpression
+        :return: deserialized items by (tracking number, carrier)
+        """
+
+        keys = list(dict.fromkeys(keys))
+        table_name = self.table_name
+        found = {}
+        for start in range(0, len(keys), self.batch_get_size):
+            request = self.with_projection({"Keys": [
+                {"tracking_number": {"S": tracking_number}, "carrier": {"S": carrier}}
+                for tracking_number, carrier in keys[start:start + self.batch_get_size]
+            ]}, projection)
+            if settings.DYNAMODB_CONSISTENT_READ:
+                request["ConsistentRead"] = True
+            request_items = {table_name: request}
+            attempt = 0
+            while request_items:
+                response = self.dynamodb_client.batch_get_item(RequestItems=request_items)
+                for item in response["Responses"].get(table_name, []):
+                    item = self.deserialize(item)
+                    found[(item["tracking_number"], item["carrier"])] = item
+
+                # throttled keys are returned back and must be requested again
+                request_items = response.get("UnprocessedKeys") or {}
+                if request_items:
+                    attempt += 1
+                    if attempt > int(settings.DYNAMODB_BATCH_MAX_RETRIES):
+                        raise DatabaseException(f"Unprocessed keys left after {attempt - 1} retries")
+                    self.backoff(attempt)
+        return found
+
+    def scan_items(self, projection: str | None = None, segments: int = 1) -> Iterator[dict]:
+        """Read the whole table with parallel Scan, read capacity is billed by full item size whatever the projection
+
+        :param projection: optional ProjectionExpression
+        :param segments: number of Scan segments read in parallel
+        :return: iterator over deserialized items
+        """
+
+        def scan_segment(segment: int) -> list[dict]:
+            request = self.with_projection(
+                {"TableName": self.table_name, "Segment": segment, "TotalSegments": segments}, projection
+            )
+            items = []
+            while True:
+                response = self.dynamodb_client.scan(**request)
+                items.extend(self.deserialize(item) for item in response.get("Items", []))
+                if "LastEvaluatedKey" not in response:
+                    return items
+                request["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        with ThreadPoolExecutor(max_workers=segments, thread_name_prefix="scan") as executor:
+            for items in executor.map(scan_segment, range(segments)):
+                yield from items
+
+    def update_tracking_status(self, tracking_number: str, carrier: str, status: str, content_hash: str,
+                               max_retries: int | None = None) -> None:
+        """Update only status of stored tracking item, throttled requests are retried with backoff
+
+        :param tracking_number: tracking number
+        :param carrier: carrier
+        :param status: new shipment status
+        :param content_hash: content hash of the item with new status
+        :param max_retries: retries before DatabaseException is raised, DYNAMODB_BATCH_MAX_RETRIES by default
+        """
+        if max_retries is None:
+            max_retries = int(settings.DYNAMODB_BATCH_MAX_RETRIES)
+
+        attempt = 0
+        while True:
+            try:
+                self.dynamodb_client.update_item(
+                    TableName=self.table_name,
+                    Key={"tracking_number": {"S": tracking_number}, "carrier": {"S": carrier}},
+                    UpdateExpression="SET #status = :status, content_hash = :hash",
+                    ExpressionAttributeNames={"#status": "status"},
+                    ExpressionAttributeValues={":status": {"S": status}, ":hash": {"S": content_hash}},
+                )
+                return
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in self.throttling_errors or attempt >= max_retries:
+                    raise DatabaseException(f"DynamoDB status update failed: {e}")
+            attempt += 1
+            self.backoff(attempt)
+
+    @staticmethod
+    def error_reason(error: Exception) -> str:
+        """AWS error code of client errors, exception class name otherwise"""
+        if isinstance(error, ClientError):
+            return error.response.get("Error", {}).get("Code", "ClientError")
+        return type(error).__name__
+
+    @staticmethod
+    def with_projection(request: dict, projection: str | None) -> dict:
+        """Add optional ProjectionExpression to the request, "#status" stands for the reserved word status"""
+        if projection:
+            request["ProjectionExpression"] = projection
+            if "#status" in projection:
+                request["ExpressionAttributeNames"] = {"#status": "status"}
+        return request
+
+    @staticmethod
+    def backoff(attempt: int) -> None:
+        """Sleep before retry, exponential delay with jitter"""
+        delay = float(settings.DYNAMODB_BATCH_BACKOFF) * 2 ** (attempt - 1)
+        time.sleep(random.uniform(delay / 2, delay))
+
+    @classmethod
+    def deserialize(cls, item: dict) -> dict:
+        """Convert low-level DynamoDB attribute values into plain python values"""
+        return {key: cls.deserializer.deserialize(value) for key, value in item.items()}
+
+    @classmethod
+    def serialize(cls, item: dict) -> dict:
+        """Convert plain python values into low-level DynamoDB attribute values"""
+        return {key: cls.serializer.serialize(value) for key, value in item.items()}
+
     def put_tracking_items(self, items: list) -> None:
         """Bulk method to put tracking items into DynamoDB
 
@@ -76,17 +272,54 @@ class DatabaseDynamoDb(DatabaseProvider):
             for item in items:
                 batch.put_item(Item=item)
 
+    def write_tracking_items(self, items: list, max_retries: int | None = None) -> None:
+        """Write up to 25 tracking items with single BatchWriteItem call.
+        Unprocessed items and throttled requests are retried with backoff, method is thread-safe.
+
+        :param items: list of tracking items
+        :param max_retries: retries before DatabaseException is raised, DYNAMODB_BATCH_MAX_RETRIES by default
+        :return: None
+        """
+        if max_retries is None:
+            max_retries = int(settings.DYNAMODB_BATCH_MAX_RETRIES)
+
+        request_items = {self.table_name: [
+            {"PutRequest": {"Item": self.serialize(item)}} for item in items
+        ]}
+        attempt = 0
+        while request_items:
+            try:
+                response = self.dynamodb_client.batch_write_item(RequestItems=request_items)
+                request_items = response.get("UnprocessedItems") or {}
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in self.throttling_errors:
+                    raise DatabaseException(f"DynamoDB batch write failed: {e}")
+            if request_items:
+                attempt += 1
+                if attempt > max_retries:
+                    raise DatabaseException(f"Unprocessed items left after {attempt - 1} retries")
+                self.backoff(attempt)
+
     def create_tracking_table(self) -> None:
         """Automatically generate DynamoDB Tracking table, if exists - delete it and create again.
         Only used for demo purposes.
         """
         existing_tables = self.dynamodb_client.list_tables()['TableNames']
         print(f"Existing tables: {existing_tables}")
-        if self.shipments_table.name in existing_tables:
+        if self.table_name in existing_tables:
             self.shipments_table.delete()
 
+        self._create_table()
+
+    def ensure_tracking_table(self) -> None:
+        """Create DynamoDB Tracking table only if it does not exist, existing data is kept."""
+        existing_tables = self.dynamodb_client.list_tables()['TableNames']
+        if self.table_name not in existing_tables:
+            self._create_table()
+
+    def _create_table(self) -> None:
         table = self.dynamodb_resource.create_table(
-            TableName=self.shipments_table.name,
+            TableName=self.table_name,
             KeySchema=[
                 {'AttributeName': 'tracking_number', 'KeyType': 'HASH'},  # Partition key
                 {'AttributeName': 'carrier', 'KeyType': 'RANGE'}  # Sort key
@@ -101,4 +334,4 @@ class DatabaseDynamoDb(DatabaseProvider):
         # Wait until table is created
         table.wait_until_exists()
 
-        print(f"Table '{self.shipments_table.name}' created successfully!")
+        print(f"Table '{self.table_name}' created successfully!")
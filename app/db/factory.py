@@ -1,17 +1,49 @@
+import threading
+
 from app.db.base import DatabaseProvider
+from app.db.cache import CachedDatabase
 from app.db.dynamodb import DatabaseDynamoDb
+from app.db.snapshot import DatabaseSnapshot
 
 
 class DatabaseFactory:
-    @staticmethod
-    def get_provider(provider_name: str) -> DatabaseProvider:
+    providers = {
+        "dynamodb": DatabaseDynamoDb,
+        "snapshot": DatabaseSnapshot,
+    }
+
+    # Provider instances are expensive to build (boto3 sessions, clients, connection pools),
+    # so they are created once per process and reused by all requests and warm Lambda invocations.
+    _instances: dict[str, DatabaseProvider] = {}
+    # reentrant: provider may request another shared provider while it is being built
+    _lock = threading.RLock()
+
+    @classmethod
+    def get_provider(cls, provider_name: str, cached: bool = False) -> DatabaseProvider:
         """Using "Strategy" pattern allows us to use multiple DB engines with easy switching
         :param provider_name: name of DB provider
-        :return: specific DatabaseProvider instance
+        :param cached: wrap provider with read-through tracking items cache
+        :return: shared DatabaseProvider instance
         """
-        providers = {
-            "dynamodb": DatabaseDynamoDb,
-        }
-        if provider_name not in providers:
+        if provider_name not in cls.providers:
             raise ValueError(f"Unknown provider: {provider_name}")
-        return providers[provider_name]()
+
+        instance_name = f"{provider_name}:cached" if cached else provider_name
+        instance = cls._instances.get(instance_name)
+        if instance is None:
+            with cls._lock:
+                # another thread could create the provider while we were waiting for the lock
+                instance = cls._instances.get(instance_name)
+                if instance is None:
+                    if cached:
+                        instance = CachedDatabase(cls.get_provider(provider_name))
+                    else:
+                        instance = cls.providers[provider_name]()
+                    cls._instances[instance_name] = instance
+        return instance
+
+    @classmethod
+    def reset(cls) -> None:
+        """Drop all shared provider instances, next get_provider() call will build them again"""
+        with cls._lock:
+            cls._instances.clear()
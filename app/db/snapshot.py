@@ -0,0 +1,157 @@
+import logging
+import sys
+import threading
+
+from app.api.models import ArticleItem, TrackingItem
+from app.conf.settings import settings
+from app.db.base import DatabaseProvider, stored_item
+from app.db.dynamodb import DatabaseDynamoDb, DatabaseException
+
+
+class ShipmentRecord:
+    """Compact in-memory shipment, articles are kept as tuples of validated values"""
+
+    __slots__ = ("tracking_number", "carrier", "sender_address", "receiver_address", "status",
+                 "articles", "content_hash")
+
+    def __init__(self, item: dict):
+        self.tracking_number = item["tracking_number"]
+        # few distinct carriers and statuses are shared by millions of shipments
+        self.carrier = sys.intern(item["carrier"])
+        self.status = sys.intern(item["status"])
+        self.sender_address = item["sender_address"]
+        self.receiver_address = item["receiver_address"]
+        # validate once on load, so reads can skip validation
+        self.articles = tuple(
+            (article.article_name, article.article_quantity, article.article_price, sys.intern(article.SKU))
+            for article in (ArticleItem(**article) for article in item.get("articles", []))
+        )
+        self.content_hash = item.get("content_hash")
+
+    def to_tracking_item(self, include_articles: bool = True) -> TrackingItem:
+        return TrackingItem.model_construct(
+            tracking_number=self.tracking_number,
+            carrier=self.carrier,
+            sender_address=self.sender_address,
+            receiver_address=self.receiver_address,
+            status=self.status,
+            articles=[
+                ArticleItem.model_construct(article_name=name, article_quantity=quantity,
+                                            article_price=price, SKU=sku)
+                for name, quantity, price, sku in self.articles
+            ] if include_articles else None,
+            content_hash=self.content_hash,
+        )
+
+
+class DatabaseSnapshot(DatabaseProvider):
+    """In-memory copy of the Tracking table, answers lookups without network round trips.
+
+    Snapshot is loaded with parallel Scan and refreshed in background every SNAPSHOT_REFRESH_INTERVAL seconds:
+    the refresh scans the whole table again, projected to keys and content hashes, and reloads changed items
+    with BatchGetItem. The projection only reduces transferred data, DynamoDB bills Scan by full item size, so every
+    refresh in every process costs as much read capacity as loading the whole table.
+    With SNAPSHOT_READ_THROUGH shipments missing in snapshot are read from DynamoDB and kept.
+    """
+
+    def __init__(self, source: DatabaseDynamoDb | None = None):
+        if source is None:
+            # imported here, factory module registers this provider
+            from app.db.factory import DatabaseFactory
+            source = DatabaseFactory.get_provider("dynamodb")
+        self.source = source
+        self.records: dict[tuple[str, str], ShipmentRecord] = {}
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.load()
+
+        interval = float(settings.SNAPSHOT_REFRESH_INTERVAL)
+        if interval > 0:
+            threading.Thread(target=self._refresh_loop, args=(interval,), name="snapshot-refresh",
+                             daemon=True).start()
+
+    def load(self) -> None:
+        """Load the whole table into memory"""
+        try:
+            records = {}
+            for item in self.source.scan_items(segments=int(settings.SNAPSHOT_SCAN_SEGMENTS)):
+                record = ShipmentRecord(item)
+                records[(record.tracking_number, record.carrier)] = record
+        except DatabaseException:
+            raise
+        except Exception as e:
+            raise DatabaseException(f"Snapshot loading failed: {e}")
+        self.records = records
+
+    def refresh(self) -> None:
+        """Reload only new and changed items, drop deleted ones, costs a full table Scan of read capacity"""
+        with self._refresh_lock:
+            seen = set()
+            changed = []
+            for item in self.source.scan_items(projection="tracking_number, carrier, content_hash",
+                                               segments=int(settings.SNAPSHOT_SCAN_SEGMENTS)):
+                key = (item["tracking_number"], item["carrier"])
+                seen.add(key)
+                record = self.records.get(key)
+                # items imported without content hash are always reloaded
+                if record is None or record.content_hash is None or record.content_hash != item.get("content_hash"):
+                    changed.append(key)
+
+            for key, item in self.source.batch_get(changed).items():
+                self.records[key] = ShipmentRecord(item)
+            for key in self.records.keys() - seen:
+                self.records.pop(key, None)
+
+    def _refresh_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.getLogger("trackapi").warning(f"Snapshot refresh failed: {e}")
+
+    def stop(self) -> None:
+        """Stop background refresh"""
+        self._stop.set()
+
+    def invalidate(self, tracking_number: str, carrier: str) -> None:
+        """Drop shipment from snapshot, next lookup reads it from DynamoDB (with SNAPSHOT_READ_THROUGH)"""
+        self.records.pop((tracking_number, carrier), None)
+
+    def get_tracking_item(self, tracking_number: str, carrier: str,
+                          include_articles: bool = True) -> TrackingItem | None:
+        """Search for tracking item by tracking number and carrier
+
+        :param tracking_number: requested tracking number
+        :param carrier: requested carrier
+        :param include_articles: return articles too
+        :return: TrackingItem or None
+        """
+        record = self.records.get((tracking_number, carrier))
+        if record is None and settings.SNAPSHOT_READ_THROUGH:
+            # whole item is read, so it can be kept in snapshot
+            tracking_item = self.source.get_tracking_item(tracking_number, carrier)
+            if tracking_item is not None:
+                record = ShipmentRecord(stored_item(tracking_item))
+                self.records[(tracking_number, carrier)] = record
+        return record.to_tracking_item(include_articles) if record is not None else None
+
+    def get_tracking_items(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], TrackingItem]:
+        """Bulk search for tracking items
+
+        :param keys: list of (tracking number, carrier)
+        :return: found TrackingItems by (tracking number, carrier), missing keys are omitted
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            record = self.records.get(key)
+            if record is not None:
+                found[key] = record.to_tracking_item()
+            else:
+                missing.append(key)
+        if missing and settings.SNAPSHOT_READ_THROUGH:
+            for key, tracking_item in self.source.get_tracking_items(missing).items():
+                self.records[key] = ShipmentRecord(stored_item(tracking_item))
+                found[key] = tracking_item
+        return found
@@ -1,9 +1,18 @@
 import os
+import logging
+import threading
 import time
-import json
 import functools
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import orjson
 import redis
 
+from app.api.models import WeatherItem
+from app.conf.concurrency import io_executor
+from app.conf.logging import is_lambda
+from app.conf.metrics import redis_seconds, upstream_errors_total, weather_cache_total
 from app.conf.settings import settings
 
 
@@ -12,15 +21,322 @@ redis_client = redis.Redis(host=settings.REDIS_HOST,
                            db=settings.REDIS_CACHE_DB)
 
 
-def cache_weather(expiration=settings.EXT_API_EXPIRATION):
-    """Caching decorator based on redis and key=zip:country
+class LocalCache:
+    """Thread-safe in-process LRU cache with TTL, used as first cache level in front of Redis"""
+
+    def __init__(self, max_size: int, ttl: float, max_entry_bytes: int):
+        """
+        :param max_size: maximum number of entries, least recently used entries are evicted
+        :param ttl: maximum entry lifetime in seconds
+        :param max_entry_bytes: entries with bigger serialized size are not stored
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def get(self, key: str):
+        """Return cached value or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value, size: int, ttl: float | None = None) -> None:
+        """Store value in cache
+
+        :param key: cache key
+        :param value: cached value
+        :param size: serialized value size in bytes
+        :param ttl: remaining lifetime of the value, entry never lives longer than cache TTL
+        """
+        if size > self.max_entry_bytes:
+            self.rejections += 1
+            return
+        ttl = self.ttl if ttl is None else min(self.ttl, ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.rejections = 0
+
+    def stats(self) -> dict:
+        """Cache size and hit ratio counters"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "rejections": self.rejections,
+            }
+
+
+weather_local_cache = LocalCache(max_size=int(settings.LOCAL_CACHE_SIZE),
+                                 ttl=float(settings.LOCAL_CACHE_TTL),
+                                 max_entry_bytes=int(settings.LOCAL_CACHE_MAX_ENTRY_BYTES))
+
+
+def is_running_in_tests() -> bool:
+    """Detect if the code is running inside pytest."""
+    return "PYTEST_CURRENT_TEST" in os.environ
+
+
+# Version of cached weather encoding, part of the key: after a deploy with a new encoding old entries are
+# not read, they just expire
+WEATHER_CACHE_VERSION = 2
+# Cached weather is a JSON array of WeatherItem values in this order
+WEATHER_FIELDS = ("wind", "temp", "city", "cloud", "description")
+
+
+@functools.lru_cache(maxsize=4)
+def region_rules(rules: str) -> dict[str, int]:
+    """Parse WEATHER_REGION_RULES, "DE:2,FR:2,*:0" -> {"DE": 2, "FR": 2, "*": 0}"""
+    parsed = {}
+    for rule in rules.split(","):
+        if not rule.strip():
+            continue
+        country_code, length = rule.split(":")
+        parsed[country_code.strip().upper()] = int(length)
+    return parsed
+
+
+def weather_region(zip_code: str, country_code: str) -> str:
+    """Part of the cache key identifying the area sharing one cached weather
+
+    :return: zip code prefix marked with "*" when WEATHER_REGION_RULES has a rule for the country, zip code otherwise
+    """
+    rules = region_rules(settings.WEATHER_REGION_RULES)
+    length = rules.get(country_code, rules.get("*", 0))
+    if length <= 0:
+        return zip_code
+    return zip_code.replace(" ", "").upper()[:length] + "*"
+
+
+def weather_cache_key(zip_code: str, country_code: str) -> str:
+    # We need to use country together with zip, because zip codes not unique between countries
+    return f"weather:v{WEATHER_CACHE_VERSION}:{weather_region(zip_code, country_code)}:{country_code}"
+
+
+def encode_weather(weather: WeatherItem) -> bytes:
+    return orjson.dumps([getattr(weather, field) for field in WEATHER_FIELDS])
+
+
+def decode_weather(value: bytes) -> WeatherItem:
+    # values are written from validated WeatherItem only
+    return WeatherItem.model_construct(**dict(zip(WEATHER_FIELDS, orjson.loads(value))))
+
+
+def get_cached_weather_many(locations: list[tuple[str, str]]) -> list[WeatherItem | None]:
+    """Read cached weather for many locations, local cache first and Redis for the rest in one round trip
+
+    :param locations: list of (zip code, country code)
+    :return: cached values in the same order, None for missing ones and for all Redis keys when Redis fails
+    """
+    if not locations or is_running_in_tests():
+        return [None] * len(locations)
+
+    keys = [weather_cache_key(*location) for location in locations]
+    results = [weather_local_cache.get(key) for key in keys]
+    missing = [index for index, result in enumerate(results) if result is None]
+    if len(missing) < len(keys):
+        weather_cache_total.inc(len(keys) - len(missing), result="local_hit")
+    if missing:
+        try:
+            with redis_seconds.time(operation="mget"):
+                values = redis_client.mget([keys[index] for index in missing])
+        except redis.RedisError:
+            # cache is only an optimization, missing locations are fetched one by one
+            upstream_errors_total.inc(upstream="redis", reason="mget")
+            values = [None] * len(missing)
+        for index, value in zip(missing, values):
+            if value:
+                results[index] = decode_weather(value)
+                weather_local_cache.set(keys[index], results[index], len(value))
+                weather_cache_total.inc(result="redis_hit")
+            else:
+                weather_cache_total.inc(result="miss")
+    return results
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution, followers wait for leader's result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+
+    def run(self, key: str, func):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
 
-    :param expiration: Expiration time in seconds. By default - 2 hours (7200 seconds) are cached.
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+weather_single_flight = SingleFlight()
+
+# keys refreshed in background by this process (stale-while-revalidate)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def acquire_redis_lock(cache_key: str):
+    """Try to take distributed lock for cache key refresh
+
+    :return: acquired lock, None if disabled or held by somebody else
+    """
+    if not settings.WEATHER_CACHE_LOCK:
+        return None
+    lock = redis_client.lock(f"lock:{cache_key}", timeout=float(settings.WEATHER_CACHE_LOCK_TIMEOUT))
+    return lock if lock.acquire(blocking=False) else None
+
+
+def release_redis_lock(lock) -> None:
+    if lock is None:
+        return
+    try:
+        lock.release()
+    except redis.exceptions.LockError:
+        # lock expired while function was running, another caller may already hold it
+        pass
+
+
+def wait_for_value(cache_key: str):
+    """Wait until lock holder stores the value, None if it did not happen during lock timeout"""
+    deadline = time.monotonic() + float(settings.WEATHER_CACHE_LOCK_TIMEOUT)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        cached_value = redis_client.get(cache_key)
+        if cached_value:
+            return decode_weather(cached_value)
+    return None
+
+
+def last_known_weather_key(cache_key: str) -> str:
+    return f"{cache_key}:last"
+
+
+def last_known_weather_ttl() -> int:
+    """Seconds the last known weather is kept, 0 when it is not used: only the hedged provider serves it"""
+    if settings.WEATHER_PROVIDER != "hedged":
+        return 0
+    return int(settings.WEATHER_LAST_KNOWN_TTL)
+
+
+def store_weather(cache_key: str, result: WeatherItem, expiration: int, hard_expiration: int) -> None:
+    serialized = encode_weather(result)
+    redis_client.setex(cache_key, hard_expiration, serialized)
+    last_known_ttl = last_known_weather_ttl()
+    if last_known_ttl > 0:
+        # written on cache misses and refreshes only, the extra round trip is small next to the API call
+        redis_client.set(last_known_weather_key(cache_key), serialized, ex=last_known_ttl)
+    weather_local_cache.set(cache_key, result, len(serialized), expiration)
+
+
+def get_last_known_weather(zip_code: str, country_code: str) -> WeatherItem | None:
+    """Last fetched weather of the location, kept for WEATHER_LAST_KNOWN_TTL after fresh value expired
+
+    :return: WeatherItem or None if unknown or Redis is unavailable
+    """
+    if is_running_in_tests() or last_known_weather_ttl() <= 0:
+        return None
+    try:
+        with redis_seconds.time(operation="get"):
+            value = redis_client.get(last_known_weather_key(weather_cache_key(zip_code, country_code)))
+    except redis.RedisError:
+        return None
+    return decode_weather(value) if value else None
+
+
+def refresh_weather(cache_key: str, load, expiration: int, hard_expiration: int) -> WeatherItem | None:
+    """Schedule single background refresh of stale cache entry.
+    Lambda freezes the process after the response is returned, so a background refresh might never run there:
+    the entry is refreshed before returning instead.
+
+    :return: refreshed weather when refreshed synchronously, None otherwise
+    """
+    with _refreshing_lock:
+        if cache_key in _refreshing:
+            return None
+        _refreshing.add(cache_key)
+
+    def refresh():
+        lock = None
+        try:
+            lock = acquire_redis_lock(cache_key)
+            if settings.WEATHER_CACHE_LOCK and lock is None:
+                # another worker or Lambda instance is refreshing this key
+                return None
+            result = load()
+            store_weather(cache_key, result, expiration, hard_expiration)
+            return result
+        except Exception as e:
+            logging.getLogger("trackapi").warning(f"Background refresh of {cache_key} failed: {e}")
+            return None
+        finally:
+            release_redis_lock(lock)
+            with _refreshing_lock:
+                _refreshing.discard(cache_key)
+
+    if is_lambda():
+        return refresh()
+    io_executor.submit(refresh)
+    return None
+
+
+def cache_weather(expiration=settings.WEATHER_CACHE_SOFT_TTL, hard_expiration=None):
+    """Two-level caching decorator of functions returning WeatherItem, in-process LRU in front of redis,
+    key=zip:country. Concurrent misses of the same key are coalesced into one function call.
+
+    :param expiration: Time in seconds the value is fresh. By default - 2 hours (7200 seconds) are cached.
+    :param hard_expiration: Time in seconds the value is kept in redis. After expiration and before hard expiration
+        the stale value is returned while exactly one caller refreshes it in background. By default - no stale values.
     """
 
-    def is_running_in_tests() -> bool:
-        """Detect if the code is running inside pytest."""
-        return "PYTEST_CURRENT_TEST" in os.environ
+    expiration = int(expiration)
+    hard_expiration = max(int(hard_expiration or 0), expiration)
 
     def decorator(func):
         @functools.wraps(func)
@@ -31,20 +347,58 @@ def cache_weather(expiration=settings.EXT_API_EXPIRATION):
             if is_running_in_tests():
                 return func(self, zip_code, country_code)
 
-            # We need to use country together with zip, because zip codes not unique between countries
-            cache_key = f"weather:{zip_code}:{country_code}"
+            cache_key = weather_cache_key(zip_code, country_code)
 
-            cached_value = redis_client.get(cache_key)
+            # Hot keys are served from process memory without network round trip
+            cached_value = weather_local_cache.get(cache_key)
+            if cached_value is not None:
+                weather_cache_total.inc(result="local_hit")
+                return cached_value
+
+            # Remaining TTL is read together with value, so local copy never outlives fresh redis entry
+            with redis_seconds.time(operation="get"):
+                pipeline = redis_client.pipeline(transaction=False)
+                pipeline.get(cache_key)
+                pipeline.pttl(cache_key)
+                cached_value, ttl_ms = pipeline.execute()
             if cached_value:
-                return json.loads(cached_value)
+                result = decode_weather(cached_value)
+                if ttl_ms < 0:
+                    # key without expiration, treat as fresh
+                    weather_cache_total.inc(result="redis_hit")
+                    weather_local_cache.set(cache_key, result, len(cached_value))
+                    return result
+                fresh_for = ttl_ms / 1000 - (hard_expiration - expiration)
+                if fresh_for > 0:
+                    weather_cache_total.inc(result="redis_hit")
+                    weather_local_cache.set(cache_key, result, len(cached_value), fresh_for)
+                else:
+                    weather_cache_total.inc(result="stale")
+                    result = refresh_weather(cache_key, lambda: func(self, zip_code, country_code),
+                                             expiration, hard_expiration) or result
+                return result
 
-            # No data in cache, call function
-            result = func(self, zip_code, country_code)
+            weather_cache_total.inc(result="miss")
 
-            # save function output in cache
-            redis_client.setex(cache_key, expiration, json.dumps(result))
+            def load():
+                lock = acquire_redis_lock(cache_key)
+                try:
+                    if settings.WEATHER_CACHE_LOCK and lock is None:
+                        # somebody else is calling the function for this key, wait for the value
+                        result = wait_for_value(cache_key)
+                        if result is not None:
+                            return result
 
-            return result
+                    # No data in cache, call function
+                    result = func(self, zip_code, country_code)
+
+                    # save function output in cache
+                    store_weather(cache_key, result, expiration, hard_expiration)
+                    return result
+                finally:
+                    release_redis_lock(lock)
+
+            return weather_single_flight.run(cache_key, load)
 
         return wrapper
 
@@ -0,0 +1,78 @@
+import functools
+
+
+# Common country names which are not present in ISO 3166 data as names or official names
+COUNTRY_ALIASES = {
+    "usa": "US",
+    "united states of america": "US",
+    "uk": "GB",
+    "great britain": "GB",
+    "england": "GB",
+    "scotland": "GB",
+    "wales": "GB",
+    "northern ireland": "GB",
+    "holland": "NL",
+    "russia": "RU",
+    "turkey": "TR",
+    "south korea": "KR",
+    "north korea": "KP",
+    "czech republic": "CZ",
+    "vietnam": "VN",
+    "iran": "IR",
+    "syria": "SY",
+    "laos": "LA",
+    "moldova": "MD",
+    "bolivia": "BO",
+    "venezuela": "VE",
+    "tanzania": "TZ",
+    "taiwan": "TW",
+    "macedonia": "MK",
+    "ivory coast": "CI",
+}
+
+
+@functools.cache
+def country_index() -> dict[str, str]:
+    """Case-insensitive index of country names, official names, common names, ISO codes and aliases
+    to alpha-2 code. Built once, on the first lookup (or on startup, see app.conf.warmup)."""
+    # country database is imported and loaded on demand, it is not needed to serve cached requests
+    import pycountry
+
+    index = {}
+    for country in pycountry.countries:
+        for name in (
+                country.alpha_2,
+                country.alpha_3,
+                country.name,
+                getattr(country, "official_name", None),
+                getattr(country, "common_name", None),
+        ):
+            if name:
+                index.setdefault(name.casefold(), country.alpha_2)
+    for alias, alpha_2 in COUNTRY_ALIASES.items():
+        index.setdefault(alias, alpha_2)
+    return index
+
+
+@functools.lru_cache(maxsize=1024)
+def search_country_code(country: str) -> str | None:
+    """Fuzzy search over the whole country database, slow, so results are memoized"""
+    import pycountry
+
+    try:
+        countries = pycountry.countries.search_fuzzy(country)
+    except LookupError:
+        return None
+    return countries[0].alpha_2 if countries else None
+
+
+def resolve_country_code(country: str) -> str | None:
+    """Resolve country name to alpha-2 code
+
+    :param country: country name, official name, alias or ISO code in any case
+    :return: alpha-2 country code or None if country is not found
+    """
+    country_code = country_index().get(country.strip().casefold())
+    if country_code is None:
+        country_code = search_country_code(country)
+    return country_code
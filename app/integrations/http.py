@@ -0,0 +1,173 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.conf.metrics import upstream_errors_total
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """HTTP session with keep-alive connection pool, shared between requests and threads
+
+    :param pool_size: maximum number of kept connections per host
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 10.0) -> float:
+    """Exponential backoff with full jitter
+
+    :param attempt: retry number, starting from 1
+    :param base: delay of the first retry in seconds
+    :param cap: maximum delay in seconds
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RateLimiter:
+    """Spaces calls evenly to at most `rate` calls per second, shared between threads"""
+
+    def __init__(self, rate: float):
+        """
+        :param rate: allowed calls per second, 0 - unlimited
+        """
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_call = time.monotonic()
+
+    def wait(self) -> None:
+        """Block until the next call is allowed"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            call_at = max(now, self._next_call)
+            self._next_call = call_at + self.interval
+        time.sleep(call_at - now)
+
+
+class LatencyTracker:
+    """Durations of recent successful calls, shared between threads"""
+
+    def __init__(self, window: int):
+        """
+        :param window: number of kept durations
+        """
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, share: float, min_samples: int = 20) -> float | None:
+        """Duration not exceeded by `share` of recent calls, None until `min_samples` calls are recorded"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+
+class CircuitBreaker:
+    """Stops calling failing upstream for a cool-down period.
+
+    After `failure_threshold` consecutive failures the breaker opens and calls are rejected
+    for `reset_timeout` seconds. Then a single trial call is allowed (half-open): success closes
+    the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def allow(self) -> bool:
+        """Check if the call may be sent to upstream"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        self.record_success()
+
+
+def call_upstream(upstream: str, breaker: CircuitBreaker, send: Callable[[], requests.Response],
+                  retries: int = 0, retry_backoff: float = 0.0) -> requests.Response:
+    """Send request to upstream and report the outcome to its circuit breaker.
+    429, 5xx responses and connection errors are retried, repeated failures open the circuit breaker.
+
+    :param upstream: upstream name in error metrics
+    :param breaker: circuit breaker of the upstream, the caller has already checked `allow()`
+    :param send: sends the request once
+    :param retries: number of retries after the first attempt
+    :param retry_backoff: delay of the first retry in seconds
+    :return: last response, error status is not raised
+    """
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            time.sleep(backoff_delay(attempt, retry_backoff))
+        try:
+            response = send()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            upstream_errors_total.inc(upstream=upstream,
+                                      reason="timeout" if isinstance(e, requests.Timeout) else "connection")
+            if attempt < retries:
+                continue
+            breaker.record_failure()
+            raise
+        except Exception:
+            # any other failure must release the half-open trial as well
+            upstream_errors_total.inc(upstream=upstream, reason="request")
+            breaker.record_failure()
+            raise
+        if response.status_code >= 400:
+            upstream_errors_total.inc(upstream=upstream, reason=str(response.status_code))
+        if response.status_code not in RETRY_STATUS_CODES:
+            break
+
+    if response.status_code in RETRY_STATUS_CODES:
+        breaker.record_failure()
+    else:
+        # client errors (e.g. unknown postal code) do not mean that upstream is down
+        breaker.record_success()
+    return response
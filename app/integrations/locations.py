@@ -0,0 +1,56 @@
+import redis
+
+from app.integrations.cache import redis_client
+
+
+class LocationIndex:
+    """Index of receiver locations (zip code, country code) by tracking key.
+
+    Filled by the shipments loader, it allows the weather lookup to start before the shipment
+    itself is loaded from the database.
+    """
+
+    key = "locations"
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    @staticmethod
+    def field(tracking_number: str, carrier: str) -> str:
+        return f"{tracking_number}:{carrier}"
+
+    def get_location(self, tracking_number: str, carrier: str) -> tuple[str, str] | None:
+        """Return indexed (zip code, country code) of the shipment receiver
+
+        :param tracking_number: tracking number
+        :param carrier: carrier
+        :return: (zip code, country code) or None if shipment is not indexed or index is unavailable
+        """
+        try:
+            value = self.client.hget(self.key, self.field(tracking_number, carrier))
+        except redis.RedisError:
+            # index is only an optimization, request falls back to sequential weather lookup
+            return None
+        if not value:
+            return None
+        zip_code, country_code = value.decode("utf-8").rsplit(":", 1)
+        return zip_code, country_code
+
+    def clear(self) -> None:
+        """Remove all indexed locations, used before full reload of the table"""
+        self.client.delete(self.key)
+
+    def put_locations(self, locations: dict[tuple[str, str], tuple[str, str]]) -> None:
+        """Bulk save receiver locations
+
+        :param locations: {(tracking_number, carrier): (zip code, country code)}
+        """
+        if not locations:
+            return
+        self.client.hset(self.key, mapping={
+            self.field(tracking_number, carrier): f"{zip_code}:{country_code}"
+            for (tracking_number, carrier), (zip_code, country_code) in locations.items()
+        })
+
+
+location_index = LocationIndex(redis_client)
@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+
+import pydantic
+import redis
+
+from app.api.models import StatusEvent
+from app.conf.metrics import status_events_total, upstream_errors_total
+from app.conf.settings import settings
+from app.integrations.cache import redis_client
+
+
+class Subscription:
+    """Status changes of subscribed shipments waiting to be sent to one client.
+
+    Only the latest change of every shipment is kept, so a slow client never accumulates a backlog.
+    Methods are called on the event loop of the client connection.
+    """
+
+    def __init__(self, keys: list[tuple[str, str]], loop: asyncio.AbstractEventLoop):
+        self.keys = keys
+        self.loop = loop
+        self.pending: dict[tuple[str, str], StatusEvent] = {}
+        self.resync = False
+        self.ready = asyncio.Event()
+
+    def push(self, event: StatusEvent) -> None:
+        self.pending[(event.tracking_number, event.carrier)] = event
+        self.ready.set()
+
+    def request_resync(self) -> None:
+        """Changes may have been missed, client should read current statuses again"""
+        self.resync = True
+        self.ready.set()
+
+    async def wait(self, timeout: float) -> tuple[list[StatusEvent], bool]:
+        """Wait for status changes
+
+        :param timeout: seconds to wait
+        :return: changes, empty on timeout, and whether statuses have to be read again
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return [], False
+        self.ready.clear()
+        events, self.pending = list(self.pending.values()), {}
+        resync, self.resync = self.resync, False
+        return events, resync
+
+
+class StatusBroadcaster:
+    """Shipment status changes over Redis pub/sub.
+
+    The loader publishes new shipments and changed statuses to STATUS_CHANNEL. Every worker process holds a single
+    subscription to the channel in a background thread and fans messages out to its clients by
+    subscribed (tracking number, carrier).
+    """
+
+    def __init__(self, client: redis.Redis, channel: str):
+        self.client = client
+        self.channel = channel
+        self._subscriptions: dict[tuple[str, str], set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._listener: threading.Thread | None = None
+
+    def publish(self, items: list[dict]) -> None:
+        """Publish current status of shipments in one round trip
+
+        :param items: shipments with tracking_number, carrier and status
+        """
+        if not items:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for item in items:
+            event = StatusEvent(tracking_number=item["tracking_number"], carrier=item["carrier"],
+                                status=item["status"])
+            pipeline.publish(self.channel, event.model_dump_json())
+        pipeline.execute()
+        status_events_total.inc(len(items), outcome="published")
+
+    def subscribe(self, keys: list[tuple[str, str]]) -> Subscription:
+        """Subscribe to status changes of shipments, must be called on the event loop of the client
+
+        :param keys: list of (tracking number, carrier)
+        :return: subscription, release it with unsubscribe
+        """
+        subscription = Subscription(keys, asyncio.get_running_loop())
+        with self._lock:
+            for key in keys:
+                self._subscriptions.setdefault(key, set()).add(subscription)
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for key in subscription.keys:
+                subscriptions = self._subscriptions.get(key)
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self._subscriptions[key]
+
+    def dispatch(self, data: bytes) -> None:
+        """Hand published status change to subscriptions of the shipment, called by the listener thread"""
+        try:
+            event = StatusEvent.model_validate_json(data)
+        except pydantic.ValidationError:
+            return
+        with self._lock:
+            subscriptions = list(self._subscriptions.get((event.tracking_number, event.carrier), ()))
+        for subscription in subscriptions:
+            with contextlib.suppress(RuntimeError):  # event loop of the client is already closed
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+        status_events_total.inc(outcome="received")
+
+    def resync(self) -> None:
+        """Ask all subscriptions to read current statuses, messages published while disconnected are lost"""
+        with self._lock:
+            subscriptions = {subscription for group in self._subscriptions.values() for subscription in group}
+        for subscription in subscriptions:
+            with contextlib.suppress(RuntimeError):
+                subscription.loop.call_soon_threadsafe(subscription.request_resync)
+
+    def start(self) -> None:
+        """Start listener thread on the first subscription"""
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="status-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self) -> None:
+        reconnected = False
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                if reconnected:
+                    self.resync()
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(message["data"])
+            except redis.RedisError as e:
+                upstream_errors_total.inc(upstream="redis", reason="pubsub")
+                logging.getLogger("trackapi").warning(f"Status channel subscription failed: {e}")
+            finally:
+                pubsub.close()
+            reconnected = True
+            time.sleep(float(settings.SUBSCRIPTION_RECONNECT_DELAY))
+
+
+status_broadcaster = StatusBroadcaster(redis_client, settings.STATUS_CHANNEL)
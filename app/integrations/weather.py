@@ -1,12 +1,27 @@
+import contextvars
+import functools
 import re
+import threading
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
-import pycountry
 from requests import HTTPError
 
 from app.api.models import WeatherItem
+from app.conf.metrics import (
+    openweathermap_seconds,
+    stage_seconds,
+    upstream_errors_total,
+    weather_hedge_total,
+    weatherbit_seconds,
+)
 from app.conf.settings import settings
-from app.integrations.cache import cache_weather
+from app.integrations.cache import cache_weather, get_cached_weather_many, get_last_known_weather
+from app.integrations.countries import resolve_country_code
+from app.integrations.http import CircuitBreaker, LatencyTracker, call_upstream, create_session
+
+ADDRESS_PATTERN = re.compile(r'^(.*?),\s*([\w\d-]+)\s+([\w\s-]+),\s*([\w\s-]+)$')
 
 
 class WeatherException(Exception):
@@ -15,6 +30,33 @@ class WeatherException(Exception):
     pass
 
 
+class WeatherUnavailableException(WeatherException):
+    """Weather API is considered down, calls are rejected without network requests."""
+
+    pass
+
+
+# Shared between all provider instances: keep-alive connections and failure statistics live for the whole process
+weatherbit_session = create_session(int(settings.WEATHERBIT_POOL_SIZE))
+weatherbit_breaker = CircuitBreaker(failure_threshold=int(settings.WEATHERBIT_BREAKER_THRESHOLD),
+                                    reset_timeout=float(settings.WEATHERBIT_BREAKER_RESET))
+weatherbit_latency = LatencyTracker(window=int(settings.WEATHER_HEDGE_WINDOW))
+
+openweathermap_session = create_session(int(settings.OPENWEATHERMAP_POOL_SIZE))
+openweathermap_breaker = CircuitBreaker(failure_threshold=int(settings.WEATHERBIT_BREAKER_THRESHOLD),
+                                        reset_timeout=float(settings.WEATHERBIT_BREAKER_RESET))
+openweathermap_latency = LatencyTracker(window=int(settings.WEATHER_HEDGE_WINDOW))
+
+# Runs provider calls of hedged lookups, callers are already in the I/O pool and wait here for the first answer
+hedge_executor = ThreadPoolExecutor(max_workers=int(settings.WEATHER_HEDGE_WORKERS),
+                                    thread_name_prefix="weather-hedge")
+
+# Weatherbit names of 16 compass points, OpenWeatherMap returns wind direction in degrees
+WIND_DIRECTIONS = ("north", "north-northeast", "northeast", "east-northeast", "east", "east-southeast",
+                   "southeast", "south-southeast", "south", "south-southwest", "southwest", "west-southwest",
+                   "west", "west-northwest", "northwest", "north-northwest")
+
+
 class WeatherProvider(ABC):
     """Abstract base class for weather providers."""
 
@@ -22,54 +64,173 @@ class WeatherProvider(ABC):
     def get_weather(self, receiver_address: str) -> WeatherItem:
         pass
 
+    @abstractmethod
+    def get_weather_by_location(self, zip_code: str, country_code: str) -> WeatherItem:
+        pass
 
-class WeatherbitWeatherProvider(WeatherProvider):
-    """Weathebit weather data provider"""
+    @staticmethod
+    @abstractmethod
+    def parse_address(receiver_address: str) -> tuple[str, str]:
+        pass
 
-    def __init__(self):
-        self.api_key = settings.WEATHERBIT_API_KEY
+    def get_cached_weather(self, locations: list[tuple[str, str]]) -> dict[tuple[str, str], WeatherItem]:
+        """Return weather for locations which are already cached, providers without cache return nothing
+
+        :param locations: list of (zip code, country code)
+        :return: WeatherItem by (zip code, country code)
+        """
+        return {}
+
+    def request_weather(self, zip_code: str, country_code: str) -> WeatherItem:
+        """Retrieve weather bypassing the cache, used by HedgedWeatherProvider. By default - cached lookup
+
+        :param zip_code: zip code
+        :param country_code: country code (2-letter code)
+        :return: WeatherItem structure
+        """
+        return self.get_weather_by_location(zip_code, country_code)
+
+
+class CachedWeatherProvider(WeatherProvider):
+    """Base class of providers with unified weather cached by location.
+
+    The cache key does not depend on the provider, so weather fetched by any provider is served to all of them.
+    Subclasses implement request_weather().
+    """
+
+    # durations of successful calls, used by HedgedWeatherProvider
+    latency: LatencyTracker | None = None
 
     @staticmethod
+    @functools.lru_cache(maxsize=int(settings.ADDRESS_CACHE_SIZE))
     def parse_address(receiver_address: str):
-        """Extract zip code and country code from normalized address string
+        """Extract zip code and country code from normalized address string.
+        Results are cached per address, so repeated addresses are resolved without any parsing.
 
         :param receiver_address:
         :return:
         """
 
-        pattern = r'^(.*?),\s*([\w\d-]+)\s+([\w\s-]+),\s*([\w\s-]+)$'
-        match = re.match(pattern, receiver_address)
+        match = ADDRESS_PATTERN.match(receiver_address)
 
         if match:
             street = match.group(1).strip()
             zip_code = match.group(2).strip()
             city = match.group(3).strip()
             country = match.group(4).strip()
-            country_codes = pycountry.countries.search_fuzzy(country)
-            if len(country_codes) > 0:
-                country_code = country_codes[0].alpha_2
+            country_code = resolve_country_code(country)
+            if country_code is not None:
                 return zip_code, country_code
             else:
                 raise WeatherException("Country not found")
         else:
             raise WeatherException("Invalid address format")
 
-    @cache_weather(expiration=settings.EXT_API_EXPIRATION)
+    @cache_weather(expiration=settings.WEATHER_CACHE_SOFT_TTL, hard_expiration=settings.WEATHER_CACHE_HARD_TTL)
+    def fetch_weather(self, zip_code: str, country_code: str) -> WeatherItem:
+        """Request weather of the location, only the unified item is cached
+
+        :param zip_code: requested zip code
+        :param country_code: requested country code (2-letter code)
+        :return: WeatherItem structure
+        """
+
+        return self.request_weather(zip_code, country_code)
+
+    @abstractmethod
+    def request_weather(self, zip_code: str, country_code: str) -> WeatherItem:
+        pass
+
+    def get_cached_weather(self, locations: list[tuple[str, str]]) -> dict[tuple[str, str], WeatherItem]:
+        """Return cached weather for many locations in one cache round trip
+
+        :param locations: list of (zip code, country code)
+        :return: WeatherItem by (zip code, country code)
+        """
+
+        return {
+            location: weather
+            for location, weather in zip(locations, get_cached_weather_many(locations))
+            if weather is not None
+        }
+
+    def get_weather(self, receiver_address: str) -> WeatherItem:
+        """Retrieve weather for receiver address
+
+        :param receiver_address: normalized address string
+        :return: WeatherItem structure
+        """
+
+        with stage_seconds.time(stage="parse_address"):
+            zip_code, country_code = self.parse_address(receiver_address)
+        return self.get_weather_by_location(zip_code, country_code)
+
+    def get_weather_by_location(self, zip_code: str, country_code: str) -> WeatherItem:
+        """Retrieve weather for already parsed location, from cache or provider API
+
+        :param zip_code: zip code
+        :param country_code: country code (2-letter code)
+        :return: WeatherItem structure
+        """
+
+        try:
+            return self.fetch_weather(zip_code, country_code)
+        except WeatherException:
+            raise
+        except (HTTPError, requests.ConnectionError, requests.Timeout):
+            raise WeatherException("Failed to fetch weather data")
+        except IndexError:
+            raise WeatherException("No data found")
+        except Exception as e:
+            raise WeatherException(f"Internal error")
+
+
+class WeatherbitWeatherProvider(CachedWeatherProvider):
+    """Weathebit weather data provider"""
+
+    def __init__(self):
+        self.api_key = settings.WEATHERBIT_API_KEY
+        self.session = weatherbit_session
+        self.breaker = weatherbit_breaker
+        self.latency = weatherbit_latency
+
     def call_weatherbit_api(self, zip_code: str, country_code: str) -> dict:
-        """Call Weatherbit API using requests.
+        """Call Weatherbit API using shared requests session.
+        429, 5xx responses and connection errors are retried, repeated failures open the circuit breaker.
 
         :param zip_code: requested zip code
         :param country_code: requested country code (2-letter code)
         :return: JSON response from Weatherbit API
         """
 
-        response = requests.get(
-            settings.WEATHERBIT_API_URL,
-            params={"postal_code": zip_code, "country": country_code, "key": self.api_key}
-        )
+        if not self.breaker.allow():
+            upstream_errors_total.inc(upstream="weatherbit", reason="circuit_open")
+            raise WeatherUnavailableException("Weather API is unavailable")
+
+        def send() -> requests.Response:
+            with weatherbit_seconds.time():
+                return self.session.get(
+                    settings.WEATHERBIT_API_URL,
+                    params={"postal_code": zip_code, "country": country_code, "key": self.api_key},
+                    timeout=(float(settings.WEATHERBIT_CONNECT_TIMEOUT), float(settings.WEATHERBIT_READ_TIMEOUT)),
+                )
+
+        response = call_upstream("weatherbit", self.breaker, send, retries=int(settings.WEATHERBIT_RETRIES),
+                                 retry_backoff=float(settings.WEATHERBIT_RETRY_BACKOFF))
         response.raise_for_status()
         return response.json()
 
+    def request_weather(self, zip_code: str, country_code: str) -> WeatherItem:
+        """Call Weatherbit API and unify the response
+
+        :param zip_code: requested zip code
+        :param country_code: requested country code (2-letter code)
+        :return: WeatherItem structure
+        """
+
+        weatherbit_json = self.call_weatherbit_api(zip_code, country_code)
+        return WeatherbitWeatherProvider.unify_weatherbit_data(weatherbit_json["data"][0])
+
     @staticmethod
     def unify_weatherbit_data(weatherbit_data: dict) -> WeatherItem:
         """Unify weather data from Weatherbit to make compatible across all Weather providers"""
@@ -82,37 +243,196 @@ class WeatherbitWeatherProvider(WeatherProvider):
             description=weatherbit_data["weather"]["description"],
         )
 
-    def get_weather(self, receiver_address: str) -> WeatherItem:
-        """Retrieve weather using Weatherbit API
 
-        :param receiver_address: normalized address string
+class OpenWeatherMapWeatherProvider(CachedWeatherProvider):
+    """OpenWeatherMap current weather provider, secondary provider of hedged lookups"""
+
+    def __init__(self):
+        self.api_key = settings.OPENWEATHERMAP_API_KEY
+        self.session = openweathermap_session
+        self.breaker = openweathermap_breaker
+        self.latency = openweathermap_latency
+
+    def call_openweathermap_api(self, zip_code: str, country_code: str) -> dict:
+        """Call OpenWeatherMap API once, hedged lookup does not wait for retries of the secondary provider
+
+        :param zip_code: requested zip code
+        :param country_code: requested country code (2-letter code)
+        :return: JSON response from OpenWeatherMap API
+        """
+
+        if not self.breaker.allow():
+            upstream_errors_total.inc(upstream="openweathermap", reason="circuit_open")
+            raise WeatherUnavailableException("Weather API is unavailable")
+
+        def send() -> requests.Response:
+            with openweathermap_seconds.time():
+                return self.session.get(
+                    settings.OPENWEATHERMAP_API_URL,
+                    params={"zip": f"{zip_code},{country_code}", "appid": self.api_key, "units": "metric"},
+                    timeout=float(settings.OPENWEATHERMAP_TIMEOUT),
+                )
+
+        response = call_upstream("openweathermap", self.breaker, send)
+        response.raise_for_status()
+        return response.json()
+
+    def request_weather(self, zip_code: str, country_code: str) -> WeatherItem:
+        """Call OpenWeatherMap API and unify the response
+
+        :param zip_code: requested zip code
+        :param country_code: requested country code (2-letter code)
+        :return: WeatherItem structure
+        """
+
+        return OpenWeatherMapWeatherProvider.unify_openweathermap_data(
+            self.call_openweathermap_api(zip_code, country_code)
+        )
+
+    @staticmethod
+    def unify_openweathermap_data(openweathermap_data: dict) -> WeatherItem:
+        """Unify weather data from OpenWeatherMap to make compatible across all Weather providers"""
+
+        description = openweathermap_data["weather"][0]["description"]
+        return WeatherItem(
+            wind=WIND_DIRECTIONS[int(openweathermap_data["wind"]["deg"] % 360 / 22.5 + 0.5) % 16],
+            temp=openweathermap_data["main"]["temp"],
+            city=openweathermap_data["name"],
+            cloud=openweathermap_data["clouds"]["all"],
+            description=description[:1].upper() + description[1:],
+        )
+
+
+class HedgedWeatherProvider(CachedWeatherProvider):
+    """Composite provider asking several weather providers for the same location.
+
+    Providers are asked in order of preference. The next one is asked when the previous one failed
+    (failover) or has not answered within WEATHER_HEDGE_PERCENTILE of its recent latencies (hedge), the
+    first successful answer wins and is cached. When all providers fail, the last known weather of the
+    location is served.
+    """
+
+    def __init__(self, providers: list[CachedWeatherProvider] | None = None):
+        """
+        :param providers: providers in order of preference, WEATHER_HEDGE_PROVIDERS by default
+        """
+        if providers is None:
+            names = [name.strip() for name in settings.WEATHER_HEDGE_PROVIDERS.split(",") if name.strip()]
+            if "hedged" in names:
+                raise ValueError("Hedged provider can not include itself")
+            providers = [WeatherServiceFactory.get_provider(name) for name in names]
+        if not providers:
+            raise ValueError("Hedged provider needs at least one provider")
+        self.providers = providers
+
+    @staticmethod
+    def hedge_delay(provider: WeatherProvider) -> float:
+        """Seconds to wait for the provider before asking the next one"""
+        latency = getattr(provider, "latency", None)
+        delay = latency.percentile(float(settings.WEATHER_HEDGE_PERCENTILE)) if latency is not None else None
+        if delay is None:
+            return float(settings.WEATHER_HEDGE_DELAY)
+        return min(max(delay, float(settings.WEATHER_HEDGE_MIN_DELAY)), float(settings.WEATHER_HEDGE_MAX_DELAY))
+
+    @staticmethod
+    def timed_request(provider: WeatherProvider, zip_code: str, country_code: str) -> WeatherItem:
+        started = time.perf_counter()
+        result = provider.request_weather(zip_code, country_code)
+        latency = getattr(provider, "latency", None)
+        if latency is not None:
+            latency.record(time.perf_counter() - started)
+        return result
+
+    def submit(self, provider: WeatherProvider, zip_code: str, country_code: str):
+        # own copy of request context per call: metrics of the request are recorded from hedge threads too
+        context = contextvars.copy_context()
+        return hedge_executor.submit(context.run, self.timed_request, provider, zip_code, country_code)
+
+    def request_weather(self, zip_code: str, country_code: str) -> WeatherItem:
+        """Return the first successful answer of the providers, slower calls are left to finish in background
+
+        :param zip_code: requested zip code
+        :param country_code: requested country code (2-letter code)
         :return: WeatherItem structure
         """
 
-        zip_code, country_code = WeatherbitWeatherProvider.parse_address(receiver_address)
+        waiting = list(self.providers)
+        provider = waiting.pop(0)
+        running = {self.submit(provider, zip_code, country_code): provider}
+        delay = self.hedge_delay(provider)
+        while running:
+            done, _ = wait(running, timeout=delay if waiting else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # nobody answered in time, ask the next provider without cancelling the running calls
+                weather_hedge_total.inc(result="hedged")
+                provider = waiting.pop(0)
+                running[self.submit(provider, zip_code, country_code)] = provider
+                delay = self.hedge_delay(provider)
+                continue
+            for future in done:
+                answered = running.pop(future)
+                if future.exception() is None:
+                    if answered is not self.providers[0]:
+                        weather_hedge_total.inc(result="secondary_won")
+                    return future.result()
+            if not running and waiting:
+                weather_hedge_total.inc(result="failover")
+                provider = waiting.pop(0)
+                running[self.submit(provider, zip_code, country_code)] = provider
+                delay = self.hedge_delay(provider)
+        raise WeatherException("Failed to fetch weather data")
+
+    def get_weather_by_location(self, zip_code: str, country_code: str) -> WeatherItem:
+        """Retrieve weather from cache or the fastest provider, the last known weather if all providers fail
+
+        :param zip_code: zip code
+        :param country_code: country code (2-letter code)
+        :return: WeatherItem structure
+        """
 
         try:
-            weatherbit_json = self.call_weatherbit_api(zip_code, country_code)
-            weatherbit_data = weatherbit_json["data"][0]
-            return WeatherbitWeatherProvider.unify_weatherbit_data(weatherbit_data)
-        except HTTPError:
-            raise WeatherException("Failed to fetch weather data")
-        except IndexError:
-            raise WeatherException("No data found")
-        except Exception as e:
-            raise WeatherException(f"Internal error")
+            return super().get_weather_by_location(zip_code, country_code)
+        except WeatherException:
+            last_known = get_last_known_weather(zip_code, country_code)
+            if last_known is None:
+                raise
+            weather_hedge_total.inc(result="last_known")
+            return last_known
 
 
 class WeatherServiceFactory:
     """Factory class to create weather providers"""
 
-    @staticmethod
-    def get_provider(provider_name: str) -> WeatherProvider:
-        """Get weather provider by provider name"""
+    providers = {
+        "weatherbit": WeatherbitWeatherProvider,
+        "openweathermap": OpenWeatherMapWeatherProvider,
+        "hedged": HedgedWeatherProvider,
+    }
 
-        providers = {
-            "weatherbit": WeatherbitWeatherProvider,
-        }
-        if provider_name not in providers:
+    # Provider instances are created once per process and reused by all requests and warm Lambda invocations,
+    # so the warm-up builds the same provider (and hedged providers) that requests use
+    _instances: dict[str, WeatherProvider] = {}
+    # reentrant: hedged provider requests its providers while it is being built
+    _lock = threading.RLock()
+
+    @classmethod
+    def get_provider(cls, provider_name: str) -> WeatherProvider:
+        """Get shared weather provider by provider name"""
+
+        if provider_name not in cls.providers:
             raise ValueError(f"Unknown provider: {provider_name}")
-        return providers[provider_name]()
+        instance = cls._instances.get(provider_name)
+        if instance is None:
+            with cls._lock:
+                # another thread could create the provider while we were waiting for the lock
+                instance = cls._instances.get(provider_name)
+                if instance is None:
+                    instance = cls.providers[provider_name]()
+                    cls._instances[provider_name] = instance
+        return instance
+
+    @classmethod
+    def reset(cls) -> None:
+        """Drop all shared provider instances, next get_provider() call will build them again"""
+        with cls._lock:
+            cls._instances.clear()
@@ -1,46 +1,368 @@
+import argparse
 import csv
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
 
+import orjson
+import redis
+
+from app.db.cache import invalidate_tracking_items
 from app.db.dynamodb import DatabaseDynamoDb
 from app.conf.settings import settings
+from app.integrations.locations import location_index
+from app.integrations.notifications import status_broadcaster
+from app.integrations.weather import WeatherbitWeatherProvider, WeatherException
+
+ARTICLE_FIELDS = ("article_name", "article_quantity", "article_price", "SKU")
+BATCH_WRITE_SIZE = DatabaseDynamoDb.batch_write_size
 
 
-def load_shipments_from_csv(csv_filename):
-    """Load shipments from csv file
+def index_locations(items: list) -> None:
+    """Save receiver locations of loaded shipments, used to prefetch weather in tracking requests
 
-    :param csv_filename: csv file path with shipments
+    :param items: list of tracking items
     """
+    locations = {}
+    for item in items:
+        try:
+            locations[(item["tracking_number"], item["carrier"])] = \
+                WeatherbitWeatherProvider.parse_address(item["receiver_address"])
+        except WeatherException:
+            # shipment is still served, weather is looked up after database query
+            continue
+    location_index.put_locations(locations)
 
-    database = DatabaseDynamoDb()
-    database.create_tracking_table()
+
+def clear_locations() -> None:
+    """Drop receiver locations of the replaced table, they are indexed again when WEATHER_PREFETCH is enabled"""
+    try:
+        location_index.clear()
+    except redis.RedisError as e:
+        # API checks indexed locations against shipment address, stale entries only cost a wasted lookup
+        print(f"Receiver locations index was not cleared: {e}")
+
+
+def row_key(row: dict) -> tuple[str, str]:
+    return row["tracking_number"], row["carrier"]
+
+
+def read_rows(csv_filename: str) -> Iterator[dict]:
     with open(csv_filename, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        items = {}
-        for row in reader:
-            key = (row["tracking_number"], row["carrier"])
-            if key not in items:
-                items[key] = {
-                    "tracking_number": row['tracking_number'],
-                    "carrier": row['carrier'],
-                    "sender_address": row['sender_address'],
-                    "receiver_address": row['receiver_address'],
-                    "status": row['status'],
-                    "articles": [{
-                        "article_name": row['article_name'],
-                        "article_quantity": row['article_quantity'],
-                        "article_price": row['article_price'],
-                        "SKU": row['SKU']
-                    }]
-                }
-            else:
-                items[key]["articles"].append({
-                    "article_name": row['article_name'],
-                    "article_quantity": row['article_quantity'],
-                    "article_price": row['article_price'],
-                    "SKU": row['SKU']
-                })
-        database.put_tracking_items([value for key, value in items.items()])
-        print('Items uploaded in table')
+        yield from csv.DictReader(csvfile)
+
+
+def sort_rows(rows: Iterable[dict], chunk_rows: int) -> Iterator[dict]:
+    """External sort of rows by (tracking_number, carrier) with bounded memory.
+
+    Chunks of `chunk_rows` rows are sorted in memory and spilled into temporary files, then merged.
+    Sorting is stable, so articles keep their order from the file.
+    """
+    with tempfile.TemporaryDirectory(prefix="shipments-") as spill_dir:
+        chunk_files = []
+        for chunk_number, chunk in enumerate(batched(rows, chunk_rows)):
+            chunk.sort(key=row_key)
+            chunk_filename = os.path.join(spill_dir, f"{chunk_number}.csv")
+            with open(chunk_filename, "w", newline="", encoding="utf-8") as chunk_file:
+                writer = csv.DictWriter(chunk_file, fieldnames=list(chunk[0].keys()))
+                writer.writeheader()
+                writer.writerows(chunk)
+            chunk_files.append(chunk_filename)
+
+        yield from heapq.merge(*[read_rows(chunk_filename) for chunk_filename in chunk_files], key=row_key)
+
+
+def group_items(rows: Iterable[dict]) -> Iterator[dict]:
+    """Build tracking items from rows sorted (or at least grouped) by (tracking_number, carrier)"""
+    for key, group in itertools.groupby(rows, key=row_key):
+        first = next(group)
+        yield {
+            "tracking_number": first['tracking_number'],
+            "carrier": first['carrier'],
+            "sender_address": first['sender_address'],
+            "receiver_address": first['receiver_address'],
+            "status": first['status'],
+            "articles": [{field: row[field] for field in ARTICLE_FIELDS} for row in itertools.chain([first], group)]
+        }
+
+
+def digest(value) -> str:
+    return hashlib.blake2b(orjson.dumps(value, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def with_hashes(item: dict) -> dict:
+    """Add content hashes to the item, incremental import compares them with stored ones.
+
+    content_hash covers the whole item, details_hash everything except status, so status-only
+    changes are detected and written with UpdateItem.
+    """
+    details = {key: value for key, value in item.items() if key != "status"}
+    item["content_hash"] = digest(item)
+    item["details_hash"] = digest(details)
+    return item
+
+
+def diff_items(database: DatabaseDynamoDb, items: list) -> tuple[list, list, int, list]:
+    """Compare items with stored content hashes
+
+    :return: new or changed items, items with changed status only, number of unchanged items,
+        new items and items with changed status (with or without other changes)
+    """
+    stored = database.get_content_hashes([(item["tracking_number"], item["carrier"]) for item in items])
+    changed, status_changed, unchanged, new_status = [], [], 0, []
+    for item in items:
+        stored_item = stored.get((item["tracking_number"], item["carrier"]))
+        if stored_item is None or stored_item.get("details_hash") != item["details_hash"]:
+            changed.append(item)
+            if stored_item is None or stored_item.get("status") != item["status"]:
+                new_status.append(item)
+        elif stored_item.get("content_hash") != item["content_hash"]:
+            status_changed.append(item)
+            new_status.append(item)
+        else:
+            unchanged += 1
+    return changed, status_changed, unchanged, new_status
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Progress:
+    """Thread-safe counters with periodic rows/s report"""
+
+    def __init__(self, report_interval: float = 5.0):
+        self.report_interval = report_interval
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.rows = 0
+        self.written = 0
+        self.updated = 0
+        self.unchanged = 0
+        self._lock = threading.Lock()
+
+    def add_rows(self, count: int) -> None:
+        with self._lock:
+            self.rows += count
+
+    def add_items(self, written: int, updated: int = 0, unchanged: int = 0) -> None:
+        with self._lock:
+            self.written += written
+            self.updated += updated
+            self.unchanged += unchanged
+            now = time.monotonic()
+            if now - self.reported >= self.report_interval:
+                self.reported = now
+                self.report()
+
+    def report(self) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        print(f"Rows read: {self.rows} ({self.rows / elapsed:.0f} rows/s), items written: {self.written}, "
+              f"status updated: {self.updated}, unchanged: {self.unchanged}")
+
+
+class Checkpoint:
+    """Resume point of incremental import.
+
+    Items are imported in (tracking_number, carrier) order, the checkpoint keeps the last key up to which
+    all items are imported. Batches finished out of order by parallel workers are tracked until the gap is filled.
+    """
+
+    def __init__(self, csv_filename: str, save_interval: float = 5.0):
+        self.path = f"{csv_filename}.checkpoint"
+        stat = os.stat(csv_filename)
+        # checkpoint is valid only for the same version of the file
+        self.source = {"size": stat.st_size, "mtime": stat.st_mtime}
+        self.save_interval = save_interval
+        self.last_key: tuple[str, str] | None = None
+        self._finished: dict[int, tuple[str, str]] = {}
+        self._next_sequence = 0
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def load(self) -> tuple[str, str] | None:
+        """Return last imported key of previous interrupted import of the same file"""
+        try:
+            with open(self.path, encoding="utf-8") as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except (OSError, ValueError):
+            return None
+        if state.get("source") != self.source or not state.get("last_key"):
+            return None
+        self.last_key = tuple(state["last_key"])
+        return self.last_key
+
+    def finish(self, sequence: int, last_key: tuple[str, str]) -> None:
+        """Mark batch with given sequence number as imported"""
+        with self._lock:
+            self._finished[sequence] = last_key
+            while self._next_sequence in self._finished:
+                self.last_key = self._finished.pop(self._next_sequence)
+                self._next_sequence += 1
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def _save(self) -> None:
+        self._saved_at = time.monotonic()
+        if self.last_key is None:
+            return
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as checkpoint_file:
+            json.dump({"source": self.source, "last_key": list(self.last_key)}, checkpoint_file)
+        os.replace(temporary_path, self.path)
+
+    def remove(self) -> None:
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class ParallelWriter:
+    """Write tracking items with several BatchWriteItem workers.
+
+    Number of batches waiting for a worker is bounded, so reading the file never runs ahead of writing.
+    In incremental mode only new or changed items are written, status-only changes use UpdateItem.
+    """
+
+    def __init__(self, database: DatabaseDynamoDb, workers: int, progress: Progress,
+                 incremental: bool = False, checkpoint: Checkpoint | None = None):
+        self.database = database
+        self.progress = progress
+        self.incremental = incremental
+        self.checkpoint = checkpoint
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loader")
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.sequence = 0
+        self.error: Exception | None = None
+
+    def write(self, items: list) -> None:
+        if self.error is not None:
+            raise self.error
+        self.slots.acquire()
+        future = self.executor.submit(self._write, self.sequence, items)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.sequence += 1
+
+    def _write(self, sequence: int, items: list) -> None:
+        try:
+            last_key = row_key(items[-1])
+            status_changed, unchanged = [], 0
+            # full reload rewrites every shipment, subscribers are notified only when asked for
+            new_status = items if settings.STATUS_NOTIFICATIONS_FULL_RELOAD else []
+            if self.incremental:
+                items, status_changed, unchanged, new_status = diff_items(self.database, items)
+
+            if items:
+                self.database.write_tracking_items(items, max_retries=int(settings.LOADER_MAX_RETRIES))
+                if settings.WEATHER_PREFETCH:
+                    try:
+                        index_locations(items)
+                    except redis.RedisError as e:
+                        # shipments are written, their weather is looked up after database query
+                        print(f"Receiver locations were not indexed: {e}")
+            for item in status_changed:
+                self.database.update_tracking_status(
+                    item["tracking_number"], item["carrier"], item["status"], item["content_hash"],
+                    max_retries=int(settings.LOADER_MAX_RETRIES),
+                )
+            if settings.TRACKING_CACHE and (items or status_changed):
+                # cached copies in API workers would serve outdated shipments until their TTL
+                try:
+                    invalidate_tracking_items([row_key(item) for item in items + status_changed])
+                except redis.RedisError as e:
+                    print(f"Cached shipments were not invalidated, they expire after TRACKING_CACHE_TTL: {e}")
+            if settings.STATUS_NOTIFICATIONS and new_status:
+                try:
+                    status_broadcaster.publish(new_status)
+                except redis.RedisError as e:
+                    # subscribers read current statuses again when their stream reconnects
+                    print(f"Status changes were not published: {e}")
+
+            self.progress.add_items(len(items), len(status_changed), unchanged)
+            if self.checkpoint is not None:
+                self.checkpoint.finish(sequence, last_key)
+        except Exception as e:
+            self.error = e
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+        if self.error is not None:
+            raise self.error
+
+
+def load_shipments_from_csv(csv_filename, presorted=False, workers=None, incremental=False):
+    """Load shipments from csv file, streaming with constant memory usage
+
+    :param csv_filename: csv file path with shipments, one row per article
+    :param presorted: rows are already sorted by (tracking_number, carrier), skip sorting
+    :param workers: number of parallel writers, LOADER_WORKERS by default
+    :param incremental: keep the table and write only new or changed items, interrupted import is resumed
+    """
+
+    database = DatabaseDynamoDb()
+    checkpoint = None
+    resume_key = None
+    if incremental:
+        database.ensure_tracking_table()
+        checkpoint = Checkpoint(csv_filename)
+        resume_key = checkpoint.load()
+        if resume_key:
+            print(f"Resuming import after {resume_key}")
+    else:
+        database.create_tracking_table()
+        clear_locations()
+
+    progress = Progress()
+    writer = ParallelWriter(database, int(workers or settings.LOADER_WORKERS), progress,
+                            incremental=incremental, checkpoint=checkpoint)
+
+    def counted_rows():
+        for row in read_rows(csv_filename):
+            progress.add_rows(1)
+            yield row
+
+    rows = counted_rows()
+    if not presorted:
+        rows = sort_rows(rows, int(settings.LOADER_CHUNK_ROWS))
+    items = (with_hashes(item) for item in group_items(rows))
+    if resume_key:
+        items = itertools.dropwhile(lambda item: row_key(item) <= resume_key, items)
+
+    try:
+        for batch in batched(items, BATCH_WRITE_SIZE):
+            writer.write(batch)
+    finally:
+        writer.close()
+
+    if checkpoint is not None:
+        checkpoint.remove()
+    progress.report()
+    print('Items uploaded in table')
 
 
 if __name__ == "__main__":
-    load_shipments_from_csv("/app/data/shipments.csv")
+    parser = argparse.ArgumentParser(description="Load shipments from csv file into DynamoDB")
+    parser.add_argument("csv_filename", nargs="?", default="/app/data/shipments.csv")
+    parser.add_argument("--presorted", action="store_true",
+                        help="rows are already sorted by tracking_number and carrier")
+    parser.add_argument("--workers", type=int, default=None, help="number of parallel writers")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep existing table and write only new or changed shipments, resume interrupted import")
+    args = parser.parse_args()
+    load_shipments_from_csv(args.csv_filename, presorted=args.presorted, workers=args.workers,
+                            incremental=args.incremental)
@@ -1,7 +1,22 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from mangum import Mangum
 
-from app.api import tracking
+from app.api import metrics, subscriptions, tracking
+from app.conf.concurrency import run_blocking
+from app.conf.logging import is_lambda
+from app.conf.metrics import MetricsMiddleware
+from app.conf.settings import settings
+from app.conf.warmup import warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # providers live for the whole process, nothing to release on shutdown
+    if settings.WARMUP_ON_STARTUP:
+        await run_blocking(warm_up)
+    yield
 
 
 # Main FastAPI object initialization
@@ -9,11 +24,19 @@ app = FastAPI(
     title="Track and Trace API",
     description="Track your shipment and local weather",
     version="0.0.1",
+    lifespan=lifespan,
 )
 
 # API routers
 app.include_router(tracking.router)
+if settings.STATUS_NOTIFICATIONS:
+    app.include_router(subscriptions.router)
+if settings.METRICS_ENDPOINT:
+    app.include_router(metrics.router)
+
+# Request timings, in lambda metrics are written as Embedded Metric Format documents to the function log
+app.add_middleware(MetricsMiddleware, emit_emf=settings.METRICS_EMF or is_lambda())
 
 
-# Mangum Adapter for AWS Lambda
-handler = Mangum(app, lifespan="off")
+# Mangum Adapter for AWS Lambda, lifespan warms up providers on the first invocation
+handler = Mangum(app, lifespan="auto")
@@ -0,0 +1,146 @@
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.conf.settings import settings
+from app.db.dynamodb import DatabaseDynamoDb
+from app.integrations.cache import redis_client, store_weather, weather_cache_key
+from app.integrations.http import RateLimiter
+from app.integrations.weather import (
+    WeatherbitWeatherProvider,
+    WeatherException,
+    WeatherUnavailableException,
+)
+
+PTTL_BATCH_SIZE = 1000
+
+
+def collect_locations(database: DatabaseDynamoDb) -> set[tuple[str, str]]:
+    """Receiver locations of shipments which are not finished yet, read with a full table Scan
+
+    :return: set of (zip code, country code)
+    """
+    skip_statuses = {status.strip() for status in settings.WEATHER_WARMER_SKIP_STATUSES.split(",") if status.strip()}
+    locations = set()
+    for item in database.scan_items(projection="receiver_address, #status",
+                                    segments=int(settings.SNAPSHOT_SCAN_SEGMENTS)):
+        if item.get("status") in skip_statuses:
+            continue
+        try:
+            locations.add(WeatherbitWeatherProvider.parse_address(item["receiver_address"]))
+        except WeatherException:
+            continue
+    return locations
+
+
+def expiring_locations(locations: set[tuple[str, str]], margin: int) -> list[tuple[str, str]]:
+    """Locations with weather missing in cache or fresh for less than `margin` seconds, soonest expiring first.
+    Locations sharing one cache key (WEATHER_REGION_RULES) are refreshed once.
+    """
+    expiration = int(settings.WEATHER_CACHE_SOFT_TTL)
+    stale_window = max(int(settings.WEATHER_CACHE_HARD_TTL), expiration) - expiration
+    by_key = {}
+    for location in sorted(locations):
+        by_key.setdefault(weather_cache_key(*location), location)
+    locations = list(by_key.values())
+    expiring = []
+    for start in range(0, len(locations), PTTL_BATCH_SIZE):
+        batch = locations[start:start + PTTL_BATCH_SIZE]
+        pipeline = redis_client.pipeline(transaction=False)
+        for location in batch:
+            pipeline.pttl(weather_cache_key(*location))
+        for location, ttl_ms in zip(batch, pipeline.execute()):
+            if ttl_ms == -1:
+                # key without expiration is never refreshed by requests either
+                continue
+            fresh_for = -1 if ttl_ms < 0 else ttl_ms / 1000 - stale_window
+            if fresh_for < margin:
+                expiring.append((fresh_for, location))
+    return [location for _, location in sorted(expiring)]
+
+
+class WeatherWarmer:
+    """Refresh cached weather of locations with bounded concurrency and API call rate.
+
+    Calls go through the provider session and circuit breaker, when the breaker opens the rest of
+    the locations is skipped until the next run.
+    """
+
+    def __init__(self, provider: WeatherbitWeatherProvider, workers: int, rate: float):
+        self.provider = provider
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {"refreshed": 0, "failed": 0, "skipped": 0}
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def refresh(self, location: tuple[str, str]) -> None:
+        if self.stopped.is_set():
+            self.count("skipped")
+            return
+        self.limiter.wait()
+        try:
+            weatherbit_json = self.provider.call_weatherbit_api(*location)
+            weather = WeatherbitWeatherProvider.unify_weatherbit_data(weatherbit_json["data"][0])
+            store_weather(weather_cache_key(*location), weather, int(settings.WEATHER_CACHE_SOFT_TTL),
+                          max(int(settings.WEATHER_CACHE_HARD_TTL), int(settings.WEATHER_CACHE_SOFT_TTL)))
+        except WeatherUnavailableException:
+            self.stopped.set()
+            self.count("skipped")
+            return
+        except Exception:
+            # API and Redis errors fail this location only, the run goes on and reports its statistics
+            self.count("failed")
+            return
+        self.count("refreshed")
+
+    def warm(self, locations: list[tuple[str, str]]) -> dict:
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="warmer") as executor:
+            list(executor.map(self.refresh, locations))
+        return self.stats
+
+
+def warm_weather_cache(max_calls=None, workers=None, rate=None, margin=None) -> dict:
+    """Refresh cached weather of active shipments before it expires
+
+    :param max_calls: maximum number of API calls in this run, WEATHER_WARMER_MAX_CALLS by default, 0 - unlimited
+    :param workers: number of parallel API calls, WEATHER_WARMER_WORKERS by default
+    :param rate: API calls per second, WEATHER_WARMER_RATE by default
+    :param margin: refresh weather fresh for less than this many seconds, WEATHER_WARMER_MARGIN by default
+    :return: run statistics
+    """
+    max_calls = int(settings.WEATHER_WARMER_MAX_CALLS if max_calls is None else max_calls)
+    margin = int(settings.WEATHER_WARMER_MARGIN if margin is None else margin)
+
+    locations = collect_locations(DatabaseDynamoDb())
+    expiring = expiring_locations(locations, margin)
+    scheduled = expiring[:max_calls] if max_calls > 0 else expiring
+
+    warmer = WeatherWarmer(WeatherbitWeatherProvider(),
+                           workers=int(workers or settings.WEATHER_WARMER_WORKERS),
+                           rate=float(settings.WEATHER_WARMER_RATE if rate is None else rate))
+    stats = {"locations": len(locations), "expiring": len(expiring), **warmer.warm(scheduled)}
+    stats["skipped"] += len(expiring) - len(scheduled)
+    print(f"Active locations: {stats['locations']}, expiring: {stats['expiring']}, refreshed: {stats['refreshed']}, "
+          f"failed: {stats['failed']}, skipped: {stats['skipped']}")
+    return stats
+
+
+def handler(event, context):
+    """Lambda entry point, run on schedule"""
+    return warm_weather_cache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh cached weather of active shipments before it expires")
+    parser.add_argument("--max-calls", type=int, default=None, help="maximum number of API calls, 0 - unlimited")
+    parser.add_argument("--workers", type=int, default=None, help="number of parallel API calls")
+    parser.add_argument("--rate", type=float, default=None, help="API calls per second, 0 - unlimited")
+    parser.add_argument("--margin", type=int, default=None,
+                        help="refresh weather which stays fresh for less than this many seconds")
+    args = parser.parse_args()
+    warm_weather_cache(max_calls=args.max_calls, workers=args.workers, rate=args.rate, margin=args.margin)
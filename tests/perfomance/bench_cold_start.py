@@ -0,0 +1,121 @@
+"""Cold start of the application: import, startup and first requests of a fresh process.
+
+Every measurement runs in a new interpreter, like a new lambda execution environment. Startup
+warm-up (WARMUP_ON_STARTUP) is measured on and off: without it, providers, connection pools and
+country index are created by the first request.
+
+The request path is the real one up to the network: database provider comes from DatabaseFactory
+and receiver address is resolved with the country index, database and weather answers are fixed.
+Settings are read from .env.test. Run from the project root:
+
+    python -m tests.perfomance.bench_cold_start
+    python -m tests.perfomance.bench_cold_start --importtime    # slowest modules of "import app.main"
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from dotenv import dotenv_values
+
+RUNS = 5
+TOP_MODULES = 15
+
+
+def child() -> None:
+    """Single measurement, prints timings in milliseconds as JSON"""
+    started = time.perf_counter()
+    from app.main import app
+    imported = time.perf_counter()
+
+    from unittest.mock import MagicMock
+    from fastapi.testclient import TestClient
+
+    from app.api.models import TrackingItem, WeatherItem
+    from app.api.tracking import get_database, get_locations, get_weather
+    from app.db.factory import DatabaseFactory
+    from app.integrations.weather import WeatherbitWeatherProvider
+
+    tracking_item = TrackingItem(
+        tracking_number="TN12345678", carrier="DHL", status="in-transit", articles=[],
+        sender_address="Street 1, 10115 Berlin, Germany", receiver_address="Street 10, 75001 Paris, France",
+    )
+    weather_item = WeatherItem(wind="south", temp=10, city="Paris", cloud=0, description="Clear sky")
+
+    def database():
+        DatabaseFactory.get_provider("dynamodb")
+        mock_database = MagicMock()
+        mock_database.get_tracking_item.return_value = tracking_item
+        return mock_database
+
+    def weather():
+        mock_weather = MagicMock()
+        mock_weather.get_weather.side_effect = lambda address: (
+            WeatherbitWeatherProvider.parse_address(address) and weather_item
+        )
+        return mock_weather
+
+    app.dependency_overrides[get_database] = database
+    app.dependency_overrides[get_weather] = weather
+    app.dependency_overrides[get_locations] = lambda: None
+
+    timings = {"import": (imported - started) * 1000}
+    before = time.perf_counter()
+    with TestClient(app) as client:
+        started_up = time.perf_counter()
+        timings["startup"] = (started_up - before) * 1000
+        for name in ("first request", "second request"):
+            before = time.perf_counter()
+            assert client.get("/track/DHL/TN12345678").status_code == 200
+            timings[name] = (time.perf_counter() - before) * 1000
+    print(json.dumps(timings))
+
+
+def run_child(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "tests.perfomance.bench_cold_start", "--child"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report_cold_start(env: dict) -> None:
+    for warmup in ("false", "true"):
+        runs = [run_child({**env, "WARMUP_ON_STARTUP": warmup}) for _ in range(RUNS)]
+        timings = "  ".join(f"{name}={sum(run[name] for run in runs) / RUNS:7.1f}ms" for name in runs[0])
+        print(f"warm-up {warmup:<5}  {timings}")
+
+
+def report_import_time(env: dict) -> None:
+    """Print modules with the highest cumulative import time"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    modules = []
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match:
+            modules.append((int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+    for cumulative, level, module in sorted(modules, reverse=True)[:TOP_MODULES]:
+        print(f"{cumulative / 1000:8.1f}ms  {'  ' * level}{module}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--importtime", action="store_true", help="report import time of app.main modules")
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+    else:
+        environment = {**dotenv_values(".env.test"), **os.environ, "TRACKING_CACHE": "false",
+                       "DATABASE_PROVIDER": "dynamodb", "WEATHER_PREFETCH": "false"}
+        if args.importtime:
+            report_import_time(environment)
+        else:
+            report_cold_start(environment)
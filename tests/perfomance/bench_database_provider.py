@@ -0,0 +1,59 @@
+"""Per-request cost of obtaining a database provider.
+
+Compares building a new DatabaseDynamoDb on every request (old behaviour) with the shared
+instance handed out by DatabaseFactory. GetItem calls are stubbed, so no DynamoDB is needed.
+
+Settings are read from .env.test. Run from the project root:
+
+    python -m tests.perfomance.bench_database_provider
+"""
+import tests.perfomance.fakes  # noqa: F401, isort: skip, loads .env.test
+
+import statistics
+import time
+
+from botocore.stub import Stubber
+
+from app.db.dynamodb import DatabaseDynamoDb
+from app.db.factory import DatabaseFactory
+
+REQUESTS = 200
+
+GET_ITEM_RESPONSE = {
+    "Item": {
+        "tracking_number": {"S": "TN12345678"},
+        "carrier": {"S": "DHL"},
+        "sender_address": {"S": "Street 1, 10115 Berlin, Germany"},
+        "receiver_address": {"S": "Street 10, 75001 Paris, France"},
+        "status": {"S": "in-transit"},
+        "articles": {"L": []},
+    },
+}
+
+
+def handle_request(database: DatabaseDynamoDb) -> None:
+    with Stubber(database.dynamodb_client) as stubber:
+        stubber.add_response("get_item", GET_ITEM_RESPONSE)
+        database.get_tracking_item("TN12345678", "DHL")
+
+
+def measure(get_database) -> list[float]:
+    timings = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        handle_request(get_database())
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{name:<20} mean={statistics.mean(timings):8.3f}ms  "
+          f"p50={statistics.median(timings):8.3f}ms  p99={p99:8.3f}ms")
+
+
+if __name__ == "__main__":
+    DatabaseFactory.reset()
+    report("new per request", measure(DatabaseDynamoDb))
+    report("shared (factory)", measure(lambda: DatabaseFactory.get_provider("dynamodb")))
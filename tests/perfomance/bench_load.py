@@ -0,0 +1,222 @@
+"""Offline load test of the tracking endpoint.
+
+DynamoDB and Redis are replaced with in-memory fakes and Weatherbit with a local HTTP server with
+configurable latency and error rate (see fakes.py), so no network or AWS account is needed. Requests
+are sent at fixed concurrency either to the ASGI app or through the Mangum handler with API Gateway
+events, one event loop per worker thread like in concurrent lambda containers.
+
+Reported are RPS, latency percentiles, mean duration of request stages from the metrics registry and
+bytes allocated per stage, measured with tracemalloc in a separate single-threaded pass. Run from the
+project root:
+
+    python -m tests.perfomance.bench_load --mode asgi --concurrency 32 --requests 5000
+"""
+from tests.perfomance.fakes import FakeWeatherbit, install_fakes, make_shipments  # isort: skip, loads .env.test
+
+import argparse
+import asyncio
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+
+import httpx
+
+from app.api import tracking
+from app.api.models import TrackingResponse
+from app.api.responses import ModelResponse
+from app.conf.metrics import registry, stage_seconds
+from app.conf.settings import settings
+from app.main import app, handler
+
+STAGES = ("database", "weather", "serialize")
+
+
+def percentile(values: list[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def summarize(latencies: list[float], statuses: list[int], elapsed: float) -> dict:
+    """Load test results, latencies in milliseconds"""
+    return {
+        "requests": len(latencies),
+        "errors": sum(status >= 500 for status in statuses),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        **{f"{stage}_mean_ms": stage_seconds.total(stage=stage) / max(stage_seconds.count(stage=stage), 1) * 1000
+           for stage in STAGES},
+    }
+
+
+def request_paths(shipments: list[dict], count: int) -> list[str]:
+    rng = random.Random(1)
+    return [f"/track/{item['carrier']}/{item['tracking_number']}" for item in rng.choices(shipments, k=count)]
+
+
+async def drive_asgi(paths: list[str], concurrency: int) -> tuple[list[float], list[int]]:
+    latencies, statuses = [], []
+    pending = iter(paths)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for path in pending:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                statuses.append(response.status_code)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses
+
+
+def api_gateway_event(path: str) -> dict:
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"host": "bench.execute-api.eu-central-1.amazonaws.com", "user-agent": "bench"},
+        "requestContext": {
+            "accountId": "000000000000",
+            "apiId": "bench",
+            "domainName": "bench.execute-api.eu-central-1.amazonaws.com",
+            "http": {"method": "GET", "path": path, "protocol": "HTTP/1.1", "sourceIp": "127.0.0.1",
+                     "userAgent": "bench"},
+            "requestId": "bench",
+            "routeKey": "$default",
+            "stage": "$default",
+            "timeEpoch": 0,
+        },
+        "isBase64Encoded": False,
+    }
+
+
+def drive_mangum(paths: list[str], concurrency: int) -> tuple[list[float], list[int]]:
+    latencies, statuses = [], []
+    pending = iter(paths)
+    lock = threading.Lock()
+
+    def worker():
+        # Mangum runs every invocation on the current thread's event loop
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        while True:
+            with lock:
+                path = next(pending, None)
+            if path is None:
+                return
+            started = time.perf_counter()
+            response = handler(api_gateway_event(path), None)
+            latencies.append(time.perf_counter() - started)
+            statuses.append(response["statusCode"])
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+def allocated(func, *args, **kwargs) -> int:
+    """Peak bytes allocated by the call"""
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    func(*args, **kwargs)
+    return tracemalloc.get_traced_memory()[1] - before
+
+
+def stage_allocations(shipments: list[dict], rounds: int = 200) -> dict:
+    """Mean bytes allocated by request stages with warm caches"""
+    database, weather = tracking.get_database(), tracking.get_weather()
+    items = random.Random(2).choices(shipments, k=rounds)
+    totals = dict.fromkeys(STAGES, 0)
+    tracemalloc.start()
+    try:
+        for item in items:
+            tracking_item = database.get_tracking_item(item["tracking_number"], item["carrier"])
+            weather_item = weather.get_weather(tracking_item.receiver_address)
+            totals["database"] += allocated(database.get_tracking_item, item["tracking_number"], item["carrier"])
+            totals["weather"] += allocated(weather.get_weather, tracking_item.receiver_address)
+            totals["serialize"] += allocated(
+                ModelResponse, TrackingResponse.model_construct(tracking=tracking_item, weather=weather_item)
+            )
+    finally:
+        tracemalloc.stop()
+    return {f"{stage}_alloc_bytes": total / rounds for stage, total in totals.items()}
+
+
+def run_load(mode: str = "asgi", concurrency: int = 32, requests: int = 5000, shipments: int = 10000,
+             locations: int = 200, weather_latency: float = 0.05, error_rate: float = 0.0,
+             dynamodb_latency: float = 0.005, redis_latency: float = 0.0005, region_rules: str = "") -> dict:
+    """Run load test against the fakes
+
+    :param mode: "asgi" or "mangum"
+    :param concurrency: requests in flight
+    :param requests: total number of requests
+    :param shipments: number of shipments in the fake table
+    :param locations: number of distinct receiver locations, each costs one Weatherbit call while cache is cold
+    :param weather_latency: Weatherbit response delay in seconds
+    :param error_rate: share of Weatherbit requests failing with 503
+    :param dynamodb_latency: delay of every DynamoDB call in seconds
+    :param redis_latency: delay of every Redis round trip in seconds
+    :param region_rules: WEATHER_REGION_RULES of the run
+    :return: results, latencies in milliseconds
+    """
+    settings.WEATHER_REGION_RULES = region_rules
+    items = make_shipments(shipments, locations)
+    weatherbit = FakeWeatherbit(latency=weather_latency, error_rate=error_rate)
+    try:
+        install_fakes(items, weatherbit, dynamodb_latency=dynamodb_latency, redis_latency=redis_latency)
+        registry.reset()
+        paths = request_paths(items, requests)
+        started = time.perf_counter()
+        if mode == "mangum":
+            latencies, statuses = drive_mangum(paths, concurrency)
+        else:
+            latencies, statuses = asyncio.run(drive_asgi(paths, concurrency))
+        results = summarize(latencies, statuses, time.perf_counter() - started)
+        results["weatherbit_calls"] = weatherbit.calls
+        results.update(stage_allocations(items))
+        return results
+    finally:
+        weatherbit.stop()
+
+
+def report(results: dict) -> None:
+    print(f"requests={results['requests']}  errors={results['errors']}  rps={results['rps']:.0f}  "
+          f"p50={results['p50_ms']:.2f}ms  p95={results['p95_ms']:.2f}ms  p99={results['p99_ms']:.2f}ms  "
+          f"weatherbit calls={results['weatherbit_calls']}")
+    for stage in STAGES:
+        print(f"  {stage:<10} mean={results[f'{stage}_mean_ms']:7.3f}ms  "
+              f"allocated={results[f'{stage}_alloc_bytes'] / 1024:7.1f}KiB")
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--mode", choices=("asgi", "mangum"), default="asgi")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--shipments", type=int, default=10000)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--weather-latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of failed Weatherbit requests")
+    parser.add_argument("--dynamodb-latency", type=float, default=0.005, help="seconds")
+    parser.add_argument("--redis-latency", type=float, default=0.0005, help="seconds")
+    parser.add_argument("--region-rules", default="", help="WEATHER_REGION_RULES, e.g. FR:2")
+
+
+def load_options(args: argparse.Namespace) -> dict:
+    return {"concurrency": args.concurrency, "requests": args.requests, "shipments": args.shipments,
+            "locations": args.locations, "weather_latency": args.weather_latency, "error_rate": args.error_rate,
+            "dynamodb_latency": args.dynamodb_latency, "redis_latency": args.redis_latency,
+            "region_rules": args.region_rules}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the tracking endpoint")
+    add_arguments(parser)
+    args = parser.parse_args()
+    report(run_load(mode=args.mode, **load_options(args)))
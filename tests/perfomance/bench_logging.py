@@ -0,0 +1,77 @@
+"""Request throughput as the number of served requests grows.
+
+Before logging was configured once, every request attached one more console handler to the
+"trackapi" logger, so each log line was written N times after N requests and throughput kept
+dropping. This benchmark serves requests in blocks and reports throughput of each block for
+the legacy per-request setup and the current queue-based setup.
+
+Database and weather providers are mocked, every request logs a warning (404 response).
+Log output goes to /dev/null. Settings are read from .env.test. Run from the project root:
+
+    python -m tests.perfomance.bench_logging
+"""
+import tests.perfomance.fakes  # noqa: F401, isort: skip, loads .env.test
+
+import contextlib
+import logging
+import os
+import time
+from unittest.mock import MagicMock
+
+from fastapi.testclient import TestClient
+
+from app.api.tracking import get_database, get_locations, get_weather
+from app.conf import logging as app_logging
+from app.main import app
+
+BLOCKS = 5
+BLOCK_SIZE = 300
+
+
+def legacy_get_logger():
+    """Logger setup as it was done on every request before"""
+    logger = logging.getLogger("trackapi")
+    logger.setLevel(logging.INFO)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.DEBUG)
+    console_handler.setFormatter(
+        logging.Formatter('[%(asctime)s] [%(process)d] [%(levelname)s] [%(module)s] %(message)s')
+    )
+    logger.addHandler(console_handler)
+    return logger
+
+
+def measure(client: TestClient) -> list[float]:
+    throughput = []
+    for _ in range(BLOCKS):
+        started = time.perf_counter()
+        for _ in range(BLOCK_SIZE):
+            client.get("/track/DHL/TN12345678")
+        throughput.append(BLOCK_SIZE / (time.perf_counter() - started))
+    return throughput
+
+
+def report(name: str, throughput: list[float]) -> None:
+    blocks = "  ".join(f"{rps:7.0f}" for rps in throughput)
+    print(f"{name:<8} requests/s per block of {BLOCK_SIZE}: {blocks}")
+
+
+if __name__ == "__main__":
+    database = MagicMock()
+    database.get_tracking_item.return_value = None
+    app.dependency_overrides[get_database] = lambda: database
+    app.dependency_overrides[get_weather] = lambda: MagicMock()
+    app.dependency_overrides[get_locations] = lambda: None
+
+    client = TestClient(app)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+        original_get_logger = app_logging.get_logger
+        app_logging.get_logger = legacy_get_logger
+        legacy = measure(client)
+        logging.getLogger("trackapi").handlers.clear()
+
+        app_logging.get_logger = original_get_logger
+        current = measure(client)
+
+    report("legacy", legacy)
+    report("current", current)
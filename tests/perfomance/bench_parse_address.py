@@ -0,0 +1,53 @@
+"""Receiver address resolution cost.
+
+Compares the legacy parsing (regex + pycountry fuzzy search on every call) with the
+precomputed country index and with the per-address cache used on warm requests.
+
+Settings are read from .env.test. Run from the project root:
+
+    python -m tests.perfomance.bench_parse_address
+"""
+import tests.perfomance.fakes  # noqa: F401, isort: skip, loads .env.test
+
+import re
+import time
+
+import pycountry
+
+from app.integrations.countries import resolve_country_code
+from app.integrations.weather import WeatherbitWeatherProvider
+
+ADDRESSES = [
+    "Street 10, 75001 Paris, France",
+    "Street 1, 10115 Berlin, Germany",
+    "Main St 5, 10001 New York, USA",
+    "Calle 3, 28001 Madrid, Spain",
+    "Via 7, 00100 Rome, Italy",
+]
+ROUNDS = 200
+
+
+def legacy_parse_address(receiver_address: str):
+    match = re.match(r'^(.*?),\s*([\w\d-]+)\s+([\w\s-]+),\s*([\w\s-]+)$', receiver_address)
+    return match.group(2).strip(), pycountry.countries.search_fuzzy(match.group(4).strip())[0].alpha_2
+
+
+def index_parse_address(receiver_address: str):
+    match = re.match(r'^(.*?),\s*([\w\d-]+)\s+([\w\s-]+),\s*([\w\s-]+)$', receiver_address)
+    return match.group(2).strip(), resolve_country_code(match.group(4).strip())
+
+
+def measure(name: str, parse, rounds: int) -> None:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for address in ADDRESSES:
+            parse(address)
+    per_call = (time.perf_counter() - started) / (rounds * len(ADDRESSES)) * 1_000_000
+    print(f"{name:<16} {per_call:10.2f}us per address")
+
+
+if __name__ == "__main__":
+    measure("legacy fuzzy", legacy_parse_address, 5)
+    index_parse_address(ADDRESSES[0])  # build country index
+    measure("country index", index_parse_address, ROUNDS)
+    measure("cached address", WeatherbitWeatherProvider.parse_address, ROUNDS)
@@ -0,0 +1,62 @@
+"""Serialization time of tracking response by number of shipment articles.
+
+Legacy path is what FastAPI 0.115 (pinned in requirements.txt) does with a model returned from an
+endpoint with response_model: the model is dumped to dict, validated again as response_model, dumped
+to JSON-compatible dict and encoded with json by JSONResponse. Current path is ModelResponse, which
+serializes the model to bytes once with pydantic-core. Settings are read from .env.test. Run from the project root:
+
+    python -m tests.perfomance.bench_response_serialization
+"""
+import tests.perfomance.fakes  # noqa: F401, isort: skip, loads .env.test
+
+import time
+
+from fastapi.responses import JSONResponse
+
+from app.api.models import ArticleItem, TrackingItem, TrackingResponse, WeatherItem
+from app.api.responses import ModelResponse
+
+ARTICLES = [1, 100, 500, 2000]
+REPEAT = 200
+
+
+def tracking_response(articles: int) -> TrackingResponse:
+    return TrackingResponse(
+        tracking=TrackingItem(
+            tracking_number="TN12345678",
+            carrier="DHL",
+            sender_address="Street 1, 10115 Berlin, Germany",
+            receiver_address="Street 10, 75001 Paris, France",
+            status="in-transit",
+            articles=[
+                ArticleItem(article_name=f"Article {i}", article_quantity=1, article_price=9.99, SKU=f"SKU{i}")
+                for i in range(articles)
+            ],
+        ),
+        weather=WeatherItem(wind="south", temp=10, city="Paris", cloud=0, description="Clear sky"),
+    )
+
+
+def legacy(response: TrackingResponse) -> bytes:
+    content = TrackingResponse.model_validate(response.model_dump())
+    return JSONResponse(content.model_dump(mode="json", exclude_none=True)).body
+
+
+def current(response: TrackingResponse) -> bytes:
+    return ModelResponse(response).body
+
+
+def measure(serialize, response: TrackingResponse) -> float:
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        serialize(response)
+    return (time.perf_counter() - started) / REPEAT * 1000
+
+
+if __name__ == "__main__":
+    for articles in ARTICLES:
+        response = tracking_response(articles)
+        assert JSONResponse(response.model_dump(mode="json")).body.replace(b" ", b"") == \
+            current(response).replace(b" ", b"")
+        print(f"{articles:>5} articles   legacy={measure(legacy, response):8.3f}ms   "
+              f"current={measure(current, response):8.3f}ms")
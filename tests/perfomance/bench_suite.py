@@ -0,0 +1,197 @@
+"""Offline benchmark suite with saved results for regression comparison.
+
+Runs micro-benchmarks of address parsing, weather cache hits, shipments loading and response
+serialization, then the load test of bench_load.py, all against local fakes. Results can be saved
+as JSON and compared with a previous run, regressions over the threshold make the exit code 1.
+Run from the project root:
+
+    python -m tests.perfomance.bench_suite --save baseline.json
+    python -m tests.perfomance.bench_suite --compare baseline.json --threshold 20
+"""
+from tests.perfomance.fakes import FakeWeatherbit, install_fakes, make_shipments  # isort: skip, loads .env.test
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+from app import load_shipments
+from app.api.models import ArticleItem, TrackingItem, TrackingResponse, WeatherItem
+from app.api.responses import ModelResponse
+from app.conf.settings import settings
+from app.integrations import cache
+from app.integrations.weather import WeatherbitWeatherProvider
+from tests.perfomance import bench_load, bench_weather_regions
+
+# metrics where bigger values are better, for all others lower is better
+HIGHER_IS_BETTER = {"load.rps", "load_shipments.rows_per_s", "weather_regions.exact_hit_rate",
+                    "weather_regions.region_hit_rate"}
+# informational values, not compared
+NOT_COMPARED = {"load.requests", "load.weatherbit_calls"}
+
+ADDRESSES = [f"Street {number}, {10000 + number} Berlin, Germany" for number in range(1000)]
+
+
+def per_call_us(func, repeat: int, rounds: int = 5) -> float:
+    """Best of `rounds` mean call durations, the minimum is the least affected by other processes"""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        timings.append((time.perf_counter() - started) / repeat * 1e6)
+    return min(timings)
+
+
+def bench_parse_address() -> dict:
+    parse_address = WeatherbitWeatherProvider.parse_address
+    addresses = itertools.cycle(ADDRESSES)
+    uncached = per_call_us(lambda: parse_address.__wrapped__(next(addresses)), 10000)
+    cached = per_call_us(lambda: parse_address(ADDRESSES[0]), 100000)
+    return {"uncached_us": uncached, "cached_us": cached}
+
+
+def bench_cache_weather() -> dict:
+    """Hit of the in-process cache and hit of redis with the in-process cache empty"""
+    weatherbit = FakeWeatherbit(latency=0.0)
+    try:
+        install_fakes([], weatherbit)
+        provider = WeatherbitWeatherProvider()
+        provider.fetch_weather("75001", "FR")
+        local_hit = per_call_us(lambda: provider.fetch_weather("75001", "FR"), 50000)
+
+        def redis_hit():
+            cache.weather_local_cache.clear()
+            provider.fetch_weather("75001", "FR")
+        return {"local_hit_us": local_hit, "redis_hit_us": per_call_us(redis_hit, 5000)}
+    finally:
+        weatherbit.stop()
+
+
+def bench_load_shipments(shipments: int = 20000) -> dict:
+    """Incremental import of a generated csv into the fake table"""
+    weatherbit = FakeWeatherbit(latency=0.0)
+    items = make_shipments(shipments, locations=500)
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        csv_filename = os.path.join(directory, "shipments.csv")
+        with open(csv_filename, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=["tracking_number", "carrier", "sender_address",
+                                                          "receiver_address", *load_shipments.ARTICLE_FIELDS, "status"])
+            writer.writeheader()
+            rows = 0
+            for item in items:
+                for article in item["articles"]:
+                    writer.writerow({**{key: value for key, value in item.items() if key != "articles"}, **article})
+                    rows += 1
+        try:
+            dynamodb, _ = install_fakes([], weatherbit)
+            database = load_shipments.DatabaseDynamoDb()
+            database.dynamodb_client = dynamodb
+            started = time.perf_counter()
+            with patch.object(load_shipments, "DatabaseDynamoDb", return_value=database), \
+                    patch("builtins.print"):
+                load_shipments.load_shipments_from_csv(csv_filename, incremental=True)
+            elapsed = time.perf_counter() - started
+        finally:
+            weatherbit.stop()
+    assert len(dynamodb.items) == shipments
+    return {"rows_per_s": rows / elapsed}
+
+
+def bench_serialization(articles: int = 50) -> dict:
+    response = TrackingResponse.model_construct(
+        tracking=TrackingItem(
+            tracking_number="TN12345678", carrier="DHL", status="in-transit",
+            sender_address="Street 1, 10115 Berlin, Germany", receiver_address="Street 10, 75001 Paris, France",
+            articles=[ArticleItem(article_name=f"Article {number}", article_quantity=1, article_price=9.99,
+                                  SKU=f"SKU{number}") for number in range(articles)],
+        ),
+        weather=WeatherItem(wind="south", temp=8.7, city="Paris", cloud=50, description="Light rain"),
+    )
+    return {"render_us": per_call_us(lambda: ModelResponse(response), 5000)}
+
+
+def bench_weather_regions_hit_rate(rules: str = "DE:2,FR:2,US:3") -> dict:
+    """Weather cache hit rate of the same lookups with exact zip code keys and region keys"""
+    locations = bench_weather_regions.receiver_locations(bench_weather_regions.REQUESTS)
+    configured = settings.WEATHER_REGION_RULES
+    try:
+        return {"exact_hit_rate": bench_weather_regions.simulate("", locations)["hit_rate"],
+                "region_hit_rate": bench_weather_regions.simulate(rules, locations)["hit_rate"]}
+    finally:
+        settings.WEATHER_REGION_RULES = configured
+
+
+def run_suite(load_options: dict) -> dict:
+    """Run all benchmarks
+
+    :param load_options: keyword arguments of bench_load.run_load
+    :return: flat {"benchmark.metric": value}
+    """
+    benchmarks = {
+        "parse_address": bench_parse_address,
+        "cache_weather": bench_cache_weather,
+        "load_shipments": bench_load_shipments,
+        "serialization": bench_serialization,
+        "weather_regions": bench_weather_regions_hit_rate,
+        "load": lambda: bench_load.run_load(**load_options),
+    }
+    results = {}
+    for name, benchmark in benchmarks.items():
+        print(f"Running {name}...", file=sys.stderr)
+        results.update({f"{name}.{metric}": value for metric, value in benchmark().items()})
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print change of every metric against baseline
+
+    :param threshold: allowed worsening in percent
+    :return: names of regressed metrics
+    """
+    regressions = []
+    for name, value in results.items():
+        if name in NOT_COMPARED or name not in baseline:
+            continue
+        base = baseline[name]
+        change = (value - base) / base * 100 if base else (0.0 if value == base else float("inf"))
+        worsening = -change if name in HIGHER_IS_BETTER else change
+        regressed = worsening > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<36} {base:12.3f} -> {value:12.3f}  {change:+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--save", help="write results into this JSON file")
+    parser.add_argument("--compare", help="JSON file with baseline results")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed worsening in percent")
+    bench_load.add_arguments(parser)
+    args = parser.parse_args()
+
+    load_options = {"mode": args.mode, **bench_load.load_options(args)}
+    results = run_suite(load_options)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as results_file:
+            json.dump({"python": platform.python_version(), "load_options": load_options,
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, results_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("load_options") != load_options:
+            print("Warning: baseline was measured with different load options", file=sys.stderr)
+        if compare(results, baseline["results"], args.threshold):
+            sys.exit(1)
+    else:
+        for name, value in results.items():
+            print(f"{name:<36} {value:12.3f}")
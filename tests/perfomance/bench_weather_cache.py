@@ -0,0 +1,54 @@
+"""Size and decode time of cached weather entry.
+
+Legacy cache stored the whole Weatherbit response and every hit decoded it with json and built
+WeatherItem from data[0]. Current cache stores the versioned encoding of the unified WeatherItem.
+The raw payload below has the fields of a real Weatherbit current weather response. Settings are
+read from .env.test. Run from the project root:
+
+    python -m tests.perfomance.bench_weather_cache
+"""
+import tests.perfomance.fakes  # noqa: F401, isort: skip, loads .env.test
+
+import json
+import time
+
+from app.integrations.cache import decode_weather, encode_weather
+from app.integrations.weather import WeatherbitWeatherProvider
+
+REPEAT = 100000
+
+WEATHERBIT_RESPONSE = {
+    "count": 1,
+    "data": [{
+        "app_temp": 7.2, "aqi": 36, "city_name": "Paris", "clouds": 50, "country_code": "FR",
+        "datetime": "2025-03-10:12", "dewpt": 4.1, "dhi": 98.5, "dni": 712.3, "elev_angle": 34.1,
+        "ghi": 498.2, "gust": 6.4, "h_angle": 0, "lat": 48.8566, "lon": 2.3522,
+        "ob_time": "2025-03-10 12:00", "pod": "d", "precip": 0, "pres": 1012.5, "rh": 81,
+        "slp": 1016.2, "snow": 0, "solar_rad": 480.1, "sources": ["analysis", "radar", "satellite"],
+        "state_code": "11", "station": "LFPB", "sunrise": "06:12", "sunset": "17:51", "temp": 8.7,
+        "timezone": "Europe/Paris", "ts": 1741608000, "uv": 2.8, "vis": 16,
+        "weather": {"description": "Light rain", "code": 500, "icon": "r01d"},
+        "wind_cdir": "S", "wind_cdir_full": "south", "wind_dir": 180, "wind_spd": 3.6,
+    }],
+}
+
+
+def measure(decode, value: bytes) -> float:
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        decode(value)
+    return (time.perf_counter() - started) / REPEAT * 1e6
+
+
+def legacy_decode(value: bytes):
+    return WeatherbitWeatherProvider.unify_weatherbit_data(json.loads(value)["data"][0])
+
+
+if __name__ == "__main__":
+    legacy = json.dumps(WEATHERBIT_RESPONSE).encode()
+    current = encode_weather(legacy_decode(legacy))
+    assert decode_weather(current) == legacy_decode(legacy)
+
+    for name, value, decode in (("legacy raw", legacy, legacy_decode), ("current", current, decode_weather)):
+        print(f"{name:<11} {len(value):5d} bytes   {1024 * 1024 // len(value):6d} values/MB   "
+              f"decode={measure(decode, value):6.2f}us")
@@ -0,0 +1,62 @@
+"""Weather cache hit rate and size with exact zip code keys vs region keys (WEATHER_REGION_RULES).
+
+Receiver zip codes are drawn from postal code ranges of big cities plus a country-wide long tail.
+Every distinct cache key costs one Weatherbit call and one Redis entry per cache TTL, the rest of the
+lookups are hits. Run from the project root:
+
+    python -m tests.perfomance.bench_weather_regions
+"""
+import tests.perfomance.fakes  # noqa: F401, isort: skip, loads .env.test
+
+import random
+
+from app.api.models import WeatherItem
+from app.conf.settings import settings
+from app.integrations.cache import encode_weather, weather_cache_key
+
+REQUESTS = 100000
+RULES = ("", "DE:3,FR:3,US:3", "DE:2,FR:2,US:3")
+
+# (country, first zip, last zip, share of requests)
+CITIES = [
+    ("DE", 10115, 14199, 0.20),  # Berlin
+    ("DE", 20095, 22769, 0.10),  # Hamburg
+    ("DE", 80331, 81929, 0.10),  # Munich
+    ("DE", 50667, 51149, 0.05),  # Cologne
+    ("FR", 75001, 75020, 0.10),  # Paris
+    ("FR", 69001, 69009, 0.03),  # Lyon
+    ("FR", 13001, 13016, 0.02),  # Marseille
+    ("US", 10001, 10292, 0.10),  # New York
+    ("US", 90001, 90089, 0.05),  # Los Angeles
+    ("US", 60601, 60661, 0.05),  # Chicago
+    ("DE", 1000, 99999, 0.20),  # rest of the country
+]
+# Redis entry overhead besides key and value, approximate
+ENTRY_OVERHEAD = 60
+
+
+def receiver_locations(count: int) -> list[tuple[str, str]]:
+    rng = random.Random(1)
+    cities = rng.choices(CITIES, weights=[share for *_, share in CITIES], k=count)
+    return [(f"{rng.randint(first, last):05d}", country) for country, first, last, _ in cities]
+
+
+def simulate(rules: str, locations: list[tuple[str, str]]) -> dict:
+    """Lookups of one cache TTL period starting with empty cache"""
+    settings.WEATHER_REGION_RULES = rules
+    keys = {weather_cache_key(*location) for location in locations}
+    value_size = len(encode_weather(WeatherItem(wind="south-southwest", temp=12.5, city="Berlin", cloud=40,
+                                                description="Scattered clouds")))
+    return {
+        "api_calls": len(keys),
+        "hit_rate": 1 - len(keys) / len(locations),
+        "redis_bytes": sum(len(key) + value_size + ENTRY_OVERHEAD for key in keys),
+    }
+
+
+if __name__ == "__main__":
+    locations = receiver_locations(REQUESTS)
+    for rules in RULES:
+        result = simulate(rules, locations)
+        print(f"{rules or 'exact zip':<16} api calls={result['api_calls']:6d}  hit rate={result['hit_rate']:7.2%}  "
+              f"redis={result['redis_bytes'] / 1024:8.1f}KiB")
@@ -0,0 +1,288 @@
+"""Local stand-ins for DynamoDB, Redis and Weatherbit used by offline benchmarks.
+
+Importing this module loads settings from .env.test, so it must be imported before the app modules.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv(".env.test")
+# request logs would flood the console, set LOG_LEVEL=INFO to include logging in the measurements
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+CITIES = ["Paris", "Berlin", "Madrid", "Rome", "Vienna", "Prague", "Warsaw", "Lisbon", "Dublin", "Oslo"]
+
+
+def make_shipments(count: int, locations: int, articles: int = 2) -> list[dict]:
+    """Shipments spread over `locations` receiver zip codes, values are strings as written by the loader"""
+    return [{
+        "tracking_number": f"TN{number:08d}",
+        "carrier": "DHL",
+        "sender_address": "Street 1, 10115 Berlin, Germany",
+        "receiver_address": f"Street {number % 100}, {75000 + number % locations} Paris, France",
+        "status": "in-transit",
+        "articles": [
+            {"article_name": f"Article {i}", "article_quantity": "1", "article_price": "9.99", "SKU": f"SKU{i}"}
+            for i in range(articles)
+        ],
+    } for number in range(count)]
+
+
+class FakeDynamoDbClient:
+    """In-memory table behind the subset of the low-level DynamoDB client API used by DatabaseDynamoDb"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.items: dict[tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+
+    def put(self, items: list[dict]) -> None:
+        from app.db.dynamodb import DatabaseDynamoDb
+
+        for item in items:
+            self.items[(item["tracking_number"], item["carrier"])] = DatabaseDynamoDb.serialize(item)
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _project(item: dict, projection: str | None, names: dict | None) -> dict:
+        if not projection:
+            return item
+        attributes = [(names or {}).get(name.strip(), name.strip()) for name in projection.split(",")]
+        return {name: item[name] for name in attributes if name in item}
+
+    @staticmethod
+    def _key(key: dict) -> tuple[str, str]:
+        return key["tracking_number"]["S"], key["carrier"]["S"]
+
+    def list_tables(self):
+        from app.conf.settings import settings
+
+        return {"TableNames": [settings.TRACKING_TABLE]}
+
+    def get_item(self, TableName, Key, ConsistentRead=False, ProjectionExpression=None,
+                 ExpressionAttributeNames=None):
+        self._wait()
+        item = self.items.get(self._key(Key))
+        if item is None:
+            return {}
+        return {"Item": self._project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def batch_get_item(self, RequestItems):
+        self._wait()
+        responses = {}
+        for table_name, request in RequestItems.items():
+            responses[table_name] = [
+                self._project(self.items[self._key(key)], request.get("ProjectionExpression"),
+                              request.get("ExpressionAttributeNames"))
+                for key in request["Keys"] if self._key(key) in self.items
+            ]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, RequestItems):
+        self._wait()
+        with self._lock:
+            for requests in RequestItems.values():
+                for request in requests:
+                    item = request["PutRequest"]["Item"]
+                    self.items[self._key(item)] = item
+        return {"UnprocessedItems": {}}
+
+
+class FakeRedis:
+    """Thread-safe in-memory subset of redis.Redis used by the caches"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._values: dict[str, tuple[object, float | None]] = {}
+        self._lock = threading.RLock()
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, key: str):
+        value, expires_at = self._values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            return None
+        return value
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        self._wait()
+        with self._lock:
+            return self._get(key)
+
+    def mget(self, keys):
+        self._wait()
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        self._wait()
+        with self._lock:
+            if nx and self._get(key) is not None:
+                return None
+            ttl = ex if ex else px / 1000 if px else None
+            self._values[key] = (self._encode(value), time.monotonic() + ttl if ttl else None)
+            return True
+
+    def setex(self, key, seconds, value):
+        self._wait()
+        with self._lock:
+            self._values[key] = (self._encode(value), time.monotonic() + int(seconds))
+        return True
+
+    def pttl(self, key):
+        self._wait()
+        with self._lock:
+            if self._get(key) is None:
+                return -2
+            expires_at = self._values[key][1]
+            return -1 if expires_at is None else int((expires_at - time.monotonic()) * 1000)
+
+    def delete(self, *keys):
+        self._wait()
+        with self._lock:
+            return sum(self._values.pop(key, None) is not None for key in keys)
+
+    def hget(self, name, field):
+        self._wait()
+        with self._lock:
+            return (self._get(name) or {}).get(field)
+
+    def hset(self, name, mapping):
+        self._wait()
+        with self._lock:
+            values = self._get(name) or {}
+            values.update({field: self._encode(value) for field, value in mapping.items()})
+            self._values[name] = (values, None)
+        return len(mapping)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def lock(self, name, timeout=None):
+        return FakeLock(self, name, timeout)
+
+
+class FakePipeline:
+    """Queued commands are executed in one round trip"""
+
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        self.client._wait()
+        latency, self.client.latency = self.client.latency, 0.0
+        try:
+            return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        finally:
+            self.client.latency = latency
+            self.commands = []
+
+
+class FakeLock:
+    def __init__(self, client: FakeRedis, name: str, timeout: float | None):
+        self.client = client
+        self.name = name
+        self.timeout = timeout
+
+    def acquire(self, blocking=True):
+        return bool(self.client.set(self.name, b"1", nx=True, px=int(self.timeout * 1000) if self.timeout else None))
+
+    def release(self):
+        self.client.delete(self.name)
+
+
+class FakeWeatherbit:
+    """Local HTTP server answering like Weatherbit current weather API.
+
+    :param latency: response delay in seconds
+    :param error_rate: share of requests answered with 503
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fake.calls += 1
+                time.sleep(fake.latency)
+                if random.random() < fake.error_rate:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                postal_code = parse_qs(urlparse(self.path).query).get("postal_code", ["0"])[0]
+                body = json.dumps({"count": 1, "data": [{
+                    "city_name": CITIES[int(postal_code) % len(CITIES)] if postal_code.isdigit() else "Paris",
+                    "clouds": 40, "temp": 12.5, "wind_cdir_full": "south-southeast",
+                    "weather": {"description": "Scattered clouds", "code": 802, "icon": "c02d"},
+                    "rh": 70, "pres": 1015.0, "sunrise": "06:12", "sunset": "17:51",
+                }]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v2.0/current"
+        threading.Thread(target=self.server.serve_forever, name="fake-weatherbit", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+def install_fakes(shipments: list[dict], weatherbit: FakeWeatherbit, dynamodb_latency: float = 0.0,
+                  redis_latency: float = 0.0) -> tuple[FakeDynamoDbClient, FakeRedis]:
+    """Point the application to the fakes: shared DynamoDB provider, Redis clients and Weatherbit URL"""
+    from app.conf.settings import settings
+    from app.db.dynamodb import DatabaseDynamoDb
+    from app.db.factory import DatabaseFactory
+    from app.integrations import cache, locations
+
+    dynamodb = FakeDynamoDbClient(latency=dynamodb_latency)
+    dynamodb.put(shipments)
+    redis_client = FakeRedis(latency=redis_latency)
+
+    DatabaseFactory.reset()
+    provider = DatabaseDynamoDb()
+    provider.dynamodb_client = dynamodb
+    DatabaseFactory._instances["dynamodb"] = provider
+
+    cache.redis_client = redis_client
+    locations.location_index.client = redis_client
+    cache.weather_local_cache.clear()
+    settings.WEATHERBIT_API_URL = weatherbit.url
+    return dynamodb, redis_client
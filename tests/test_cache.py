@@ -0,0 +1,231 @@
+import threading
+import time
+
+import pytest
+import redis
+from unittest.mock import MagicMock
+
+from app.api.models import WeatherItem
+from app.conf.metrics import weather_cache_total
+from app.integrations import cache
+from app.integrations.cache import LocalCache, SingleFlight, cache_weather, decode_weather, encode_weather
+
+
+@pytest.fixture
+def mock_redis(monkeypatch):
+    """Replace redis client and enable caching inside tests."""
+    mock_client = MagicMock()
+    monkeypatch.setattr(cache, "redis_client", mock_client)
+    monkeypatch.setattr(cache, "is_running_in_tests", lambda: False)
+    cache.weather_local_cache.clear()
+    yield mock_client
+    cache.weather_local_cache.clear()
+
+
+def make_weather(description="Clear sky"):
+    return WeatherItem(wind="south", temp=10, city="Paris", cloud=0, description=description)
+
+
+class WeatherSource:
+    """Cached function owner, counts real calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    @cache_weather(expiration=60)
+    def fetch(self, zip_code, country_code):
+        self.calls += 1
+        return make_weather()
+
+    @cache_weather(expiration=60, hard_expiration=600)
+    def fetch_stale(self, zip_code, country_code):
+        self.calls += 1
+        return make_weather("fresh")
+
+
+def test_local_cache_lru_eviction():
+    """Least recently used entry is evicted when cache is full."""
+    local_cache = LocalCache(max_size=2, ttl=60, max_entry_bytes=100)
+    local_cache.set("a", 1, size=1)
+    local_cache.set("b", 2, size=1)
+    local_cache.get("a")
+    local_cache.set("c", 3, size=1)
+
+    assert local_cache.get("b") is None
+    assert local_cache.get("a") == 1
+    assert local_cache.stats()["evictions"] == 1
+
+
+def test_local_cache_ttl(monkeypatch):
+    """Expired entries are not returned, TTL is limited by value remaining lifetime."""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    local_cache = LocalCache(max_size=10, ttl=60, max_entry_bytes=100)
+    local_cache.set("short", 1, size=1, ttl=5)
+    local_cache.set("long", 2, size=1)
+
+    now[0] += 10
+    assert local_cache.get("short") is None
+    assert local_cache.get("long") == 2
+
+
+def test_local_cache_entry_size_cap():
+    """Entries bigger than the cap are not stored."""
+    local_cache = LocalCache(max_size=10, ttl=60, max_entry_bytes=10)
+    local_cache.set("big", "x" * 100, size=100)
+
+    assert local_cache.get("big") is None
+    assert local_cache.stats()["rejections"] == 1
+
+
+def test_local_cache_stats():
+    """Hit ratio counts local hits and misses."""
+    local_cache = LocalCache(max_size=10, ttl=60, max_entry_bytes=100)
+    local_cache.set("a", 1, size=1)
+    local_cache.get("a")
+    local_cache.get("missing")
+
+    stats = local_cache.stats()
+    assert stats["size"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_cache_weather_local_hit(mock_redis):
+    """Second call is served from process memory without redis round trip."""
+    mock_redis.pipeline.return_value.execute.return_value = [None, -2]
+    source = WeatherSource()
+    local_hits = weather_cache_total.value(result="local_hit")
+
+    first = source.fetch("75001", "FR")
+    second = source.fetch("75001", "FR")
+
+    assert first == second
+    assert source.calls == 1
+    mock_redis.setex.assert_called_once()
+    assert mock_redis.pipeline.call_count == 1
+    assert weather_cache_total.value(result="local_hit") == local_hits + 1
+
+
+def test_cache_weather_redis_hit(mock_redis):
+    """Redis hit fills local cache and skips the function."""
+    mock_redis.pipeline.return_value.execute.return_value = [encode_weather(make_weather()), 30000]
+    source = WeatherSource()
+
+    assert source.fetch("75001", "FR") == make_weather()
+    assert source.calls == 0
+    assert cache.weather_local_cache.get(cache.weather_cache_key("75001", "FR")) == make_weather()
+
+
+def test_get_cached_weather_many_redis_error(mock_redis):
+    """Redis failure is reported as cache miss, local cache hits are still served."""
+    mock_redis.mget.side_effect = redis.ConnectionError("Connection refused")
+    cache.weather_local_cache.set(cache.weather_cache_key("75001", "FR"), make_weather(), size=1)
+
+    assert cache.get_cached_weather_many([("75001", "FR"), ("10115", "DE")]) == [make_weather(), None]
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """Concurrent calls with the same key execute function once."""
+    single_flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(single_flight.run("key", slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["value"] * 8
+
+
+def test_single_flight_propagates_errors():
+    """Leader's exception is raised and key is released for the next call."""
+    single_flight = SingleFlight()
+
+    def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        single_flight.run("key", failing)
+    assert single_flight.run("key", lambda: "value") == "value"
+
+
+@pytest.mark.parametrize("provider, writes", [("weatherbit", 1), ("hedged", 2)])
+def test_last_known_weather_written_for_hedged_provider(mock_redis, monkeypatch, provider, writes):
+    """Last known weather is an extra Redis write, kept only when the hedged provider can serve it."""
+    monkeypatch.setattr(cache.settings, "WEATHER_PROVIDER", provider)
+    mock_redis.pipeline.return_value.execute.return_value = [None, -2]
+
+    WeatherSource().fetch("75001", "FR")
+
+    assert mock_redis.setex.call_count + mock_redis.set.call_count == writes
+
+
+def test_cache_weather_stale_while_revalidate(mock_redis, monkeypatch):
+    """Stale value is returned immediately and refreshed once in background."""
+    monkeypatch.setattr(cache.io_executor, "submit", lambda func: func())
+    stale = encode_weather(make_weather("stale"))
+    # 100s left of 600s hard TTL: older than 60s soft TTL
+    mock_redis.pipeline.return_value.execute.return_value = [stale, 100000]
+    source = WeatherSource()
+
+    result = source.fetch_stale("75001", "FR")
+
+    assert result.description == "stale"
+    assert source.calls == 1
+    mock_redis.setex.assert_called_once()
+    assert mock_redis.setex.call_args.args[1] == 600
+
+
+def test_cache_weather_stale_refreshed_in_lambda(mock_redis, monkeypatch):
+    """Lambda refreshes stale value before returning, background work would be frozen with the process."""
+    monkeypatch.setattr(cache, "is_lambda", lambda: True)
+    monkeypatch.setattr(cache.io_executor, "submit", MagicMock(side_effect=AssertionError("background refresh")))
+    mock_redis.pipeline.return_value.execute.return_value = [encode_weather(make_weather("stale")), 100000]
+    source = WeatherSource()
+
+    result = source.fetch_stale("75001", "FR")
+
+    assert result == make_weather("fresh")
+    assert source.calls == 1
+    assert mock_redis.setex.call_args.args[1] == 600
+    assert not cache._refreshing
+
+
+def test_cache_weather_waits_for_lock_holder(mock_redis, monkeypatch):
+    """Caller without distributed lock waits for the value instead of calling the function."""
+    monkeypatch.setattr(cache.settings, "WEATHER_CACHE_LOCK", True)
+    mock_redis.pipeline.return_value.execute.return_value = [None, -2]
+    mock_redis.lock.return_value.acquire.return_value = False
+    mock_redis.get.return_value = encode_weather(make_weather())
+    source = WeatherSource()
+
+    assert source.fetch("75001", "FR") == make_weather()
+    assert source.calls == 0
+
+
+def test_weather_encoding():
+    """Cached weather is a compact versioned encoding of WeatherItem."""
+    weather = make_weather()
+    encoded = encode_weather(weather)
+
+    assert decode_weather(encoded) == weather
+    assert encoded == b'["south",10.0,"Paris",0,"Clear sky"]'
+    assert cache.weather_cache_key("75001", "FR") == f"weather:v{cache.WEATHER_CACHE_VERSION}:75001:FR"
+
+
+def test_weather_region_keys(monkeypatch):
+    """Zip codes of one region share a cache key, countries without rule keep exact zip codes."""
+    monkeypatch.setattr(cache.settings, "WEATHER_REGION_RULES", "DE:2, gb:3")
+
+    assert cache.weather_cache_key("10115", "DE") == cache.weather_cache_key("10999", "DE")
+    assert cache.weather_cache_key("10115", "DE").endswith(":10*:DE")
+    assert cache.weather_cache_key("sw1a 1aa", "GB").endswith(":SW1*:GB")
+    assert cache.weather_cache_key("75001", "FR").endswith(":75001:FR")
@@ -0,0 +1,286 @@
+import sys
+import threading
+
+import pytest
+from botocore.stub import Stubber
+from unittest.mock import MagicMock
+
+from app.api.models import TrackingItem
+from app.db.cache import NOT_FOUND, CachedDatabase
+from app.db.dynamodb import DatabaseDynamoDb, DatabaseException
+from app.db.factory import DatabaseFactory
+from app.db.snapshot import DatabaseSnapshot
+
+
+@pytest.fixture(autouse=True)
+def reset_factory():
+    """Every test starts with empty provider pool."""
+    DatabaseFactory.reset()
+    yield
+    DatabaseFactory.reset()
+
+
+@pytest.fixture
+def dynamodb_item():
+    """Tracking item in low-level DynamoDB format."""
+    return {
+        "tracking_number": {"S": "TN12345678"},
+        "carrier": {"S": "DHL"},
+        "sender_address": {"S": "Street 1, 10115 Berlin, Germany"},
+        "receiver_address": {"S": "Street 10, 75001 Paris, France"},
+        "status": {"S": "in-transit"},
+        "articles": {"L": [
+            {"M": {
+                "article_name": {"S": "Laptop"},
+                "article_quantity": {"N": "1"},
+                "article_price": {"N": "800"},
+                "SKU": {"S": "LP123"},
+            }},
+        ]},
+    }
+
+
+def test_factory_returns_shared_instance():
+    """Provider is built once and reused by following calls."""
+    first = DatabaseFactory.get_provider("dynamodb")
+    second = DatabaseFactory.get_provider("dynamodb")
+
+    assert isinstance(first, DatabaseDynamoDb)
+    assert first is second
+
+
+def test_factory_unknown_provider():
+    """Unknown provider name raises ValueError."""
+    with pytest.raises(ValueError):
+        DatabaseFactory.get_provider("unknown")
+
+
+def test_factory_concurrent_first_use(monkeypatch):
+    """Concurrent first calls build exactly one provider instance."""
+    created = []
+
+    class SlowProvider:
+        def __init__(self):
+            created.append(self)
+
+    monkeypatch.setitem(DatabaseFactory.providers, "slow", SlowProvider)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(DatabaseFactory.get_provider("slow")))
+               for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
+
+
+def test_get_tracking_item(dynamodb_item):
+    """Low-level GetItem response is converted into TrackingItem."""
+    database = DatabaseDynamoDb()
+    key = {"tracking_number": {"S": "TN12345678"}, "carrier": {"S": "DHL"}}
+
+    with Stubber(database.dynamodb_client) as stubber:
+        stubber.add_response("get_item", {"Item": dynamodb_item},
+                             {"TableName": database.shipments_table.name, "Key": key, "ConsistentRead": False})
+        item = database.get_tracking_item("TN12345678", "DHL")
+
+    assert isinstance(item, TrackingItem)
+    assert item.status == "in-transit"
+    assert item.articles[0].article_quantity == 1
+
+
+def test_get_tracking_item_not_found():
+    """Empty GetItem response returns None."""
+    database = DatabaseDynamoDb()
+
+    with Stubber(database.dynamodb_client) as stubber:
+        stubber.add_response("get_item", {})
+        assert database.get_tracking_item("TN00000000", "DHL") is None
+
+
+def test_get_tracking_item_without_articles(monkeypatch, dynamodb_item):
+    """Articles are not read when not requested, consistent read is configurable."""
+    monkeypatch.setattr("app.db.dynamodb.settings.DYNAMODB_CONSISTENT_READ", True)
+    database = DatabaseDynamoDb()
+    summary = {name: value for name, value in dynamodb_item.items() if name != "articles"}
+
+    with Stubber(database.dynamodb_client) as stubber:
+        stubber.add_response("get_item", {"Item": summary}, {
+            "TableName": database.shipments_table.name,
+            "Key": {"tracking_number": {"S": "TN12345678"}, "carrier": {"S": "DHL"}},
+            "ConsistentRead": True,
+            "ProjectionExpression": DatabaseDynamoDb.summary_projection,
+            "ExpressionAttributeNames": {"#status": "status"},
+        })
+        item = database.get_tracking_item("TN12345678", "DHL", include_articles=False)
+
+    assert item.status == "in-transit"
+    assert item.articles is None
+
+
+def test_get_tracking_items_chunks_and_retries(monkeypatch, dynamodb_item):
+    """BatchGetItem is chunked by 100 keys and unprocessed keys are requested again"""
+    monkeypatch.setattr("app.db.dynamodb.time.sleep", lambda seconds: None)
+    database = DatabaseDynamoDb()
+    table = database.shipments_table.name
+    keys = [(f"TN{i}", "DHL") for i in range(150)]
+    unprocessed = {table: {"Keys": [{"tracking_number": {"S": "TN12345678"}, "carrier": {"S": "DHL"}}]}}
+
+    with Stubber(database.dynamodb_client) as stubber:
+        stubber.add_response("batch_get_item", {"Responses": {table: []}, "UnprocessedKeys": unprocessed})
+        stubber.add_response("batch_get_item", {"Responses": {table: [dynamodb_item]}, "UnprocessedKeys": {}})
+        stubber.add_response("batch_get_item", {"Responses": {table: []}, "UnprocessedKeys": {}})
+        items = database.get_tracking_items(keys)
+        stubber.assert_no_pending_responses()
+
+    assert list(items) == [("TN12345678", "DHL")]
+
+
+def test_get_tracking_items_retries_exhausted(monkeypatch):
+    """DatabaseException is raised when keys stay unprocessed"""
+    monkeypatch.setattr("app.db.dynamodb.time.sleep", lambda seconds: None)
+    database = DatabaseDynamoDb()
+    table = database.shipments_table.name
+    unprocessed = {table: {"Keys": [{"tracking_number": {"S": "TN12345678"}, "carrier": {"S": "DHL"}}]}}
+
+    with Stubber(database.dynamodb_client) as stubber:
+        for _ in range(10):
+            stubber.add_response("batch_get_item", {"Responses": {table: []}, "UnprocessedKeys": unprocessed})
+        with pytest.raises(DatabaseException):
+            database.get_tracking_items([("TN12345678", "DHL")])
+
+
+@pytest.fixture
+def snapshot_source(dynamodb_item):
+    """DynamoDB provider mock with one stored item."""
+    source = MagicMock()
+    source.scan_items.return_value = [{**DatabaseDynamoDb.deserialize(dynamodb_item), "content_hash": "v1"}]
+    return source
+
+
+@pytest.fixture
+def snapshot(monkeypatch, snapshot_source):
+    monkeypatch.setattr("app.db.snapshot.settings.SNAPSHOT_REFRESH_INTERVAL", 0)
+    return DatabaseSnapshot(source=snapshot_source)
+
+
+def test_snapshot_get_tracking_item(snapshot, snapshot_source):
+    """Snapshot answers from memory without DynamoDB calls, carrier and status strings are interned."""
+    item = snapshot.get_tracking_item("TN12345678", "DHL")
+
+    assert item.status == "in-transit"
+    assert item.content_hash == "v1"
+    assert item.articles[0].article_quantity == 1
+    assert item.model_dump() == TrackingItem(**item.model_dump()).model_dump()
+    snapshot_source.get_tracking_item.assert_not_called()
+    record = snapshot.records[("TN12345678", "DHL")]
+    assert record.carrier is sys.intern("DHL")
+
+
+def test_snapshot_read_through(snapshot, snapshot_source):
+    """Missing shipment is read from DynamoDB once and kept in snapshot."""
+    tracking_item = snapshot.get_tracking_item("TN12345678", "DHL").model_copy(update={"tracking_number": "TN2"})
+    snapshot_source.get_tracking_item.return_value = tracking_item
+
+    assert snapshot.get_tracking_item("TN2", "DHL") == tracking_item
+    assert snapshot.get_tracking_item("TN2", "DHL") == tracking_item
+    snapshot_source.get_tracking_item.assert_called_once_with("TN2", "DHL")
+    assert snapshot.get_tracking_item("TN2", "DHL", include_articles=False).articles is None
+
+
+def test_snapshot_refresh(snapshot, snapshot_source, dynamodb_item):
+    """Refresh reloads only items with changed content hash and drops deleted ones."""
+    changed = {**DatabaseDynamoDb.deserialize(dynamodb_item), "status": "delivered", "content_hash": "v2"}
+    snapshot.records[("TN9", "UPS")] = snapshot.records[("TN12345678", "DHL")]
+    snapshot_source.scan_items.return_value = [{"tracking_number": "TN12345678", "carrier": "DHL",
+                                                "content_hash": "v2"}]
+    snapshot_source.batch_get.return_value = {("TN12345678", "DHL"): changed}
+
+    snapshot.refresh()
+
+    snapshot_source.batch_get.assert_called_once_with([("TN12345678", "DHL")])
+    assert snapshot.get_tracking_item("TN12345678", "DHL").status == "delivered"
+    assert ("TN9", "UPS") not in snapshot.records
+
+
+@pytest.fixture
+def tracking_item(dynamodb_item):
+    return TrackingItem(**DatabaseDynamoDb.deserialize(dynamodb_item))
+
+
+@pytest.fixture
+def mock_redis(monkeypatch):
+    """Redis mock with empty cache."""
+    mock_client = MagicMock()
+    mock_client.mget.side_effect = lambda keys: [None] * len(keys)
+    monkeypatch.setattr("app.integrations.cache.redis_client", mock_client)
+    return mock_client
+
+
+def test_cached_database_positive_and_negative(mock_redis, tracking_item):
+    """Found and not found results are served from cache on repeated lookups."""
+    provider = MagicMock()
+    provider.get_tracking_item.side_effect = lambda tn, carrier: tracking_item if tn == "TN12345678" else None
+    database = CachedDatabase(provider)
+
+    for _ in range(3):
+        assert database.get_tracking_item("TN12345678", "DHL") == tracking_item
+        assert database.get_tracking_item("TN00000000", "DHL") is None
+
+    assert provider.get_tracking_item.call_count == 2
+    stored = {call.args[0]: call.args[1:] for call in mock_redis.pipeline.return_value.setex.call_args_list}
+    assert stored["tracking:TN00000000:DHL"] == (int(database.negative_ttl), NOT_FOUND)
+
+
+def test_cached_database_redis_hit(mock_redis, tracking_item):
+    """Items cached in Redis by another worker are not read from provider."""
+    mock_redis.mget.side_effect = lambda keys: [tracking_item.model_dump_json().encode(), NOT_FOUND]
+    provider = MagicMock()
+    database = CachedDatabase(provider)
+
+    items = database.get_tracking_items([("TN12345678", "DHL"), ("TN00000000", "DHL")])
+
+    assert items == {("TN12345678", "DHL"): tracking_item}
+    provider.get_tracking_items.assert_not_called()
+
+
+def test_cached_database_keeps_content_hash(mock_redis, tracking_item):
+    """Content hash survives Redis round trip, but is not part of the item JSON."""
+    tracking_item.content_hash = "v1"
+    provider = MagicMock()
+    provider.get_tracking_item.return_value = tracking_item
+
+    CachedDatabase(provider).get_tracking_item("TN12345678", "DHL")
+    value = mock_redis.pipeline.return_value.setex.call_args.args[2]
+    mock_redis.mget.side_effect = lambda keys: [value]
+
+    assert CachedDatabase(provider).get_tracking_item("TN12345678", "DHL").content_hash == "v1"
+    assert "content_hash" not in tracking_item.model_dump_json()
+    provider.get_tracking_item.assert_called_once()
+
+
+def test_cached_database_invalidate(mock_redis, tracking_item):
+    """Invalidated item is read from provider again."""
+    provider = MagicMock()
+    provider.get_tracking_item.return_value = tracking_item
+    database = CachedDatabase(provider)
+
+    database.get_tracking_item("TN12345678", "DHL")
+    database.invalidate([("TN12345678", "DHL")])
+    database.get_tracking_item("TN12345678", "DHL")
+
+    assert provider.get_tracking_item.call_count == 2
+    mock_redis.delete.assert_called_once_with("tracking:TN12345678:DHL")
+
+
+def test_factory_cached_provider(monkeypatch):
+    """Cached provider wraps the shared provider instance."""
+    monkeypatch.setattr("app.db.cache.cache.redis_client", MagicMock())
+    cached = DatabaseFactory.get_provider("dynamodb", cached=True)
+
+    assert isinstance(cached, CachedDatabase)
+    assert cached.provider is DatabaseFactory.get_provider("dynamodb")
+    assert DatabaseFactory.get_provider("dynamodb", cached=True) is cached
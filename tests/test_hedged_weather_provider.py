@@ -0,0 +1,155 @@
+import time
+
+import pytest
+import requests
+import requests_mock
+
+from app.api.models import WeatherItem
+from app.conf.metrics import weather_hedge_total
+from app.conf.settings import settings
+from app.integrations import weather
+from app.integrations.http import LatencyTracker
+from app.integrations.weather import (
+    CachedWeatherProvider,
+    HedgedWeatherProvider,
+    OpenWeatherMapWeatherProvider,
+    WeatherException,
+    WeatherServiceFactory,
+    openweathermap_breaker,
+)
+
+
+class StubProvider(CachedWeatherProvider):
+    """Provider answering after `delay` seconds, or failing."""
+
+    def __init__(self, city: str, delay: float = 0.0, error: Exception | None = None):
+        self.city = city
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.latency = LatencyTracker(window=100)
+
+    def request_weather(self, zip_code: str, country_code: str) -> WeatherItem:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return WeatherItem(wind="south", temp=10, city=self.city, cloud=0, description="Clear sky")
+
+
+@pytest.fixture(autouse=True)
+def hedge_settings(monkeypatch):
+    monkeypatch.setattr(settings, "WEATHER_HEDGE_DELAY", 0.05)
+    monkeypatch.setattr(settings, "WEATHER_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(settings, "WEATHER_HEDGE_MAX_DELAY", 1.0)
+
+
+def test_primary_answers_before_hedge():
+    """Fast primary is the only provider called."""
+    primary, secondary = StubProvider("primary"), StubProvider("secondary")
+
+    result = HedgedWeatherProvider([primary, secondary]).get_weather_by_location("75001", "FR")
+
+    assert result.city == "primary"
+    assert secondary.calls == 0
+
+
+def test_slow_primary_is_hedged():
+    """Secondary is asked when primary is slower than the hedge delay, first answer wins."""
+    primary, secondary = StubProvider("primary", delay=0.5), StubProvider("secondary")
+    hedged = weather_hedge_total.value(result="hedged")
+
+    started = time.monotonic()
+    result = HedgedWeatherProvider([primary, secondary]).get_weather_by_location("75001", "FR")
+
+    assert result.city == "secondary"
+    assert time.monotonic() - started < 0.4
+    assert weather_hedge_total.value(result="hedged") == hedged + 1
+
+
+def test_failed_primary_fails_over():
+    """Failure of primary sends the request to secondary without waiting for the hedge delay."""
+    primary = StubProvider("primary", error=WeatherException("Weather API is unavailable"))
+    secondary = StubProvider("secondary")
+
+    result = HedgedWeatherProvider([primary, secondary]).get_weather_by_location("75001", "FR")
+
+    assert result.city == "secondary"
+    assert primary.calls == 1
+
+
+def test_all_providers_fail_serves_last_known(monkeypatch):
+    """Last known weather of the location is returned when every provider fails."""
+    last_known = WeatherItem(wind="north", temp=5, city="Paris", cloud=90, description="Overcast")
+    monkeypatch.setattr(weather, "get_last_known_weather", lambda zip_code, country_code: last_known)
+    providers = [StubProvider(name, error=WeatherException("Failed")) for name in ("primary", "secondary")]
+
+    assert HedgedWeatherProvider(providers).get_weather_by_location("75001", "FR") == last_known
+
+
+def test_all_providers_fail_without_last_known():
+    providers = [StubProvider(name, error=WeatherException("Failed")) for name in ("primary", "secondary")]
+
+    with pytest.raises(WeatherException):
+        HedgedWeatherProvider(providers).get_weather_by_location("75001", "FR")
+
+
+def test_hedge_delay_follows_latency_percentile():
+    """Hedge delay is the latency percentile of recent calls, bounded by min and max delay."""
+    provider = StubProvider("primary")
+    assert HedgedWeatherProvider.hedge_delay(provider) == 0.05
+
+    for duration in range(1, 101):
+        provider.latency.record(duration / 1000)
+    assert HedgedWeatherProvider.hedge_delay(provider) == pytest.approx(0.096)
+
+    provider.latency.record(5.0)
+    for _ in range(99):
+        provider.latency.record(3.0)
+    assert HedgedWeatherProvider.hedge_delay(provider) == 1.0
+
+
+def test_factory_builds_hedged_provider(monkeypatch):
+    """Hedged provider and its providers are shared instances, built once."""
+    monkeypatch.setattr(settings, "WEATHER_HEDGE_PROVIDERS", "weatherbit, openweathermap")
+    WeatherServiceFactory.reset()
+
+    provider = WeatherServiceFactory.get_provider("hedged")
+
+    assert [type(inner).__name__ for inner in provider.providers] == [
+        "WeatherbitWeatherProvider", "OpenWeatherMapWeatherProvider"
+    ]
+    assert WeatherServiceFactory.get_provider("hedged") is provider
+    assert provider.providers[0] is WeatherServiceFactory.get_provider("weatherbit")
+    WeatherServiceFactory.reset()
+
+
+def test_openweathermap_unified():
+    """OpenWeatherMap response is unified to Weatherbit wind names and capitalized description."""
+    openweathermap_breaker.reset()
+    response = {"name": "Paris", "main": {"temp": 8.7}, "clouds": {"all": 75}, "wind": {"speed": 3.1, "deg": 200},
+                "weather": [{"description": "light rain"}], "cod": 200}
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.OPENWEATHERMAP_API_URL, json=response, status_code=200)
+        result = OpenWeatherMapWeatherProvider().get_weather_by_location("75001", "FR")
+
+    assert result == WeatherItem(wind="south-southwest", temp=8.7, city="Paris", cloud=75, description="Light rain")
+    assert mocker.last_request.qs["zip"] == ["75001,fr"]
+
+
+def test_openweathermap_half_open_trial_released(monkeypatch):
+    """Unexpected request error of the half-open trial opens the breaker again instead of blocking it forever."""
+    openweathermap_breaker.reset()
+    monkeypatch.setattr(openweathermap_breaker, "failure_threshold", 1)
+    monkeypatch.setattr(openweathermap_breaker, "reset_timeout", 0)
+    openweathermap_breaker.record_failure()
+    assert openweathermap_breaker.state == "half-open"
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.OPENWEATHERMAP_API_URL, exc=requests.TooManyRedirects)
+        with pytest.raises(WeatherException):
+            OpenWeatherMapWeatherProvider().get_weather_by_location("75001", "FR")
+
+        assert openweathermap_breaker.allow()
+    openweathermap_breaker.reset()
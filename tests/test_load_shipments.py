@@ -0,0 +1,270 @@
+import csv
+
+import pytest
+import redis
+from botocore.stub import Stubber
+from unittest.mock import MagicMock
+
+from app import load_shipments
+from app.db.dynamodb import DatabaseDynamoDb, DatabaseException
+from app.load_shipments import Checkpoint, group_items, load_shipments_from_csv, sort_rows, with_hashes
+
+FIELDS = ["tracking_number", "carrier", "sender_address", "receiver_address", "status",
+          "article_name", "article_quantity", "article_price", "SKU"]
+
+
+def make_row(tracking_number, carrier, article_name):
+    return {
+        "tracking_number": tracking_number,
+        "carrier": carrier,
+        "sender_address": "Street 1, 10115 Berlin, Germany",
+        "receiver_address": "Street 10, 75001 Paris, France",
+        "status": "in-transit",
+        "article_name": article_name,
+        "article_quantity": "1",
+        "article_price": "10",
+        "SKU": article_name.upper(),
+    }
+
+
+@pytest.fixture(autouse=True)
+def mock_location_index(monkeypatch):
+    """Receiver locations index without Redis."""
+    mock_index = MagicMock()
+    monkeypatch.setattr(load_shipments, "location_index", mock_index)
+    return mock_index
+
+
+@pytest.fixture
+def unsorted_rows():
+    """Articles of the same shipment are spread over the file."""
+    return [
+        make_row("TN2", "DHL", "mouse"),
+        make_row("TN1", "UPS", "laptop"),
+        make_row("TN2", "DHL", "keyboard"),
+        make_row("TN1", "DHL", "monitor"),
+        make_row("TN2", "DHL", "cable"),
+    ]
+
+
+@pytest.fixture
+def csv_file(tmp_path, unsorted_rows):
+    filename = tmp_path / "shipments.csv"
+    with open(filename, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(unsorted_rows)
+    return str(filename)
+
+
+def test_sort_and_group_with_spill(unsorted_rows):
+    """Rows sorted through small spilled chunks are grouped into items, article order is kept."""
+    items = list(group_items(sort_rows(unsorted_rows, chunk_rows=2)))
+
+    assert [(item["tracking_number"], item["carrier"]) for item in items] == [
+        ("TN1", "DHL"), ("TN1", "UPS"), ("TN2", "DHL")
+    ]
+    assert [article["article_name"] for article in items[2]["articles"]] == ["mouse", "keyboard", "cable"]
+
+
+def test_load_shipments_parallel(monkeypatch, csv_file):
+    """Every shipment is written exactly once by parallel workers."""
+    database = MagicMock()
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+
+    load_shipments_from_csv(csv_file, workers=3)
+
+    written = [item for call in database.write_tracking_items.call_args_list for item in call.args[0]]
+    assert sorted((item["tracking_number"], item["carrier"]) for item in written) == [
+        ("TN1", "DHL"), ("TN1", "UPS"), ("TN2", "DHL")
+    ]
+    database.create_tracking_table.assert_called_once()
+
+
+def test_load_shipments_clears_locations(monkeypatch, csv_file, mock_location_index):
+    """Full reload drops indexed receiver locations of the replaced table, incremental import keeps them."""
+    database = MagicMock()
+    database.get_content_hashes.return_value = {}
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+
+    load_shipments_from_csv(csv_file, workers=1, incremental=True)
+    mock_location_index.clear.assert_not_called()
+
+    mock_location_index.clear.side_effect = redis.ConnectionError("Connection refused")
+    load_shipments_from_csv(csv_file, workers=1)
+    mock_location_index.clear.assert_called_once()
+
+
+def test_load_shipments_location_index_error(monkeypatch, csv_file, mock_location_index):
+    """Unavailable Redis does not stop the import, shipments are written without indexed locations."""
+    database = MagicMock()
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+    monkeypatch.setattr(load_shipments.settings, "WEATHER_PREFETCH", True)
+    mock_location_index.put_locations.side_effect = redis.ConnectionError("Connection refused")
+
+    load_shipments_from_csv(csv_file, workers=1)
+
+    mock_location_index.put_locations.assert_called()
+    assert sum(len(call.args[0]) for call in database.write_tracking_items.call_args_list) == 3
+
+
+def test_load_shipments_cache_invalidation_error(monkeypatch, csv_file):
+    """Unavailable Redis does not stop the import, cached shipments expire after their TTL."""
+    database = MagicMock()
+    invalidate = MagicMock(side_effect=redis.ConnectionError("Connection refused"))
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+    monkeypatch.setattr(load_shipments, "invalidate_tracking_items", invalidate)
+    monkeypatch.setattr(load_shipments.settings, "TRACKING_CACHE", True)
+
+    load_shipments_from_csv(csv_file, workers=1)
+
+    invalidate.assert_called()
+    assert sum(len(call.args[0]) for call in database.write_tracking_items.call_args_list) == 3
+
+
+def test_load_shipments_write_error(monkeypatch, csv_file):
+    """Worker errors stop the import."""
+    database = MagicMock()
+    database.write_tracking_items.side_effect = DatabaseException("Write failed")
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+
+    with pytest.raises(DatabaseException):
+        load_shipments_from_csv(csv_file, workers=2)
+
+
+def test_write_tracking_items_retries(monkeypatch):
+    """Unprocessed items and throttling errors are retried."""
+    monkeypatch.setattr("app.db.dynamodb.time.sleep", lambda seconds: None)
+    database = DatabaseDynamoDb()
+    table = database.shipments_table.name
+    item = {"tracking_number": "TN1", "carrier": "DHL", "status": "in-transit", "articles": []}
+    unprocessed = {table: [{"PutRequest": {"Item": DatabaseDynamoDb.serialize(item)}}]}
+
+    with Stubber(database.dynamodb_client) as stubber:
+        stubber.add_client_error("batch_write_item", service_error_code="ProvisionedThroughputExceededException")
+        stubber.add_response("batch_write_item", {"UnprocessedItems": unprocessed})
+        stubber.add_response("batch_write_item", {"UnprocessedItems": {}})
+        database.write_tracking_items([item])
+        stubber.assert_no_pending_responses()
+
+
+def test_update_tracking_status_retries(monkeypatch):
+    """Throttled status updates are retried, other errors are raised at once."""
+    monkeypatch.setattr("app.db.dynamodb.time.sleep", lambda seconds: None)
+    database = DatabaseDynamoDb()
+
+    with Stubber(database.dynamodb_client) as stubber:
+        stubber.add_client_error("update_item", service_error_code="ThrottlingException")
+        stubber.add_response("update_item", {})
+        database.update_tracking_status("TN1", "DHL", "delivered", "hash", max_retries=2)
+        stubber.assert_no_pending_responses()
+
+        stubber.add_client_error("update_item", service_error_code="ValidationException")
+        with pytest.raises(DatabaseException):
+            database.update_tracking_status("TN1", "DHL", "delivered", "hash", max_retries=2)
+
+
+def stored_hashes(rows, **changes):
+    """Content hashes of items built from rows, as stored by previous import."""
+    hashes = {}
+    for item in group_items(sort_rows(rows, chunk_rows=100)):
+        item.update(changes.get(item["tracking_number"], {}))
+        item = with_hashes(item)
+        hashes[(item["tracking_number"], item["carrier"])] = {
+            "content_hash": item["content_hash"], "details_hash": item["details_hash"], "status": item["status"]
+        }
+    return hashes
+
+
+def test_load_shipments_incremental(monkeypatch, csv_file, unsorted_rows):
+    """Only new or changed items are written, status-only changes are updated, table is kept."""
+    hashes = stored_hashes(unsorted_rows, TN2={"status": "pending"})
+    del hashes[("TN1", "UPS")]
+    database = MagicMock()
+    database.get_content_hashes.side_effect = lambda keys: {key: hashes[key] for key in keys if key in hashes}
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+
+    load_shipments_from_csv(csv_file, workers=1, incremental=True)
+
+    written = [item for call in database.write_tracking_items.call_args_list for item in call.args[0]]
+    assert [(item["tracking_number"], item["carrier"]) for item in written] == [("TN1", "UPS")]
+    database.update_tracking_status.assert_called_once()
+    assert database.update_tracking_status.call_args.args[:3] == ("TN2", "DHL", "in-transit")
+    database.create_tracking_table.assert_not_called()
+    database.ensure_tracking_table.assert_called_once()
+
+
+def test_load_shipments_publishes_status(monkeypatch, csv_file, unsorted_rows):
+    """New and status-updated shipments are published to status subscribers, other changes are not."""
+    hashes = stored_hashes(unsorted_rows, TN1={"sender_address": "Old street"}, TN2={"status": "pending"})
+    del hashes[("TN1", "UPS")]
+    database = MagicMock()
+    database.get_content_hashes.side_effect = lambda keys: {key: hashes[key] for key in keys if key in hashes}
+    broadcaster = MagicMock()
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+    monkeypatch.setattr(load_shipments, "status_broadcaster", broadcaster)
+    monkeypatch.setattr(load_shipments.settings, "STATUS_NOTIFICATIONS", True)
+
+    load_shipments_from_csv(csv_file, workers=1, incremental=True)
+
+    published = [item for call in broadcaster.publish.call_args_list for item in call.args[0]]
+    assert sorted((item["tracking_number"], item["carrier"]) for item in published) == [("TN1", "UPS"), ("TN2", "DHL")]
+    written = [item for call in database.write_tracking_items.call_args_list for item in call.args[0]]
+    assert ("TN1", "DHL") in [(item["tracking_number"], item["carrier"]) for item in written]
+
+
+def test_load_shipments_publish_error(monkeypatch, csv_file):
+    """Unavailable status channel does not stop the import."""
+    database = MagicMock()
+    broadcaster = MagicMock()
+    broadcaster.publish.side_effect = redis.ConnectionError("Connection refused")
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+    monkeypatch.setattr(load_shipments, "status_broadcaster", broadcaster)
+    monkeypatch.setattr(load_shipments.settings, "STATUS_NOTIFICATIONS", True)
+    monkeypatch.setattr(load_shipments.settings, "STATUS_NOTIFICATIONS_FULL_RELOAD", True)
+
+    load_shipments_from_csv(csv_file, workers=2)
+
+    broadcaster.publish.assert_called()
+    assert sum(len(call.args[0]) for call in database.write_tracking_items.call_args_list) == 3
+
+
+def test_load_shipments_full_reload_publishing(monkeypatch, csv_file):
+    """Full reload publishes shipments only when enabled for full reloads."""
+    broadcaster = MagicMock()
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", MagicMock)
+    monkeypatch.setattr(load_shipments, "status_broadcaster", broadcaster)
+    monkeypatch.setattr(load_shipments.settings, "STATUS_NOTIFICATIONS", True)
+
+    load_shipments_from_csv(csv_file, workers=1)
+    broadcaster.publish.assert_not_called()
+
+    monkeypatch.setattr(load_shipments.settings, "STATUS_NOTIFICATIONS_FULL_RELOAD", True)
+    load_shipments_from_csv(csv_file, workers=1)
+    assert sum(len(call.args[0]) for call in broadcaster.publish.call_args_list) == 3
+
+
+def test_load_shipments_resume(monkeypatch, csv_file):
+    """Interrupted incremental import continues after checkpoint, checkpoint is removed on success."""
+    checkpoint = Checkpoint(csv_file)
+    checkpoint.last_key = ("TN1", "DHL")
+    checkpoint.save()
+    database = MagicMock()
+    database.get_content_hashes.return_value = {}
+    monkeypatch.setattr(load_shipments, "DatabaseDynamoDb", lambda: database)
+
+    load_shipments_from_csv(csv_file, workers=1, incremental=True)
+
+    written = [item for call in database.write_tracking_items.call_args_list for item in call.args[0]]
+    assert [(item["tracking_number"], item["carrier"]) for item in written] == [("TN1", "UPS"), ("TN2", "DHL")]
+    assert Checkpoint(csv_file).load() is None
+
+
+def test_checkpoint_waits_for_gaps(csv_file):
+    """Checkpoint advances only over contiguous finished batches."""
+    checkpoint = Checkpoint(csv_file)
+    checkpoint.finish(1, ("TN2", "DHL"))
+    assert checkpoint.last_key is None
+
+    checkpoint.finish(0, ("TN1", "DHL"))
+    assert checkpoint.last_key == ("TN2", "DHL")
@@ -0,0 +1,75 @@
+import json
+import logging
+from logging.handlers import QueueHandler
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.tracking import get_database, get_weather, get_locations
+from app.conf.logging import get_logger
+from app.conf.settings import settings
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_get_logger_configured_once():
+    """Repeated calls reuse the same logger with a single queue handler."""
+    logger = get_logger()
+    for _ in range(10):
+        assert get_logger() is logger
+
+    assert len(logger.handlers) == 1
+    assert isinstance(logger.handlers[0], QueueHandler)
+
+
+def test_handlers_do_not_grow_with_requests():
+    """Requests do not attach new handlers."""
+    mock_database = MagicMock()
+    mock_database.get_tracking_item.return_value = None
+    app.dependency_overrides[get_database] = lambda: mock_database
+    app.dependency_overrides[get_weather] = lambda: MagicMock()
+    app.dependency_overrides[get_locations] = lambda: None
+    try:
+        for _ in range(5):
+            assert client.get("/track/DHL/TN12345678").status_code == 404
+    finally:
+        app.dependency_overrides = {}
+
+    assert len(logging.getLogger("trackapi").handlers) == 1
+
+
+@pytest.fixture
+def debug_logging(caplog):
+    """Enable DEBUG level of "trackapi" logger and mock providers."""
+    get_logger()
+    caplog.set_level(logging.DEBUG, logger="trackapi")
+    mock_database = MagicMock()
+    mock_database.get_tracking_item.return_value = None
+    app.dependency_overrides[get_database] = lambda: mock_database
+    app.dependency_overrides[get_weather] = lambda: MagicMock()
+    app.dependency_overrides[get_locations] = lambda: None
+    yield caplog
+    app.dependency_overrides = {}
+
+
+def test_request_log_is_json(debug_logging):
+    """Request record is pre-serialized JSON with allowed headers and without injected providers."""
+    client.get("/track/DHL/TN12345678", headers={"User-Agent": "bench", "Authorization": "secret"})
+
+    records = [json.loads(record.getMessage()) for record in debug_logging.records if record.name == "trackapi"]
+    request_record = next(record for record in records if record["action"] == "request")
+    assert request_record["arguments"] == {"carrier": "DHL", "tracking_number": "TN12345678"}
+    assert request_record["headers"] == {"user-agent": "bench"}
+
+
+def test_request_log_sampling(debug_logging, monkeypatch):
+    """Not sampled requests log only errors."""
+    monkeypatch.setattr(settings, "LOG_SAMPLE_RATE", 0.0)
+
+    client.get("/track/DHL/TN12345678")
+
+    actions = [json.loads(record.getMessage())["action"] for record in debug_logging.records
+               if record.name == "trackapi"]
+    assert actions == ["error_response"]
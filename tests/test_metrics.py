@@ -0,0 +1,85 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+
+from app.api.models import TrackingItem, WeatherItem
+from app.api.tracking import get_database, get_locations, get_weather
+from app.conf.metrics import MetricsMiddleware, MetricsRegistry, registry, stage_seconds
+from app.main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def tracking_dependencies():
+    mock_database = MagicMock()
+    mock_database.get_tracking_item.return_value = TrackingItem(
+        tracking_number="TN12345678", carrier="DHL", status="in-transit", articles=[],
+        sender_address="Street 1, 10115 Berlin, Germany", receiver_address="Street 10, 75001 Paris, France",
+    )
+    mock_weather = MagicMock()
+    mock_weather.get_weather.return_value = WeatherItem(wind="south", temp=10, city="Paris", cloud=0,
+                                                        description="Clear sky")
+    app.dependency_overrides[get_database] = lambda: mock_database
+    app.dependency_overrides[get_weather] = lambda: mock_weather
+    app.dependency_overrides[get_locations] = lambda: None
+    registry.reset()
+    yield
+    app.dependency_overrides = {}
+    registry.reset()
+
+
+def test_prometheus_format():
+    """Counters and histograms are rendered in Prometheus text format."""
+    metrics = MetricsRegistry()
+    counter = metrics.counter("test_total", "Test counter")
+    histogram = metrics.histogram("test_seconds", "Test histogram", buckets=(0.1, 1.0))
+    counter.inc(result="hit")
+    counter.inc(2, result="hit")
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE test_total counter" in lines
+    assert 'test_total{result="hit"} 3' in lines
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 2' in lines
+    assert 'test_seconds_count{stage="a"} 2' in lines
+    assert histogram.total(stage="a") == pytest.approx(0.55)
+
+
+def test_metrics_endpoint(tracking_dependencies):
+    """Request and stage timings of tracking requests are exposed on /metrics."""
+    assert client.get("/track/DHL/TN12345678").status_code == 200
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'trackapi_request_seconds_count{route="/track/{carrier}/{tracking_number}",status="200"} 1' in response.text
+    for stage in ("database", "weather", "serialize"):
+        assert stage_seconds.count(stage=stage) == 1
+
+
+def test_embedded_metric_format(capsys):
+    """Values recorded during request are written as one EMF document."""
+    emf_app = FastAPI()
+
+    @emf_app.get("/stage")
+    async def stage():
+        stage_seconds.observe(0.01, stage="database")
+        return {}
+
+    emf_app.add_middleware(MetricsMiddleware, emit_emf=True)
+    TestClient(emf_app).get("/stage")
+
+    document = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    metrics = {metric["Name"]: metric["Unit"] for metric in document["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert metrics == {"trackapi_stage_seconds.database": "Seconds", "trackapi_request_seconds": "Seconds"}
+    assert document["route"] == "/stage"
+    assert document["trackapi_stage_seconds.database"] == 0.01
+    registry.reset()
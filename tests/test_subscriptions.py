@@ -0,0 +1,162 @@
+import asyncio
+import threading
+
+import pytest
+import redis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+
+from app.api import subscriptions
+from app.api.models import StatusEvent, TrackingItem
+from app.api.tracking import get_database
+from app.db.dynamodb import DatabaseException
+from app.integrations.notifications import StatusBroadcaster
+
+app = FastAPI()
+app.include_router(subscriptions.router)
+client = TestClient(app)
+
+
+def status_message(tracking_number: str, carrier: str, status: str) -> bytes:
+    return StatusEvent(tracking_number=tracking_number, carrier=carrier, status=status).model_dump_json().encode()
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    """Broadcaster without listener thread, messages are dispatched by tests."""
+    broadcaster = StatusBroadcaster(MagicMock(), "status")
+    monkeypatch.setattr(broadcaster, "start", lambda: None)
+    return broadcaster
+
+
+@pytest.fixture
+def mock_database():
+    mock_db = MagicMock()
+    mock_db.get_tracking_items.side_effect = lambda keys: {
+        key: TrackingItem(tracking_number=key[0], carrier=key[1], sender_address="Street 1, 10115 Berlin, Germany",
+                          receiver_address="Street 10, 75001 Paris, France", status="in-transit")
+        for key in keys if key[0] != "TN404"
+    }
+    return mock_db
+
+
+@pytest.fixture(autouse=True)
+def override_dependencies(monkeypatch, mock_database, broadcaster):
+    app.dependency_overrides[get_database] = lambda: mock_database
+    app.dependency_overrides[subscriptions.get_broadcaster] = lambda: broadcaster
+    monkeypatch.setattr("app.api.subscriptions.settings.SUBSCRIPTION_KEEPALIVE", 0.1)
+    monkeypatch.setattr("app.api.subscriptions.settings.SUBSCRIPTION_MAX_DURATION", 0.5)
+    yield
+    app.dependency_overrides = {}
+
+
+def test_publish(broadcaster):
+    """Written shipments are published in one pipeline."""
+    broadcaster.publish([{"tracking_number": "TN1", "carrier": "DHL", "status": "delivered", "articles": []}])
+
+    pipeline = broadcaster.client.pipeline.return_value
+    pipeline.publish.assert_called_once_with("status", status_message("TN1", "DHL", "delivered").decode())
+    pipeline.execute.assert_called_once()
+
+
+async def test_fan_out(broadcaster):
+    """Messages reach subscriptions of the shipment, only the latest change of a shipment is kept."""
+    first = broadcaster.subscribe([("TN1", "DHL")])
+    second = broadcaster.subscribe([("TN1", "DHL"), ("TN2", "UPS")])
+
+    def publish():
+        for status in ("pending", "in-transit"):
+            broadcaster.dispatch(status_message("TN1", "DHL", status))
+        broadcaster.dispatch(b"not a status")
+
+    listener = threading.Thread(target=publish)
+    listener.start()
+    listener.join()
+    await asyncio.sleep(0.01)
+
+    events, resync = await first.wait(0.1)
+    assert [event.status for event in events] == ["in-transit"]
+    assert not resync
+    assert (await second.wait(0.1))[0] == events
+    assert await first.wait(0.01) == ([], False)
+
+    broadcaster.unsubscribe(second)
+    broadcaster.dispatch(status_message("TN2", "UPS", "delivered"))
+    await asyncio.sleep(0.01)
+    assert await second.wait(0.01) == ([], False)
+    assert list(broadcaster._subscriptions) == [("TN1", "DHL")]
+
+
+async def test_listener_resubscribes(monkeypatch, broadcaster):
+    """Listener reconnects after Redis errors and asks clients to read statuses again."""
+    monkeypatch.setattr("app.integrations.notifications.settings.SUBSCRIPTION_RECONNECT_DELAY", 0)
+    subscription = broadcaster.subscribe([("TN1", "DHL")])
+    pubsub = broadcaster.client.pubsub.return_value
+    pubsub.listen.side_effect = [
+        redis.ConnectionError("connection lost"),
+        iter([{"type": "message", "data": status_message("TN1", "DHL", "delivered")}]),
+        KeyboardInterrupt,
+    ]
+
+    with pytest.raises(KeyboardInterrupt):
+        broadcaster._listen()
+    await asyncio.sleep(0.01)
+
+    events, resync = await subscription.wait(0.1)
+    assert [event.status for event in events] == ["delivered"]
+    assert resync
+    assert pubsub.subscribe.call_count == 3
+
+
+def test_subscribe_stream(broadcaster):
+    """Current statuses are sent first, then only changed statuses, keep-alive while idle."""
+    def publish():
+        for status in ("in-transit", "delivered"):
+            broadcaster.dispatch(status_message("TN1", "DHL", status))
+
+    timer = threading.Timer(0.2, publish)
+    timer.start()
+    response = client.get("/track/subscribe?shipment=DHL/TN1&shipment=UPS/TN404")
+    timer.join()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line.removeprefix("data: ") for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [StatusEvent.model_validate_json(event).status for event in events] == ["in-transit", "delivered"]
+    assert ": keep-alive" in response.text
+    assert broadcaster._subscriptions == {}
+
+
+def test_subscribe_resync(broadcaster, mock_database):
+    """Statuses are read again after the status channel reconnected."""
+    def reconnect():
+        mock_database.get_tracking_items.side_effect = lambda keys: {
+            ("TN1", "DHL"): TrackingItem(tracking_number="TN1", carrier="DHL", sender_address="a",
+                                         receiver_address="b", status="delivered")
+        }
+        broadcaster.resync()
+
+    timer = threading.Timer(0.2, reconnect)
+    timer.start()
+    response = client.get("/track/subscribe?shipment=DHL/TN1")
+    timer.join()
+
+    assert response.text.count("event: status") == 2
+    assert '"status":"delivered"' in response.text
+
+
+def test_subscribe_invalid(broadcaster, mock_database):
+    response = client.get("/track/subscribe?shipment=TN1")
+
+    assert response.status_code == 422
+    mock_database.get_tracking_items.assert_not_called()
+
+
+def test_subscribe_database_exception(broadcaster, mock_database):
+    mock_database.get_tracking_items.side_effect = DatabaseException("Database error")
+
+    response = client.get("/track/subscribe?shipment=DHL/TN1")
+
+    assert response.status_code == 500
+    assert broadcaster._subscriptions == {}
@@ -1,12 +1,18 @@
+import asyncio
+import json
+import time
+
+import httpx
 import pytest
+import redis
 from unittest.mock import MagicMock
 from fastapi.testclient import TestClient
 
-from app.api.models import WeatherItem, TrackingItem
+from app.api.models import WeatherItem, TrackingItem, TrackingResponse
 from app.db.dynamodb import DatabaseException
-from app.integrations.weather import WeatherException
+from app.integrations.weather import CachedWeatherProvider, WeatherException
 from app.main import app
-from app.api.tracking import get_database, get_weather
+from app.api.tracking import get_database, get_weather, get_locations
 
 client = TestClient(app)
 
@@ -37,6 +43,9 @@ def mock_database():
             }
         ]
     })
+    mock_db.get_tracking_items.side_effect = lambda keys: {
+        key: mock_db.get_tracking_item.return_value for key in keys if key == ("TN12345678", "DHL")
+    }
     return mock_db
 
 
@@ -51,14 +60,26 @@ def mock_weather_service():
         "cloud": 0,
         "description": "Clear sky"
     })
+    mock_weather.get_weather_by_location.return_value = mock_weather.get_weather.return_value
+    mock_weather.get_cached_weather.return_value = {}
+    mock_weather.parse_address.return_value = ("75001", "FR")
     return mock_weather
 
 
+@pytest.fixture
+def mock_locations():
+    """Mock the receiver locations index."""
+    mock_index = MagicMock()
+    mock_index.get_location.return_value = ("75001", "FR")
+    return mock_index
+
+
 @pytest.fixture(autouse=True)
 def override_dependencies(mock_database, mock_weather_service):
     """Override FastAPI dependencies with mock implementations."""
     app.dependency_overrides[get_database] = lambda: mock_database
     app.dependency_overrides[get_weather] = lambda: mock_weather_service
+    app.dependency_overrides[get_locations] = lambda: None
     yield
     app.dependency_overrides = {}  # Reset after tests
 
@@ -75,6 +96,81 @@ def test_track_shipment_success():
     assert json_data["weather"]["temp"] == 10
 
 
+def test_track_shipment_large(mock_database, mock_weather_service):
+    """Response of shipment with many articles is serialized as the response model"""
+    tracking_item = mock_database.get_tracking_item.return_value
+    tracking_item.articles = tracking_item.articles * 250
+
+    response = client.get("/track/DHL/TN12345678")
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == TrackingResponse(
+        tracking=tracking_item, weather=mock_weather_service.get_weather.return_value
+    ).model_dump(mode="json")
+    assert len(response.json()["tracking"]["articles"]) == 500
+
+
+def test_track_shipment_without_articles(mock_database):
+    """Status polling skips articles"""
+    mock_database.get_tracking_item.return_value = mock_database.get_tracking_item.return_value.model_copy(
+        update={"articles": None}
+    )
+
+    response = client.get("/track/DHL/TN12345678?include_articles=false")
+
+    assert response.status_code == 200
+    assert "articles" not in response.json()["tracking"]
+    assert mock_database.get_tracking_item.call_args.kwargs == {"include_articles": False}
+
+
+def test_track_shipment_cache_headers(monkeypatch):
+    """Response carries ETag and Cache-Control derived from settings"""
+    monkeypatch.setattr("app.api.tracking.settings.TRACKING_MAX_AGE", 30)
+    monkeypatch.setattr("app.api.tracking.settings.TRACKING_STALE_WHILE_REVALIDATE", 7200)
+
+    response = client.get("/track/DHL/TN12345678")
+
+    assert response.headers["cache-control"] == "public, max-age=30, stale-while-revalidate=7200"
+    assert response.headers["etag"] == client.get("/track/DHL/TN12345678").headers["etag"]
+    assert response.headers["etag"] != client.get("/track/DHL/TN12345678?include_articles=false").headers["etag"]
+
+
+def test_track_shipment_not_modified(mock_database):
+    """Matching If-None-Match is answered with 304 without body"""
+    etag = client.get("/track/DHL/TN12345678").headers["etag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get("/track/DHL/TN12345678", headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert "max-age" in response.headers["cache-control"]
+
+    assert client.get("/track/DHL/TN12345678", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_track_shipment_etag_changes(mock_database, mock_weather_service):
+    """ETag follows stored item version and weather"""
+    tracking_item = mock_database.get_tracking_item.return_value
+    tracking_item.content_hash = "v1"
+    etag = client.get("/track/DHL/TN12345678").headers["etag"]
+
+    # items are versioned by content hash only, the rest of the item is not hashed again
+    tracking_item.status = "delivered"
+    assert client.get("/track/DHL/TN12345678").headers["etag"] == etag
+
+    tracking_item.content_hash = "v2"
+    assert client.get("/track/DHL/TN12345678").headers["etag"] != etag
+    etag = client.get("/track/DHL/TN12345678").headers["etag"]
+
+    mock_weather_service.get_weather.return_value = mock_weather_service.get_weather.return_value.model_copy(
+        update={"temp": 11}
+    )
+    response = client.get("/track/DHL/TN12345678", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
 def test_track_shipment_not_found(mock_database):
     """Test tracking number not found"""
     mock_database.get_tracking_item.return_value = None  # Simulate item not found
@@ -103,3 +199,225 @@ def test_weather_exception(mock_weather_service):
 
     assert response.status_code == 500
     assert "Weather exception" in response.json()["detail"]
+
+
+async def test_concurrent_requests_overlap(mock_database):
+    """Blocking database calls run off the event loop, so concurrent requests overlap"""
+    tracking_item = mock_database.get_tracking_item.return_value
+
+    def slow_lookup(tracking_number, carrier, include_articles=True):
+        time.sleep(0.2)
+        return tracking_item
+
+    mock_database.get_tracking_item.side_effect = slow_lookup
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[async_client.get("/track/DHL/TN12345678") for _ in range(5)])
+        elapsed = time.perf_counter() - started
+
+    assert all(response.status_code == 200 for response in responses)
+    assert elapsed < 0.6
+
+
+def test_weather_prefetch(mock_database, mock_weather_service, mock_locations):
+    """Weather is fetched by indexed location, receiver address is not parsed"""
+    app.dependency_overrides[get_locations] = lambda: mock_locations
+
+    response = client.get("/track/DHL/TN12345678")
+
+    assert response.status_code == 200
+    assert response.json()["weather"]["city"] == "Paris"
+    mock_locations.get_location.assert_called_once_with("TN12345678", "DHL")
+    mock_weather_service.get_weather_by_location.assert_called_once_with("75001", "FR")
+    mock_weather_service.get_weather.assert_not_called()
+
+
+def test_weather_prefetch_outdated_location(mock_database, mock_weather_service, mock_locations):
+    """Weather prefetched for indexed location is dropped when the shipment address moved elsewhere"""
+    app.dependency_overrides[get_locations] = lambda: mock_locations
+    mock_locations.get_location.return_value = ("10115", "DE")
+
+    response = client.get("/track/DHL/TN12345678")
+
+    assert response.status_code == 200
+    mock_weather_service.get_weather_by_location.assert_called_once_with("10115", "DE")
+    mock_weather_service.get_weather.assert_called_once_with("Street 10, 75001 Paris, France")
+
+
+def test_weather_prefetch_failure(mock_database, mock_weather_service, mock_locations):
+    """Failed prefetch does not fail the request, weather is looked up by receiver address"""
+    app.dependency_overrides[get_locations] = lambda: mock_locations
+    mock_weather_service.get_weather_by_location.side_effect = WeatherException("Weather API error")
+
+    response = client.get("/track/DHL/TN12345678")
+
+    assert response.status_code == 200
+    mock_weather_service.get_weather.assert_called_once_with("Street 10, 75001 Paris, France")
+
+
+def test_weather_prefetch_not_indexed(mock_weather_service, mock_locations):
+    """Shipment missing in locations index falls back to weather lookup by receiver address"""
+    app.dependency_overrides[get_locations] = lambda: mock_locations
+    mock_locations.get_location.return_value = None
+
+    response = client.get("/track/DHL/TN12345678")
+
+    assert response.status_code == 200
+    mock_weather_service.get_weather.assert_called_once_with("Street 10, 75001 Paris, France")
+
+
+def test_weather_prefetch_not_found(mock_database, mock_locations):
+    """Prefetched weather is discarded when shipment does not exist"""
+    app.dependency_overrides[get_locations] = lambda: mock_locations
+    mock_database.get_tracking_item.return_value = None
+
+    response = client.get("/track/UPS/999999999")
+
+    assert response.status_code == 404
+
+
+def test_weather_prefetch_overlaps_database(mock_database, mock_weather_service, mock_locations):
+    """With indexed location request latency follows the slower lookup, not the sum of both"""
+    app.dependency_overrides[get_locations] = lambda: mock_locations
+    tracking_item = mock_database.get_tracking_item.return_value
+    weather_item = mock_weather_service.get_weather_by_location.return_value
+
+    def slow_database(tracking_number, carrier, include_articles=True):
+        time.sleep(0.2)
+        return tracking_item
+
+    def slow_weather(zip_code, country_code):
+        time.sleep(0.2)
+        return weather_item
+
+    mock_database.get_tracking_item.side_effect = slow_database
+    mock_weather_service.get_weather_by_location.side_effect = slow_weather
+
+    started = time.perf_counter()
+    response = client.get("/track/DHL/TN12345678")
+
+    assert response.status_code == 200
+    assert time.perf_counter() - started < 0.35
+
+
+def test_track_batch(mock_weather_service):
+    """Batch results are streamed per shipment, weather is fetched once per location"""
+    response = client.post("/track/batch", json={"items": [
+        {"tracking_number": "TN12345678", "carrier": "DHL"},
+        {"tracking_number": "999999999", "carrier": "UPS"},
+    ]})
+
+    assert response.status_code == 200
+    results = {result["tracking_number"]: result for result in map(json.loads, response.text.splitlines())}
+    assert results["TN12345678"]["status_code"] == 200
+    assert results["TN12345678"]["weather"]["city"] == "Paris"
+    assert results["999999999"]["status_code"] == 404
+    mock_weather_service.get_weather_by_location.assert_called_once_with("75001", "FR")
+
+
+def test_track_batch_cached_weather(mock_weather_service):
+    """Cached weather is served without calling weather provider per location"""
+    weather_item = mock_weather_service.get_weather.return_value
+    mock_weather_service.get_cached_weather.return_value = {("75001", "FR"): weather_item}
+
+    response = client.post("/track/batch", json={"items": [{"tracking_number": "TN12345678", "carrier": "DHL"}]})
+
+    assert json.loads(response.text)["status_code"] == 200
+    mock_weather_service.get_weather_by_location.assert_not_called()
+
+
+def test_track_batch_weather_exception(mock_weather_service):
+    """Weather failure is reported per shipment, not for the whole batch"""
+    mock_weather_service.get_weather_by_location.side_effect = WeatherException("Weather API error")
+
+    response = client.post("/track/batch", json={"items": [{"tracking_number": "TN12345678", "carrier": "DHL"}]})
+
+    result = json.loads(response.text)
+    assert result["status_code"] == 500
+    assert "Weather exception" in result["detail"]
+
+
+def test_track_batch_redis_failure(monkeypatch, mock_weather_service):
+    """Failing Redis MGET turns cached weather lookup into misses, weather is fetched per location"""
+    failing_redis = MagicMock()
+    failing_redis.mget.side_effect = redis.ConnectionError("Connection refused")
+    monkeypatch.setattr("app.integrations.cache.redis_client", failing_redis)
+    monkeypatch.setattr("app.integrations.cache.is_running_in_tests", lambda: False)
+    mock_weather_service.get_cached_weather.side_effect = \
+        lambda locations: CachedWeatherProvider.get_cached_weather(mock_weather_service, locations)
+
+    response = client.post("/track/batch", json={"items": [{"tracking_number": "TN12345678", "carrier": "DHL"}]})
+
+    assert json.loads(response.text)["status_code"] == 200
+    failing_redis.mget.assert_called_once()
+    mock_weather_service.get_weather_by_location.assert_called_once_with("75001", "FR")
+
+
+def test_track_batch_unexpected_error(mock_weather_service):
+    """Unexpected error after the stream started is reported for every shipment without result"""
+    mock_weather_service.get_cached_weather.side_effect = RuntimeError("unexpected")
+
+    response = client.post("/track/batch", json={"items": [
+        {"tracking_number": "TN12345678", "carrier": "DHL"},
+        {"tracking_number": "999999999", "carrier": "UPS"},
+    ]})
+
+    assert response.status_code == 200
+    results = {result["tracking_number"]: result for result in map(json.loads, response.text.splitlines())}
+    assert results["999999999"]["status_code"] == 404
+    assert results["TN12345678"]["status_code"] == 500
+    assert results["TN12345678"]["detail"] == "Internal error"
+
+
+def test_track_batch_database_exception(mock_database):
+    """Database failure fails the whole batch"""
+    mock_database.get_tracking_items.side_effect = DatabaseException("Database error")
+
+    response = client.post("/track/batch", json={"items": [{"tracking_number": "TN12345678", "carrier": "DHL"}]})
+
+    assert response.status_code == 500
+
+
+def test_track_batch_too_large():
+    """Batch size is limited"""
+    items = [{"tracking_number": f"TN{i}", "carrier": "DHL"} for i in range(1000)]
+
+    response = client.post("/track/batch", json={"items": items})
+
+    assert response.status_code == 422
+
+
+def test_startup_warm_up(monkeypatch):
+    """Providers are created once on startup, later lifespan cycles (lambda invocations) reuse them"""
+    from app.api import tracking
+    from app.conf import warmup
+    from app.integrations import countries
+
+    created = []
+    monkeypatch.setattr(warmup, "_warmed_up", False)
+    monkeypatch.setattr(tracking, "get_database", lambda: created.append("database"))
+    monkeypatch.setattr(tracking, "get_weather", lambda: created.append("weather"))
+    monkeypatch.setattr(countries, "country_index", lambda: created.append("countries"))
+
+    for _ in range(2):
+        with TestClient(app):
+            pass
+
+    assert created == ["database", "weather", "countries"]
+
+
+def test_startup_warm_up_failure(monkeypatch):
+    """Provider failure does not prevent startup"""
+    from app.api import tracking
+    from app.conf import warmup
+
+    def failing():
+        raise DatabaseException("Database error")
+
+    monkeypatch.setattr(warmup, "_warmed_up", False)
+    monkeypatch.setattr(tracking, "get_database", failing)
+
+    with TestClient(app) as startup_client:
+        assert startup_client.get("/track/DHL/TN12345678").status_code == 200
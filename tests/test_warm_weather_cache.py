@@ -0,0 +1,117 @@
+import time
+
+import pytest
+import redis
+import requests_mock
+from unittest.mock import MagicMock
+
+from app import warm_weather_cache
+from app.conf.settings import settings
+from app.integrations import cache
+from app.integrations.http import RateLimiter
+from app.integrations.weather import WeatherUnavailableException, weatherbit_breaker
+from app.warm_weather_cache import WeatherWarmer, collect_locations, expiring_locations
+
+WEATHERBIT_RESPONSE = {"data": [{"city_name": "Paris", "clouds": 50, "temp": 8.7, "wind_cdir_full": "south",
+                                 "weather": {"description": "Light rain"}}]}
+
+
+@pytest.fixture
+def mock_redis(monkeypatch):
+    mock_client = MagicMock()
+    monkeypatch.setattr(warm_weather_cache, "redis_client", mock_client)
+    monkeypatch.setattr(cache, "redis_client", mock_client)
+    yield mock_client
+    cache.weather_local_cache.clear()
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Shipments to paris (twice), berlin, delivered to london and with broken address."""
+    mock_database = MagicMock()
+    mock_database.scan_items.return_value = [
+        {"receiver_address": "Street 10, 75001 Paris, France", "status": "in-transit"},
+        {"receiver_address": "Street 11, 75001 Paris, France", "status": "scanned"},
+        {"receiver_address": "Street 1, 10115 Berlin, Germany", "status": "in-transit"},
+        {"receiver_address": "Street 2, SW1A London, United Kingdom", "status": "delivered"},
+        {"receiver_address": "Unknown", "status": "in-transit"},
+    ]
+    monkeypatch.setattr(warm_weather_cache, "DatabaseDynamoDb", lambda: mock_database)
+    return mock_database
+
+
+def test_collect_locations(database):
+    """Receiver locations of active shipments are deduplicated."""
+    assert collect_locations(database) == {("75001", "FR"), ("10115", "DE")}
+    assert "#status" in database.scan_items.call_args.kwargs["projection"]
+
+
+def test_expiring_locations(mock_redis, monkeypatch):
+    """Missing and soon expiring locations are selected, soonest first."""
+    monkeypatch.setattr(settings, "WEATHER_CACHE_SOFT_TTL", 7200)
+    monkeypatch.setattr(settings, "WEATHER_CACHE_HARD_TTL", 7200)
+    ttls = {"A": 7000_000, "B": 300_000, "C": -2, "D": -1}
+    locations = {(zip_code, "FR") for zip_code in ttls}
+    mock_redis.pipeline.return_value.execute.side_effect = lambda: [ttls[zip_code] for zip_code, _ in
+                                                                    sorted(locations)]
+
+    assert expiring_locations(locations, margin=600) == [("C", "FR"), ("B", "FR")]
+
+
+def test_expiring_locations_share_region(mock_redis, monkeypatch):
+    """Locations with one region cache key are checked and refreshed once."""
+    monkeypatch.setattr(settings, "WEATHER_REGION_RULES", "FR:2")
+    mock_redis.pipeline.return_value.execute.return_value = [-2]
+
+    assert expiring_locations({("75001", "FR"), ("75015", "FR")}, margin=600) == [("75001", "FR")]
+    mock_redis.pipeline.return_value.pttl.assert_called_once_with(cache.weather_cache_key("75001", "FR"))
+
+
+def test_warm_weather_cache(mock_redis, database):
+    """Expiring locations are refreshed within call limit, cache holds unified weather."""
+    mock_redis.pipeline.return_value.execute.return_value = [-2, -2]
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.WEATHERBIT_API_URL, json=WEATHERBIT_RESPONSE, status_code=200)
+        stats = warm_weather_cache.warm_weather_cache(max_calls=1, workers=2, rate=0)
+
+    assert stats == {"locations": 2, "expiring": 2, "refreshed": 1, "failed": 0, "skipped": 1}
+    assert mocker.call_count == 1
+    cache_key, ttl, value = mock_redis.setex.call_args.args
+    assert cache.decode_weather(value).city == "Paris"
+
+
+def test_warmer_stops_when_api_unavailable(mock_redis):
+    """Open circuit breaker skips the remaining locations."""
+    provider = MagicMock()
+    provider.call_weatherbit_api.side_effect = WeatherUnavailableException("Weather API is unavailable")
+    warmer = WeatherWarmer(provider, workers=1, rate=0)
+
+    stats = warmer.warm([("75001", "FR"), ("10115", "DE"), ("1010", "AT")])
+
+    assert stats == {"refreshed": 0, "failed": 0, "skipped": 3}
+    assert provider.call_weatherbit_api.call_count == 1
+    mock_redis.setex.assert_not_called()
+    weatherbit_breaker.reset()
+
+
+def test_warmer_counts_redis_errors_as_failed(mock_redis):
+    """Weather that can not be stored fails the location, the run is finished."""
+    mock_redis.setex.side_effect = redis.ConnectionError("Connection refused")
+    provider = MagicMock()
+    provider.call_weatherbit_api.return_value = WEATHERBIT_RESPONSE
+    warmer = WeatherWarmer(provider, workers=2, rate=0)
+
+    stats = warmer.warm([("75001", "FR"), ("10115", "DE")])
+
+    assert stats == {"refreshed": 0, "failed": 2, "skipped": 0}
+
+
+def test_rate_limiter():
+    """Calls are spaced by the rate interval."""
+    limiter = RateLimiter(rate=50)
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+
+    assert time.monotonic() - started >= 0.09
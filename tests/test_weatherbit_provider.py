@@ -1,11 +1,21 @@
 import pytest
+import requests
 import requests_mock
-from app.integrations.weather import WeatherbitWeatherProvider
-from app.integrations.weather import WeatherException
+from app.integrations.weather import WeatherbitWeatherProvider, weatherbit_breaker
+from app.integrations.weather import WeatherException, WeatherUnavailableException
 from app.api.models import WeatherItem
 from app.conf.settings import settings
 
 
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    """Retry without delays and start every test with closed circuit breaker."""
+    monkeypatch.setattr(settings, "WEATHERBIT_RETRY_BACKOFF", 0)
+    weatherbit_breaker.reset()
+    yield
+    weatherbit_breaker.reset()
+
+
 @pytest.fixture
 def weather_provider():
     """Fixture to create a WeatherbitWeatherProvider instance."""
@@ -29,6 +39,26 @@ def test_parse_address_invalid_format(weather_provider):
     assert "Invalid address format" in str(excinfo.value)
 
 
+@pytest.mark.parametrize("receiver_address, expected", [
+    ("Street 1, 10115 Berlin, Germany", ("10115", "DE")),
+    ("Street 1, 10115 Berlin, germany", ("10115", "DE")),
+    ("Main St 5, 10001 New York, USA", ("10001", "US")),
+    ("Baker St 221, NW1 London, United Kingdom", ("NW1", "GB")),
+    ("Street 2, 34000 Istanbul, Turkey", ("34000", "TR")),
+])
+def test_parse_address_country_names(weather_provider, receiver_address, expected):
+    """Country names, aliases and different cases are resolved to alpha-2 codes."""
+    assert weather_provider.parse_address(receiver_address) == expected
+
+
+def test_parse_address_unknown_country(weather_provider):
+    """Unknown country raises WeatherException."""
+    with pytest.raises(WeatherException) as excinfo:
+        weather_provider.parse_address("Street 1, 10115 Berlin, Atlantis")
+
+    assert "Country not found" in str(excinfo.value)
+
+
 def test_get_weather_success(weather_provider):
     """Integration test: Ensure Weatherbit API is called correctly & returns expected weather data."""
     receiver_address = "Street 10, 75001 Paris, France"
@@ -86,3 +116,105 @@ def test_get_weather_api_failure(weather_provider):
             weather_provider.get_weather(receiver_address)
 
         assert "Failed to fetch weather data" in str(excinfo.value)
+
+
+def test_get_weather_retries_throttling(weather_provider):
+    """429 and 5xx responses are retried."""
+    receiver_address = "Street 10, 75001 Paris, France"
+    mock_response = {"data": [{"city_name": "Paris", "clouds": 50, "temp": 8.7, "wind_cdir_full": "south",
+                               "weather": {"description": "Light rain"}}]}
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.WEATHERBIT_API_URL, [
+            {"status_code": 429},
+            {"status_code": 503},
+            {"json": mock_response, "status_code": 200},
+        ])
+
+        weather = weather_provider.get_weather(receiver_address)
+
+        assert weather.city == "Paris"
+        assert mocker.call_count == 3
+
+
+def test_get_weather_timeout(weather_provider):
+    """Timeouts are reported as failed fetch, every request is sent with timeout."""
+    receiver_address = "Street 10, 75001 Paris, France"
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.WEATHERBIT_API_URL, exc=requests.ConnectTimeout)
+
+        with pytest.raises(WeatherException) as excinfo:
+            weather_provider.get_weather(receiver_address)
+
+        assert "Failed to fetch weather data" in str(excinfo.value)
+        assert all(request.timeout is not None for request in mocker.request_history)
+
+
+def test_get_weather_circuit_breaker(weather_provider, monkeypatch):
+    """After repeated failures calls are rejected without requests to the API."""
+    monkeypatch.setattr(weatherbit_breaker, "failure_threshold", 2)
+    receiver_address = "Street 10, 75001 Paris, France"
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.WEATHERBIT_API_URL, status_code=500)
+        for _ in range(2):
+            with pytest.raises(WeatherException):
+                weather_provider.get_weather(receiver_address)
+        calls = mocker.call_count
+
+        with pytest.raises(WeatherUnavailableException):
+            weather_provider.get_weather(receiver_address)
+
+        assert mocker.call_count == calls
+        assert weatherbit_breaker.state == "open"
+
+
+def test_get_weather_half_open_trial_released(weather_provider, monkeypatch):
+    """Unexpected request error of the half-open trial opens the breaker again instead of blocking it forever."""
+    monkeypatch.setattr(weatherbit_breaker, "failure_threshold", 1)
+    monkeypatch.setattr(settings, "WEATHERBIT_RETRIES", 0)
+    receiver_address = "Street 10, 75001 Paris, France"
+    mock_response = {"data": [{"city_name": "Paris", "clouds": 50, "temp": 8.7, "wind_cdir_full": "south",
+                               "weather": {"description": "Light rain"}}], "count": 1}
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.WEATHERBIT_API_URL, status_code=500)
+        with pytest.raises(WeatherException):
+            weather_provider.get_weather(receiver_address)
+        monkeypatch.setattr(weatherbit_breaker, "reset_timeout", 0)
+        assert weatherbit_breaker.state == "half-open"
+
+        mocker.get(settings.WEATHERBIT_API_URL, exc=requests.exceptions.ChunkedEncodingError)
+        with pytest.raises(WeatherException):
+            weather_provider.get_weather(receiver_address)
+
+        mocker.get(settings.WEATHERBIT_API_URL, json=mock_response, status_code=200)
+        assert weather_provider.get_weather(receiver_address).city == "Paris"
+        assert weatherbit_breaker.state == "closed"
+
+
+def test_get_weather_cached_item(weather_provider, monkeypatch):
+    """Cache keeps unified WeatherItem only, cached location is served without API call."""
+    from unittest.mock import MagicMock
+    from app.integrations import cache
+
+    mock_redis = MagicMock()
+    mock_redis.pipeline.return_value.execute.return_value = [None, -2]
+    monkeypatch.setattr(cache, "redis_client", mock_redis)
+    monkeypatch.setattr(cache, "is_running_in_tests", lambda: False)
+    cache.weather_local_cache.clear()
+    mock_response = {"data": [{"city_name": "Paris", "clouds": 50, "temp": 8.7, "wind_cdir_full": "south",
+                               "weather": {"description": "Light rain", "icon": "r01d", "code": 500},
+                               "aqi": 30, "pres": 1012.5, "rh": 81, "sunrise": "06:12"}], "count": 1}
+
+    with requests_mock.Mocker() as mocker:
+        mocker.get(settings.WEATHERBIT_API_URL, json=mock_response, status_code=200)
+        weather = weather_provider.get_weather_by_location("75001", "FR")
+        assert weather_provider.get_weather_by_location("75001", "FR") == weather
+        assert mocker.call_count == 1
+
+    cache_key, ttl, value = mock_redis.setex.call_args.args
+    assert cache.decode_weather(value) == weather
+    assert b"sunrise" not in value
+    cache.weather_local_cache.clear()